@@ -0,0 +1,281 @@
+import bisect
+import shutil
+import logging
+import tempfile
+import subprocess
+from collections import deque
+from typing import Iterator, NamedTuple
+
+import numpy as np
+import soundfile as sf
+import soxr
+import librosa
+
+# Sample rate the ASR model expects for in-memory audio.
+MODEL_SAMPLE_RATE = 16000
+
+# How much source audio is decoded per read when streaming.
+BLOCK_DURATION_S = 10
+
+# Frame length used when looking for the quietest point to cut at.
+_SILENCE_FRAME_S = 0.02
+
+# Frame length and speech padding used by the energy-based voice activity filter.
+_VAD_FRAME_S = 0.03
+_VAD_PADDING_S = 0.3
+
+
+class AudioChunk(NamedTuple):
+    """
+    A window of model-rate audio and where it starts, in seconds.
+
+    When silence is skipped, times are on the condensed timeline; use
+    `to_source_time` with the offset map to convert them back.
+    """
+    index: int
+    start_s: float
+    samples: np.ndarray
+
+    @property
+    def end_s(self) -> float:
+        return self.start_s + len(self.samples) / MODEL_SAMPLE_RATE
+
+
+def _iter_ffmpeg_blocks(audio_filepath: str, target_sr: int, block_duration_s: int) -> Iterator[np.ndarray]:
+    """
+    Streams the first audio track of any file ffmpeg can read (mp4, mkv, webm, m4a, ...)
+    as mono float32 blocks at `target_sr`. Raises RuntimeError if ffmpeg fails.
+    """
+    command = [shutil.which('ffmpeg'), '-nostdin', '-v', 'error', '-i', audio_filepath, '-map', '0:a:0',
+               '-ac', '1', '-ar', str(target_sr), '-f', 'f32le', '-']
+    # Errors go to a file rather than a pipe, so a chatty ffmpeg cannot block on a full pipe
+    with tempfile.TemporaryFile() as stderr:
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=stderr)
+        try:
+            block_bytes = block_duration_s * target_sr * 4
+            while True:
+                data = process.stdout.read(block_bytes)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+            process.wait()
+        finally:
+            if process.poll() is None:
+                # The consumer stopped early
+                process.kill()
+                process.wait()
+            process.stdout.close()
+        if process.returncode != 0:
+            stderr.seek(0)
+            message = stderr.read().decode('utf-8', errors='replace').strip()
+            raise RuntimeError(f"ffmpeg could not decode '{audio_filepath}': {message or process.returncode}")
+
+
+def _iter_mono_blocks(audio_filepath: str, target_sr: int = None, block_duration_s: int = BLOCK_DURATION_S) -> Iterator[np.ndarray]:
+    """
+    Streams an audio file as mono float32 blocks, optionally resampled to `target_sr`.
+
+    Only one block of source audio (plus the resampler state) is held in memory
+    at a time. Formats libsndfile cannot read, such as video containers and
+    m4a, are streamed through ffmpeg instead; only if ffmpeg is not installed
+    (or no `target_sr` is given) do they fall back to a full librosa decode.
+    """
+    try:
+        f = sf.SoundFile(audio_filepath)
+    except (sf.LibsndfileError, RuntimeError) as e:
+        if target_sr and shutil.which('ffmpeg'):
+            yield from _iter_ffmpeg_blocks(audio_filepath, target_sr, block_duration_s)
+            return
+        logging.warning(f"Cannot stream '{audio_filepath}' ({e}) and ffmpeg is not available; "
+                        f"decoding it fully instead.")
+        audio, _ = librosa.load(audio_filepath, sr=target_sr, mono=True)
+        yield audio
+        return
+
+    with f:
+        resampler = None
+        if target_sr and f.samplerate != target_sr:
+            resampler = soxr.ResampleStream(f.samplerate, target_sr, 1, dtype='float32')
+        for block in f.blocks(blocksize=block_duration_s * f.samplerate, dtype='float32', always_2d=True):
+            mono = block.mean(axis=1, dtype=np.float32)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono)
+            if len(mono):
+                yield mono
+        if resampler is not None:
+            tail = resampler.resample_chunk(np.empty(0, dtype=np.float32), last=True)
+            if len(tail):
+                yield tail
+
+
+def _filter_silence(blocks: Iterator[np.ndarray], threshold_db: float, min_silence_s: float,
+                    vad_info: dict) -> Iterator[np.ndarray]:
+    """
+    Drops non-speech stretches from a stream of model-rate blocks.
+
+    A frame counts as speech when its energy is above `threshold_db` dBFS.
+    Quiet runs shorter than `min_silence_s` are kept as they are (natural
+    pauses); longer runs are cut down to a short pad on either side. Memory use
+    is bounded by `min_silence_s` of held audio regardless of how long a quiet
+    stretch lasts.
+
+    `vad_info` receives 'offset_map', a list of (condensed_s, source_s) points
+    where the condensed timeline jumps, plus 'skipped_s' and 'total_s'.
+    """
+    frame = int(_VAD_FRAME_S * MODEL_SAMPLE_RATE)
+    pad_frames = int(_VAD_PADDING_S / _VAD_FRAME_S)
+    min_frames = max(int(min_silence_s / _VAD_FRAME_S), 2 * pad_frames + 1)
+    offset_map = vad_info.setdefault('offset_map', [(0.0, 0.0)])
+
+    carry = np.empty(0, dtype=np.float32)
+    out_pos = 0  # Samples emitted so far
+    src_pos = 0  # Samples consumed so far
+    skipped = 0
+    held = []  # Quiet frames of the current run, while it is still short
+    head, tail = [], deque(maxlen=pad_frames)  # Kept pads once the run is long
+    run = 0
+    run_start = 0
+
+    def close_run(out: list) -> None:
+        nonlocal out_pos, skipped, held, head, run
+        if run <= min_frames:
+            out.extend(held)
+            out_pos += len(held) * frame
+        else:
+            out.extend(head)
+            out_pos += len(head) * frame
+            resume = run_start + (run - len(tail)) * frame
+            skipped += resume - (run_start + len(head) * frame)
+            offset_map.append((out_pos / MODEL_SAMPLE_RATE, resume / MODEL_SAMPLE_RATE))
+            out.extend(tail)
+            out_pos += len(tail) * frame
+        held, head = [], []
+        tail.clear()
+        run = 0
+
+    for block in blocks:
+        data = np.concatenate((carry, block))
+        n_frames = len(data) // frame
+        carry = data[n_frames * frame:]
+        frames = data[:n_frames * frame].reshape(n_frames, frame)
+        loud = 10 * np.log10(np.square(frames).mean(axis=1) + 1e-12) > threshold_db
+        out = []
+        for samples, is_speech in zip(frames, loud):
+            if is_speech:
+                if run:
+                    close_run(out)
+                out.append(samples)
+                out_pos += frame
+            else:
+                if not run:
+                    run_start = src_pos
+                run += 1
+                if run <= min_frames:
+                    held.append(samples)
+                else:
+                    if held:
+                        head = held[:pad_frames]
+                        tail.extend(held[len(held) - pad_frames:] if pad_frames else [])
+                        held = []
+                    tail.append(samples)
+            src_pos += frame
+        if out:
+            yield np.concatenate(out)
+
+    # Trailing silence keeps only its leading pad.
+    out = []
+    if run:
+        if run > min_frames:
+            tail.clear()
+        close_run(out)
+    out.append(carry)
+    src_pos += len(carry)
+    out_pos += len(carry)
+    if any(len(samples) for samples in out):
+        yield np.concatenate(out)
+    vad_info['skipped_s'] = skipped / MODEL_SAMPLE_RATE
+    vad_info['total_s'] = src_pos / MODEL_SAMPLE_RATE
+
+
+def to_source_time(offset_map: list, condensed_s: float) -> float:
+    """Maps a time on the silence-skipped timeline back to the original recording."""
+    index = bisect.bisect_right(offset_map, condensed_s, key=lambda point: point[0]) - 1
+    condensed_start, source_start = offset_map[max(index, 0)]
+    return source_start + (condensed_s - condensed_start)
+
+
+def _find_quiet_cut(samples: np.ndarray, nominal_end: int, search_samples: int) -> int:
+    """
+    Returns the sample index of the quietest frame in the `search_samples` before `nominal_end`.
+    """
+    frame = max(1, int(_SILENCE_FRAME_S * MODEL_SAMPLE_RATE))
+    search_start = max(0, nominal_end - search_samples)
+    window = samples[search_start:nominal_end]
+    n_frames = len(window) // frame
+    if n_frames < 2:
+        return nominal_end
+    energy = np.square(window[:n_frames * frame].reshape(n_frames, frame)).mean(axis=1)
+    return search_start + int(np.argmin(energy)) * frame + frame // 2
+
+
+def iter_audio_chunks(audio_filepath: str, chunk_duration_s: float = 30, overlap_s: float = 0,
+                      cut_at_silence: bool = False, silence_search_s: float = 5,
+                      vad_threshold_db: float = None, vad_min_silence_s: float = 1.0,
+                      vad_info: dict = None) -> Iterator[AudioChunk]:
+    """
+    Lazily splits an audio file into chunks for the ASR model.
+
+    The file is decoded block by block and resampled to mono 16 kHz on the fly,
+    so peak memory stays at roughly one chunk plus one block regardless of the
+    length of the recording.
+
+    Args:
+        audio_filepath: Path to the audio file.
+        chunk_duration_s: The maximum duration of each chunk in seconds.
+        overlap_s: How many seconds each chunk repeats from the end of the previous one.
+        cut_at_silence: If True, each chunk ends at the quietest point within the
+            last `silence_search_s` seconds instead of exactly at `chunk_duration_s`.
+        silence_search_s: Length of the window searched for a quiet cut point.
+        vad_threshold_db: If set, stretches of at least `vad_min_silence_s` below
+            this level (dBFS) are dropped before chunking (see `_filter_silence`).
+        vad_min_silence_s: Shortest quiet stretch that is dropped.
+        vad_info: Receives the offset map and skipped duration when filtering.
+
+    Yields:
+        AudioChunk tuples in order; the last one may be shorter.
+    """
+    chunk_samples = int(chunk_duration_s * MODEL_SAMPLE_RATE)
+    overlap_samples = int(overlap_s * MODEL_SAMPLE_RATE)
+    search_samples = int(silence_search_s * MODEL_SAMPLE_RATE) if cut_at_silence else 0
+    if overlap_samples + search_samples >= chunk_samples:
+        raise ValueError("Chunk overlap plus silence search window must be shorter than the chunk duration.")
+
+    buffer = np.empty(0, dtype=np.float32)
+    buffer_start = 0  # Absolute sample position of buffer[0]
+    covered_until = 0  # Absolute end of the last chunk yielded
+    index = 0
+    blocks = _iter_mono_blocks(audio_filepath, MODEL_SAMPLE_RATE)
+    if vad_threshold_db is not None:
+        blocks = _filter_silence(blocks, vad_threshold_db, vad_min_silence_s, vad_info if vad_info is not None else {})
+    for block in blocks:
+        buffer = np.concatenate((buffer, block))
+        while len(buffer) >= chunk_samples:
+            end = _find_quiet_cut(buffer, chunk_samples, search_samples) if search_samples else chunk_samples
+            yield AudioChunk(index, buffer_start / MODEL_SAMPLE_RATE, buffer[:end])
+            index += 1
+            covered_until = buffer_start + end
+            next_start = end - overlap_samples
+            buffer = buffer[next_start:]
+            buffer_start += next_start
+    # Only emit the tail if it contains audio not already covered by the previous chunk.
+    if buffer_start + len(buffer) > covered_until or index == 0 and len(buffer):
+        yield AudioChunk(index, buffer_start / MODEL_SAMPLE_RATE, buffer)
+
+
+def convert_for_model(input_filepath: str, output_filepath: str) -> None:
+    """
+    Converts any readable audio file to the ASR input format (16 kHz mono PCM16 WAV) in one streaming pass.
+    """
+    with sf.SoundFile(output_filepath, 'w', samplerate=MODEL_SAMPLE_RATE, channels=1, subtype='PCM_16') as out:
+        for block in _iter_mono_blocks(input_filepath, MODEL_SAMPLE_RATE):
+            out.write(block)
@@ -0,0 +1,329 @@
+"""
+Batch mode: summarizes many videos with the pipeline stages overlapped.
+
+Usage:
+    python batch.py SOURCE [SOURCE ...] [--download-workers N] [--transcribe-workers N]
+                    [--summarize-workers N] [--queue-size N] [--no-hashtag]
+
+Each SOURCE is a video or playlist URL, a text file with one URL or media
+path per line ('#' starts a comment), or a directory of local media files.
+
+Download, transcription and summarization run on worker threads of their own,
+connected by bounded queues: while one video is transcribed the next is
+downloaded and the previous one summarized. The queues keep a fast stage from
+running far ahead of a slow one (and filling the disk with downloaded audio).
+The run ends with a throughput report.
+"""
+import os
+import sys
+import time
+import queue
+import shutil
+import logging
+import argparse
+import threading
+import configparser
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cache
+import download
+import summarize
+import summyt
+
+STAGES = ('download', 'transcribe', 'summarize')
+
+# Extensions picked up from directory sources; anything ffmpeg can decode would work.
+MEDIA_EXTENSIONS = ('.wav', '.mp3', '.m4a', '.flac', '.ogg', '.opus', '.aac', '.webm', '.mp4', '.mkv', '.mov', '.avi')
+
+# Files read as lists of URLs rather than as media.
+URL_LIST_EXTENSIONS = ('.txt', '.list')
+
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    defaults = {'download': 2, 'transcribe': 1, 'summarize': 2}
+    workers = {}
+    for stage, default in defaults.items():
+        try:
+            workers[stage] = max(1, int(config['youtubedl'].get(f'batch-{stage}-workers', str(default)).strip('"')))
+        except ValueError:
+            logging.warning(f"Invalid value for batch-{stage}-workers in configuration. Using default value of {default}.")
+            workers[stage] = default
+    try:
+        queue_size = max(1, int(config['youtubedl'].get('batch-queue-size', '2').strip('"')))
+    except ValueError:
+        logging.warning("Invalid value for batch-queue-size in configuration. Using default value of 2.")
+        queue_size = 2
+    return workers, queue_size
+
+STAGE_WORKERS, QUEUE_SIZE = load_config()
+
+
+def expand_sources(sources: list[str]) -> list[tuple[str, bool]]:
+    """
+    Turns playlist URLs, URL list files and media directories into a flat list of videos.
+
+    Each video is a (url, local) pair, where `local` is True for media file
+    paths and False for web URLs.
+    """
+    items = []
+    for source in sources:
+        if os.path.isdir(source):
+            items.extend((os.path.join(source, name), True) for name in sorted(os.listdir(source))
+                         if name.lower().endswith(MEDIA_EXTENSIONS) and os.path.isfile(os.path.join(source, name)))
+        elif os.path.isfile(source) and source.lower().endswith(URL_LIST_EXTENSIONS):
+            with open(source, 'r', encoding='utf-8') as f:
+                lines = [line.strip() for line in f]
+            items.extend(expand_sources([line for line in lines if line and not line.startswith('#')]))
+        elif os.path.isfile(source):
+            items.append((source, True))
+        else:
+            info_dict = download.get_video_info(source)
+            if info_dict is not None and info_dict.get('_type') == 'playlist':
+                entries = [entry for entry in info_dict.get('entries') or [] if entry]
+                print(f"Playlist '{info_dict.get('title', source)}': {len(entries)} videos.")
+                items.extend((entry.get('webpage_url') or entry.get('url'), False) for entry in entries
+                             if entry.get('webpage_url') or entry.get('url'))
+            else:
+                # Single videos, and URLs whose info could not be fetched (the download stage reports those)
+                items.append((source, False))
+
+    # The same video listed twice would only be processed twice
+    unique, seen = [], set()
+    for item in items:
+        key = download.video_key(*item)
+        if key not in seen:
+            seen.add(key)
+            unique.append(item)
+    return unique
+
+
+class _Item:
+    """A video on its way through the pipeline, with whatever the previous stages produced."""
+
+    def __init__(self, index: int, url: str, local: bool = False):
+        self.index = index
+        self.url = url
+        self.local = local
+        self.video_key = download.video_key(url, local)
+        self.work_dir = None
+        self.video_locked = False  # Holds summyt's single-flight lock for the video from download to transcription
+        self.downloaded = None  # (filepath, video_title, is_transcript_existing)
+        self.transcribed_text = None
+        self.transcript_source = None
+        self.video_title = None
+        self.partials = None  # summarize.IncrementalSummarizer fed during transcription
+
+
+class BatchRunner:
+    """
+    Runs videos through the download, transcription and summarization stages concurrently.
+
+    Each stage has `workers[stage]` threads and is fed by a queue holding at
+    most `queue_size` videos. A video that fails in any stage is reported and
+    dropped; the rest of the batch carries on.
+    """
+
+    def __init__(self, videos: list[tuple[str, bool]], workers: dict = None, queue_size: int = QUEUE_SIZE, enable_hashtag: bool = True,
+                 use_cache: bool = True):
+        self.videos = list(videos)
+        self.workers = {stage: max(1, (workers or {}).get(stage, STAGE_WORKERS[stage])) for stage in STAGES}
+        self.enable_hashtag = enable_hashtag
+        self.use_cache = use_cache
+        self.summary_fingerprints = cache.accepted_fingerprints(cache.STAGE_SUMMARY, download.CAPTIONS_MODE != 'off',
+                                                                enable_hashtag=enable_hashtag)
+        self._queues = {stage: queue.Queue(maxsize=queue_size) for stage in STAGES}
+        self._stats_lock = threading.Lock()
+        self.stats = {stage: {'busy_s': 0.0, 'processed': 0, 'failed': 0} for stage in STAGES}
+        self.cached = 0
+        self.completed = []
+        self.failures = []
+
+    def _log(self, item: _Item, message: str) -> None:
+        print(f"[{item.index + 1}/{len(self.videos)}] {message}")
+
+    def _drain(self, item: _Item, progress):
+        """Prints the progress updates of one stage and returns its result."""
+        while True:
+            try:
+                update = next(progress)
+            except StopIteration as e:
+                return e.value
+            if 'summary_delta' not in update:
+                self._log(item, update['status'])
+
+    def _download(self, item: _Item) -> bool:
+        cached_filepath = cache.get_index().lookup(item.video_key, cache.STAGE_SUMMARY, *self.summary_fingerprints)
+        if cached_filepath is not None:
+            self._log(item, f"Summary already exists at {cached_filepath}.")
+            with self._stats_lock:
+                self.cached += 1
+                self.completed.append(cached_filepath)
+            return False
+        info_dict = download.get_video_info(item.url, item.local)
+        if info_dict is None:
+            raise Exception("Could not get video information.")
+        self._drain(item, summyt.acquire_video_lock(item.video_key))
+        item.video_locked = True
+        download.remove_stale_work_dirs(keep=summyt.locked_work_dirs())
+        # Shared with every other run for this video, so audio and checkpoint left by a failed run are reused
+        item.work_dir = download.work_dir(item.video_key)
+        item.downloaded = self._drain(item, summyt.download_stage(item.url, item.work_dir, info_dict,
+                                                                      item.video_key, item.local))
+        return True
+
+    def _transcribe(self, item: _Item) -> bool:
+        downloaded_filepath, item.video_title, is_transcript_existing = item.downloaded
+        item.partials = summarize.incremental_summarizer(self.use_cache)
+        try:
+            item.transcribed_text = self._drain(item, summyt.transcribe_stage(downloaded_filepath,
+                                                                              item.video_title, is_transcript_existing,
+                                                                              item.video_key, item.partials))
+            item.transcript_source = summyt.transcript_source_of(downloaded_filepath, is_transcript_existing)
+            shutil.rmtree(item.work_dir, ignore_errors=True)
+        finally:
+            self._release_video(item)
+        return True
+
+    @staticmethod
+    def _release_video(item: _Item) -> None:
+        if item.video_locked:
+            item.video_locked = False
+            summyt.release_video_lock(item.video_key)
+
+    def _summarize(self, item: _Item) -> bool:
+        try:
+            self._drain(item, summyt.summarize_and_save(item.url, item.video_key, item.video_title,
+                                                         item.transcribed_text, item.transcript_source,
+                                                         self.enable_hashtag, partials=item.partials,
+                                                         use_cache=self.use_cache))
+        finally:
+            if item.partials is not None:
+                item.partials.close()
+        with self._stats_lock:
+            self.completed.append(item.url)
+        self._log(item, "Completed.")
+        return False
+
+    def _worker(self, stage: str, next_stage: str) -> None:
+        run_stage = getattr(self, f'_{stage}')
+        while True:
+            item = self._queues[stage].get()
+            if item is None:
+                return
+            start = time.perf_counter()
+            try:
+                forward = run_stage(item)
+            except (Exception, SystemExit) as e:
+                # download_youtube exits on failure; that must not take the whole batch down
+                forward = False
+                # The work dir is kept, so running the video again resumes from its audio and checkpoint
+                self._release_video(item)
+                if item.partials is not None:
+                    item.partials.close()
+                error = str(e) if isinstance(e, Exception) else "aborted, see the error above"
+                self._log(item, f"Failed during {stage}: {error}")
+                with self._stats_lock:
+                    self.stats[stage]['failed'] += 1
+                    self.failures.append((item.url, stage, error))
+            finally:
+                with self._stats_lock:
+                    self.stats[stage]['busy_s'] += time.perf_counter() - start
+                    self.stats[stage]['processed'] += 1
+            if forward and next_stage:
+                # Blocks while the next stage is backed up
+                self._queues[next_stage].put(item)
+
+    def run(self) -> dict:
+        """Processes every URL and returns the throughput report (see `format_report`)."""
+        start = time.perf_counter()
+        summyt.index_existing_outputs_once()
+        threads = {}
+        for position, stage in enumerate(STAGES):
+            next_stage = STAGES[position + 1] if position + 1 < len(STAGES) else None
+            threads[stage] = [threading.Thread(target=self._worker, args=(stage, next_stage), daemon=True,
+                                               name=f'batch-{stage}-{i}') for i in range(self.workers[stage])]
+            for thread in threads[stage]:
+                thread.start()
+
+        for index, (url, local) in enumerate(self.videos):
+            self._queues[STAGES[0]].put(_Item(index, url, local))
+        # Shut the stages down in order: a stage's queue is closed once every worker feeding it has stopped
+        for position, stage in enumerate(STAGES):
+            for _ in threads[stage]:
+                self._queues[stage].put(None)
+            for thread in threads[stage]:
+                thread.join()
+
+        wall_s = time.perf_counter() - start
+        return {
+            'videos': len(self.videos),
+            'completed': len(self.completed),
+            'cached': self.cached,
+            'failed': len(self.failures),
+            'failures': list(self.failures),
+            'wall_s': wall_s,
+            'stages': {stage: dict(self.stats[stage], workers=self.workers[stage],
+                                   utilization=self.stats[stage]['busy_s'] / (wall_s * self.workers[stage]) if wall_s else 0.0)
+                       for stage in STAGES},
+        }
+
+
+def format_report(report: dict) -> str:
+    wall_s = report['wall_s']
+    processed = report['completed'] - report['cached']
+    lines = [
+        f"Videos: {report['videos']}   completed: {report['completed']} ({report['cached']} already summarized)"
+        f"   failed: {report['failed']}",
+        f"Wall time: {wall_s:.1f} s" + (f"   throughput: {processed / wall_s * 3600:.1f} videos/hour" if wall_s and processed else ""),
+        "",
+        f"{'stage':<12}{'workers':>8}{'videos':>8}{'failed':>8}{'busy s':>10}{'s/video':>10}{'utilization':>13}",
+    ]
+    for stage, stats in report['stages'].items():
+        per_video = stats['busy_s'] / stats['processed'] if stats['processed'] else 0.0
+        lines.append(f"{stage:<12}{stats['workers']:>8}{stats['processed']:>8}{stats['failed']:>8}"
+                     f"{stats['busy_s']:>10.1f}{per_video:>10.1f}{stats['utilization']:>13.0%}")
+    busiest = max(report['stages'], key=lambda stage: report['stages'][stage]['utilization'])
+    if report['stages'][busiest]['busy_s']:
+        lines.append(f"\nBottleneck: {busiest}. Adding {busiest} workers helps only if the resource behind it "
+                     f"(network, GPU or LLM provider) has capacity to spare.")
+    for url, stage, error in report['failures']:
+        lines.append(f"Failed in {stage}: {url}: {error}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Summarize playlists, URL lists or directories of media files.")
+    parser.add_argument('sources', nargs='+', help="Video or playlist URLs, files of URLs, or media directories.")
+    for stage in STAGES:
+        parser.add_argument(f'--{stage}-workers', type=int, default=STAGE_WORKERS[stage])
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help="Videos allowed to wait between two stages.")
+    parser.add_argument('--no-hashtag', action='store_true', help="Do not add a keyword hashtag to the summaries.")
+    parser.add_argument('--no-llm-cache', action='store_true',
+                        help="Ask the LLM again instead of reusing cached replies (see llm-cache).")
+    args = parser.parse_args()
+
+    videos = expand_sources(args.sources)
+    if not videos:
+        print("No videos found.")
+        sys.exit(1)
+    print(f"Processing {len(videos)} videos.")
+    workers = {stage: getattr(args, f'{stage}_workers') for stage in STAGES}
+    report = BatchRunner(videos, workers, max(1, args.queue_size), not args.no_hashtag, not args.no_llm_cache).run()
+    print()
+    print(format_report(report))
+    if report['failed']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Benchmarks for the transcription pipeline.
+
+Usage:
+    python benchmark.py memory [--hours 3] [--sample-rate 48000]
+    python benchmark.py cpu-scaling [--audio FILE] [--workers 1,2,4,8] [--threads-per-worker 0]
+    python benchmark.py modes --audio FILE --reference TRANSCRIPT.md [--devices cpu,cuda]
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+import tracemalloc
+
+import numpy as np
+import soundfile as sf
+import librosa
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import audio
+
+
+def _write_synthetic_audio(path: str, hours: float, sample_rate: int, channels: int = 2) -> None:
+    """Writes a long PCM16 test file block by block (a tone over low-level noise)."""
+    total_samples = int(hours * 3600 * sample_rate)
+    block_samples = 60 * sample_rate
+    rng = np.random.default_rng(0)
+    with sf.SoundFile(path, 'w', samplerate=sample_rate, channels=channels, subtype='PCM_16') as f:
+        for start in range(0, total_samples, block_samples):
+            n = min(block_samples, total_samples - start)
+            t = (np.arange(start, start + n) / sample_rate).astype(np.float32)
+            tone = 0.3 * np.sin(2 * np.pi * 220 * t)
+            noise = 0.01 * rng.standard_normal(n).astype(np.float32)
+            f.write(np.repeat((tone + noise)[:, None], channels, axis=1))
+
+
+def _measure(label: str, fn) -> None:
+    tracemalloc.start()
+    start = time.perf_counter()
+    chunks = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{label:<28} peak {peak / 1024 ** 2:10.1f} MiB   {elapsed:8.1f} s   {chunks} chunks")
+
+
+def _full_decode_chunks(path: str, chunk_duration_s: int = 30) -> int:
+    """The previous approach: decode the whole file at the source rate, then resample and slice."""
+    samples, sr = librosa.load(path, sr=None, mono=True)
+    samples = librosa.resample(samples, orig_sr=sr, target_sr=audio.MODEL_SAMPLE_RATE)
+    chunk_samples = chunk_duration_s * audio.MODEL_SAMPLE_RATE
+    return len(range(0, len(samples), chunk_samples))
+
+
+def _streaming_chunks(path: str) -> int:
+    return sum(1 for _ in audio.iter_audio_chunks(path))
+
+
+def benchmark_memory(hours: float, sample_rate: int) -> None:
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, 'synthetic.wav')
+        print(f"Writing {hours} h of synthetic {sample_rate} Hz stereo audio...")
+        _write_synthetic_audio(path, hours, sample_rate)
+        print(f"File size: {os.path.getsize(path) / 1024 ** 2:.1f} MiB")
+        _measure("streaming decode", lambda: _streaming_chunks(path))
+        _measure("full decode (previous)", lambda: _full_decode_chunks(path))
+
+
+def benchmark_cpu_scaling(audio_filepath: str, worker_counts: list[int], threads_per_worker: int, batch_size: int) -> None:
+    """Transcribes the same file with CPU pools of increasing size and prints the throughput of each."""
+    import cpu_pool
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if audio_filepath is None:
+            audio_filepath = os.path.join(temp_dir, 'synthetic.wav')
+            print("No --audio given; using 10 minutes of synthetic audio.")
+            _write_synthetic_audio(audio_filepath, 10 / 60, audio.MODEL_SAMPLE_RATE, channels=1)
+        audio_s = sf.info(audio_filepath).duration
+
+        print(f"{'workers':>8} {'threads':>8} {'wall s':>10} {'audio s / s':>12} {'speedup':>8}")
+        baseline = None
+        for workers in worker_counts:
+            pool = cpu_pool.CpuWorkerPool(workers, threads_per_worker)
+            try:
+                # Give every worker a tiny task first so model loading is not timed.
+                warm_up_chunks = [audio.AudioChunk(i, 0.0, np.zeros(audio.MODEL_SAMPLE_RATE, dtype=np.float32))
+                                  for i in range(workers)]
+                pool.transcribe(warm_up_chunks, batch_size=1)
+                start = time.perf_counter()
+                pool.transcribe(audio.iter_audio_chunks(audio_filepath), batch_size)
+                elapsed = time.perf_counter() - start
+            finally:
+                pool.close()
+            throughput = audio_s / elapsed
+            baseline = baseline or throughput
+            print(f"{workers:>8} {pool.threads_per_worker:>8} {elapsed:>10.1f} {throughput:>12.1f} {throughput / baseline:>7.2f}x")
+
+
+def _word_error_rate(reference: str, hypothesis: str) -> float:
+    """Word-level Levenshtein distance divided by the reference length, ignoring case and punctuation."""
+    normalize = lambda text: ["".join(c for c in w.lower() if c.isalnum()) for w in text.split()]
+    ref, hyp = [w for w in normalize(reference) if w], [w for w in normalize(hypothesis) if w]
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def _read_reference(path: str) -> str:
+    """Reads a reference transcript, skipping the '# Transcription of' header that transcribe.py writes."""
+    with open(path, 'r', encoding='utf-8') as f:
+        lines = f.read().splitlines()
+    if lines and lines[0].startswith('# '):
+        lines = lines[1:]
+    return " ".join(lines)
+
+
+def benchmark_modes(audio_filepath: str, reference_filepath: str, devices: list[str], batch_size: int) -> None:
+    """Transcribes a file in every inference mode and compares speed and accuracy against a reference."""
+    import torch
+    import model_manager
+    import transcribe
+    import transcript
+
+    reference = _read_reference(reference_filepath)
+    audio_s = sf.info(audio_filepath).duration
+
+    print(f"{'device':>6} {'mode':>6} {'load s':>8} {'infer s':>8} {'x realtime':>11} {'WER':>7}")
+    for device in devices:
+        if device == 'cuda' and not torch.cuda.is_available():
+            print(f"{device:>6} skipped: CUDA is not available")
+            continue
+        for mode in model_manager.INFERENCE_MODES[device]:
+            manager = model_manager.ModelManager(model_manager.MODEL_NAME, inference_modes={device: mode})
+            stats = {}
+            try:
+                with manager.acquire(device, stats) as asr_model:
+                    start = time.perf_counter()
+                    results = transcribe._transcribe_in_batches(asr_model, audio.iter_audio_chunks(audio_filepath),
+                                                                device, batch_size)
+                    elapsed = time.perf_counter() - start
+            except Exception as e:
+                print(f"{device:>6} {mode:>6} failed: {e}")
+                continue
+            finally:
+                manager.unload(device)
+            wer = _word_error_rate(reference, transcript.merge_chunk_results(results))
+            print(f"{device:>6} {mode:>6} {stats['model_load_s']:>8.1f} {elapsed:>8.1f} "
+                  f"{audio_s / elapsed:>11.1f} {wer:>7.2%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks for the transcription pipeline.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    memory_parser = subparsers.add_parser('memory', help="Peak memory of streaming vs. full audio decode.")
+    memory_parser.add_argument('--hours', type=float, default=3.0)
+    memory_parser.add_argument('--sample-rate', type=int, default=48000)
+
+    scaling_parser = subparsers.add_parser('cpu-scaling', help="Transcription throughput vs. number of CPU workers.")
+    scaling_parser.add_argument('--audio', default=None, help="Audio file to transcribe (defaults to synthetic audio).")
+    scaling_parser.add_argument('--workers', default='1,2,4,8', help="Comma-separated worker counts to try.")
+    scaling_parser.add_argument('--threads-per-worker', type=int, default=0, help="0 divides the cores evenly.")
+    scaling_parser.add_argument('--batch-size', type=int, default=4)
+
+    modes_parser = subparsers.add_parser('modes', help="Speed and accuracy of each inference mode.")
+    modes_parser.add_argument('--audio', required=True, help="Audio file to transcribe.")
+    modes_parser.add_argument('--reference', required=True, help="Reference transcript (plain text or transcript .md).")
+    modes_parser.add_argument('--devices', default='cpu,cuda', help="Comma-separated devices to test.")
+    modes_parser.add_argument('--batch-size', type=int, default=4)
+
+    args = parser.parse_args()
+    if args.command == 'memory':
+        benchmark_memory(args.hours, args.sample_rate)
+    elif args.command == 'cpu-scaling':
+        benchmark_cpu_scaling(args.audio, [int(w) for w in args.workers.split(',')], args.threads_per_worker, args.batch_size)
+    elif args.command == 'modes':
+        benchmark_modes(args.audio, args.reference, args.devices.split(','), args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,352 @@
+import os
+import sys
+import json
+import time
+import hashlib
+import sqlite3
+import logging
+import threading
+import configparser
+
+# Index of the pipeline's outputs (transcripts and summaries), keyed by video ID
+# and a fingerprint of the settings that produced them. Lookups go through the
+# index rather than guessing file names from the video title, so videos with the
+# same title do not collide and outputs that were moved (e.g. into a category
+# folder) are still found. Also home to the cache of raw LLM replies.
+
+STAGE_TRANSCRIPT = 'transcript'
+STAGE_SUMMARY = 'summary'
+
+# Where an output's transcript came from: speech recognition, or 'captions:<language>'.
+SOURCE_ASR = 'asr'
+
+# Configuration keys whose values change the output of each stage. A stage's
+# fingerprint also covers the keys of the stages before it.
+_STAGE_CONFIG_KEYS = {
+    STAGE_TRANSCRIPT: ('tts-model', 'chunk-duration', 'chunk-overlap', 'cut-at-silence', 'vad',
+                       'vad-threshold-db', 'vad-min-silence', 'cpu-inference-mode', 'gpu-inference-mode'),
+    STAGE_SUMMARY: ('llm_provider', 'llm', 'summarization-prompt', 'max-summary-length', 'summarization-mode',
+                    'enable-categorization', 'combined-categorization',
+                    'lmstudio-token-budget', 'ollama-token-budget', 'openrouter-token-budget'),
+}
+_STAGE_ORDER = (STAGE_TRANSCRIPT, STAGE_SUMMARY)
+
+# Configuration keys that only change outputs made from captions.
+_CAPTION_CONFIG_KEYS = ('captions', 'caption-languages')
+
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    db_path = config['youtubedl'].get('cache-db-path', 'assets/cache.db').strip('"')
+    try:
+        max_size_mb = float(config['youtubedl'].get('cache-max-size-mb', '0').strip('"'))
+        max_age_days = float(config['youtubedl'].get('cache-max-age-days', '0').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for cache-max-size-mb or cache-max-age-days in configuration. Eviction is disabled.")
+        max_size_mb, max_age_days = 0.0, 0.0
+    stage_config = {
+        stage: {key: config['youtubedl'].get(key, '').strip('"') for key in keys}
+        for stage, keys in _STAGE_CONFIG_KEYS.items()
+    }
+    caption_config = {key: config['youtubedl'].get(key, '').strip('"') for key in _CAPTION_CONFIG_KEYS}
+
+    llm_cache_enabled = config['youtubedl'].getboolean('llm-cache', True)
+    llm_cache_path = config['youtubedl'].get('llm-cache-path', 'assets/llm_cache.db').strip('"')
+    try:
+        llm_cache_max_size_mb = float(config['youtubedl'].get('llm-cache-max-size-mb', '50').strip('"'))
+        llm_cache_ttl_days = float(config['youtubedl'].get('llm-cache-ttl-days', '30').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for llm-cache-max-size-mb or llm-cache-ttl-days in configuration. Using 50 MB and 30 days.")
+        llm_cache_max_size_mb, llm_cache_ttl_days = 50.0, 30.0
+    return (db_path, max(0.0, max_size_mb) * 1024 ** 2, max(0.0, max_age_days) * 86400, stage_config, caption_config,
+            llm_cache_enabled, llm_cache_path, max(0.0, llm_cache_max_size_mb) * 1024 ** 2, max(0.0, llm_cache_ttl_days) * 86400)
+
+(DB_PATH, MAX_SIZE_BYTES, MAX_AGE_S, _STAGE_CONFIG, _CAPTION_CONFIG,
+ LLM_CACHE_ENABLED, LLM_CACHE_PATH, LLM_CACHE_MAX_SIZE_BYTES, LLM_CACHE_TTL_S) = load_config()
+
+
+def fingerprint(stage: str, source: str = SOURCE_ASR, **options) -> str:
+    """
+    Returns a short hash of the settings that determine `stage`'s output.
+
+    `source` is where the transcript behind the output came from (see
+    SOURCE_ASR). The caption settings are only covered for outputs made from
+    captions, so changing them leaves speech-recognition transcripts valid.
+    Keyword arguments add per-request options (e.g. whether a hashtag is added)
+    to the configuration values.
+    """
+    settings = {}
+    for name in _STAGE_ORDER[:_STAGE_ORDER.index(stage) + 1]:
+        settings[name] = _STAGE_CONFIG[name]
+    if source != SOURCE_ASR:
+        settings['captions'] = _CAPTION_CONFIG
+    settings['options'] = options
+    return hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+
+
+def accepted_fingerprints(stage: str, with_captions: bool, **options) -> list[str]:
+    """
+    Returns the fingerprints of the outputs of `stage` that the current settings
+    can reuse: those made by speech recognition and, if `with_captions` (captions
+    are on), those made from captions with the current caption settings.
+    """
+    fingerprints = [fingerprint(stage, **options)]
+    if with_captions:
+        fingerprints.append(fingerprint(stage, 'captions', **options))
+    return fingerprints
+
+
+class ResultCache:
+    """
+    SQLite index mapping (video key, stage, fingerprint) to the file holding that output
+    and the source of its transcript.
+
+    Safe to use from several threads. With `max_size_bytes` or `max_age_s` set
+    (0 disables either limit), entries older than the age limit are not served,
+    and `record` evicts the least recently used entries beyond the size limit
+    and expired ones. Eviction only forgets an entry, so the output is made
+    again next time; the file itself is the user's and is never deleted.
+    """
+
+    def __init__(self, db_path: str, max_size_bytes: float = 0, max_age_s: float = 0):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.max_age_s = max_age_s
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    video_key TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    fingerprint TEXT NOT NULL,
+                    path TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    source TEXT NOT NULL DEFAULT 'asr',
+                    PRIMARY KEY (video_key, stage, fingerprint)
+                )""")
+            # Databases made before sources were recorded only hold speech-recognition outputs
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(entries)")]
+            if 'source' not in columns:
+                self._conn.execute("ALTER TABLE entries ADD COLUMN source TEXT NOT NULL DEFAULT 'asr'")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_path ON entries (path)")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+            # Names of one-time tasks (see run_once) that have run against this database
+            self._conn.execute("CREATE TABLE IF NOT EXISTS completed_tasks (name TEXT PRIMARY KEY, completed_at REAL NOT NULL)")
+
+    def lookup(self, video_key: str, stage: str, *fingerprints: str) -> str:
+        """
+        Returns the path of a cached output made with any of `fingerprints` (tried in order), or None.
+        Expired entries and entries whose file has disappeared are dropped.
+        """
+        for fingerprint in fingerprints:
+            path = self._lookup(video_key, stage, fingerprint)
+            if path is not None:
+                return path
+        return None
+
+    def _lookup(self, video_key: str, stage: str, fingerprint: str) -> str:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT path, created_at FROM entries WHERE video_key = ? AND stage = ? AND fingerprint = ?",
+                (video_key, stage, fingerprint)).fetchone()
+            if row is None:
+                return None
+            path, created_at = row
+            if self.max_age_s and time.time() - created_at > self.max_age_s:
+                logging.info(f"Cached {stage} for {video_key} at '{path}' has expired; it will be made again.")
+                self._conn.execute("DELETE FROM entries WHERE video_key = ? AND stage = ? AND fingerprint = ?",
+                                   (video_key, stage, fingerprint))
+                return None
+            if not os.path.isfile(path):
+                logging.info(f"Cached {stage} for {video_key} is gone from '{path}'; dropping it.")
+                self._conn.execute("DELETE FROM entries WHERE video_key = ? AND stage = ? AND fingerprint = ?",
+                                   (video_key, stage, fingerprint))
+                return None
+            self._conn.execute(
+                "UPDATE entries SET last_access = ? WHERE video_key = ? AND stage = ? AND fingerprint = ?",
+                (time.time(), video_key, stage, fingerprint))
+        return path
+
+    def record(self, video_key: str, stage: str, fingerprint: str, path: str, source: str = SOURCE_ASR) -> None:
+        """
+        Registers `path` as the output of `stage` for the video, replacing any previous entry.
+        `source` is where its transcript came from; `fingerprint` must have been made with the same source.
+        """
+        path = os.path.abspath(path)
+        now = time.time()
+        with self._lock, self._conn:
+            # A file belongs to one entry only: whatever it held before has been overwritten.
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (path,))
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (video_key, stage, fingerprint, path, os.path.getsize(path), now, now, source))
+        self.evict()
+
+    def relocate(self, old_path: str, new_path: str) -> None:
+        """Points entries for a file that was moved at its new location."""
+        new_path = os.path.abspath(new_path)
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM entries WHERE path = ?", (new_path,))
+            self._conn.execute("UPDATE entries SET path = ? WHERE path = ?", (new_path, os.path.abspath(old_path)))
+
+    def owner(self, path: str) -> str:
+        """Returns the video key whose output is stored at `path`, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT video_key FROM entries WHERE path = ?",
+                                     (os.path.abspath(path),)).fetchone()
+        return row[0] if row else None
+
+    def source(self, path: str) -> str:
+        """Returns the transcript source recorded for the output at `path`, or None if it is not indexed."""
+        with self._lock:
+            row = self._conn.execute("SELECT source FROM entries WHERE path = ?",
+                                     (os.path.abspath(path),)).fetchone()
+        return row[0] if row else None
+
+    def run_once(self, name: str, task) -> None:
+        """Calls `task()` unless a task called `name` has already completed against this database."""
+        with self._lock:
+            if self._conn.execute("SELECT 1 FROM completed_tasks WHERE name = ?", (name,)).fetchone():
+                return
+        # Outside the lock, so the task can record entries. Tasks must be safe to repeat in case two runs race.
+        task()
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO completed_tasks VALUES (?, ?)", (name, time.time()))
+
+    def evict(self) -> int:
+        """
+        Forgets expired and least recently used entries beyond the limits. Returns how many were removed.
+        The files they point to are left in place.
+        """
+        if not self.max_size_bytes and not self.max_age_s:
+            return 0
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT video_key, stage, fingerprint, path, size, created_at FROM entries ORDER BY last_access DESC"
+            ).fetchall()
+            now = time.time()
+            total = 0
+            evicted = []
+            for video_key, stage, fingerprint, path, size, created_at in rows:
+                expired = self.max_age_s and now - created_at > self.max_age_s
+                if expired or (self.max_size_bytes and total + size > self.max_size_bytes):
+                    evicted.append((video_key, stage, fingerprint, path))
+                else:
+                    total += size
+            for video_key, stage, fingerprint, path in evicted:
+                self._conn.execute("DELETE FROM entries WHERE video_key = ? AND stage = ? AND fingerprint = ?",
+                                   (video_key, stage, fingerprint))
+                logging.info(f"Evicted cached {stage} for {video_key}; '{path}' is kept but no longer reused.")
+        return len(evicted)
+
+
+class ResponseCache:
+    """
+    SQLite store of LLM replies keyed by a hash of everything that went into the request.
+
+    Safe to use from several threads. Entries older than `ttl_s` are not
+    served; once the stored replies exceed `max_size_bytes`, the least recently
+    used are dropped (0 disables either limit). Hits, misses and evictions are
+    counted for the life of the process.
+    """
+
+    def __init__(self, db_path: str, max_size_bytes: float = 0, ttl_s: float = 0):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.max_size_bytes = max_size_bytes
+        self.ttl_s = ttl_s
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._counters = {'hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    response TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL
+                )""")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+
+    @staticmethod
+    def key(*parts: str) -> str:
+        """Hashes the request parts (provider, model, prompt, input...) into a cache key."""
+        return hashlib.sha256(json.dumps(parts).encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> str:
+        """Returns the cached reply, or None."""
+        now = time.time()
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT response, created_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl_s and now - row[1] > self.ttl_s:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._counters['evictions'] += 1
+                row = None
+            if row is None:
+                self._counters['misses'] += 1
+                return None
+            self._conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+            self._counters['hits'] += 1
+        return row[0]
+
+    def put(self, key: str, response: str) -> None:
+        now = time.time()
+        size = len(response.encode('utf-8'))
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, response, size, now, now))
+            self._counters['stores'] += 1
+            if self.ttl_s:
+                self._counters['evictions'] += self._conn.execute(
+                    "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_s,)).rowcount
+            if self.max_size_bytes:
+                total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+                if total > self.max_size_bytes:
+                    for old_key, old_size in self._conn.execute(
+                            "SELECT key, size FROM responses ORDER BY last_access").fetchall():
+                        if total <= self.max_size_bytes:
+                            break
+                        self._conn.execute("DELETE FROM responses WHERE key = ?", (old_key,))
+                        total -= old_size
+                        self._counters['evictions'] += 1
+
+    def stats(self) -> dict:
+        """Returns the hit/miss/store/eviction counters plus the number and size of stored replies."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+            return dict(self._counters, entries=entries, size_bytes=size)
+
+
+_index = None
+_index_lock = threading.Lock()
+_response_cache = None
+
+
+def get_index() -> ResultCache:
+    """Returns the process-wide cache index configured by cache-db-path and the eviction limits."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = ResultCache(DB_PATH, MAX_SIZE_BYTES, MAX_AGE_S)
+        return _index
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide LLM response cache, or None when llm-cache is off."""
+    global _response_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _index_lock:
+        if _response_cache is None:
+            _response_cache = ResponseCache(LLM_CACHE_PATH, LLM_CACHE_MAX_SIZE_BYTES, LLM_CACHE_TTL_S)
+        return _response_cache
@@ -0,0 +1,144 @@
+"""
+Subtitle and caption tracks as plain transcript text.
+
+Usage:
+    python captions.py <caption_file.vtt | caption_file.srv3> [--markdown TITLE]
+
+Prints the text a caption file converts to, or with --markdown the transcript
+file that would be written for it, so the conversion can be checked against
+local caption files without fetching anything.
+"""
+import os
+import re
+import sys
+import html
+import argparse
+import xml.etree.ElementTree as ElementTree
+
+# Formats that can be converted, in order of preference. YouTube offers all of them for every track.
+CAPTION_FORMATS = ('vtt', 'srv3', 'srv2', 'srv1')
+
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+# Non-speech annotations such as [Music] or [Applause], and music note symbols
+_ANNOTATION_PATTERN = re.compile(r'\[[^\]]*\]|[♪♫]')
+_VTT_TIMING_PATTERN = re.compile(r'^\s*(?:\d+:)?\d+:\d+[.,]\d+\s+-->')
+
+
+def _clean_line(line: str) -> str:
+    line = html.unescape(_TAG_PATTERN.sub('', line))
+    line = _ANNOTATION_PATTERN.sub(' ', line)
+    return " ".join(line.split())
+
+
+def _join_lines(lines) -> str:
+    """
+    Joins caption lines into running text.
+
+    Automatic captions roll: each cue repeats the previous cue's last line
+    before adding a new one, so a line equal to the one before it is dropped.
+    """
+    text, previous = [], None
+    for line in lines:
+        line = _clean_line(line)
+        if line and line != previous:
+            text.append(line)
+            previous = line
+    return " ".join(text)
+
+
+def parse_vtt(data: str) -> str:
+    """Returns the spoken text of a WebVTT file, without timings, styling or repeated rolling lines."""
+    lines = []
+    for block in re.split(r'\n\s*\n', data.replace('\r\n', '\n').replace('\r', '\n')):
+        block_lines = block.strip('\n').split('\n')
+        # Only cues carry text; the header and NOTE, STYLE and REGION blocks have no timing line
+        timing_index = next((i for i, line in enumerate(block_lines) if _VTT_TIMING_PATTERN.match(line)), None)
+        if timing_index is not None:
+            lines.extend(block_lines[timing_index + 1:])
+    return _join_lines(lines)
+
+
+def parse_srv(data: str) -> str:
+    """
+    Returns the spoken text of a YouTube timed-text XML file.
+
+    Handles srv1 (<transcript><text>) as well as srv2 and srv3 (<timedtext><body><p>),
+    where srv3 splits each paragraph into word segments. Raises ValueError on malformed XML.
+    """
+    try:
+        root = ElementTree.fromstring(data)
+    except ElementTree.ParseError as e:
+        raise ValueError(f"Malformed timed-text XML: {e}") from e
+    if root.tag == 'transcript':
+        cues = root.iter('text')
+    else:
+        cues = root.iter('p')
+    # srv1 escapes entities twice (e.g. '&amp;#39;'); _clean_line unescapes the second level
+    return _join_lines("".join(cue.itertext()).replace('\n', ' ') for cue in cues)
+
+
+def parse_captions(data: str, ext: str) -> str:
+    """Converts caption file contents in one of CAPTION_FORMATS to transcript text. Raises ValueError."""
+    ext = ext.lower().lstrip('.')
+    if ext == 'vtt':
+        return parse_vtt(data)
+    if ext in ('srv1', 'srv2', 'srv3'):
+        return parse_srv(data)
+    raise ValueError(f"Unsupported caption format '{ext}'.")
+
+
+def _matches(track_language: str, wanted: str) -> bool:
+    # 'en' matches 'en', 'en-US' and 'en-GB'; YouTube's untranslated automatic track is '<lang>-orig'
+    return track_language == wanted or track_language.split('-')[0] == wanted
+
+
+def select_track(info_dict: dict, languages: list[str], include_automatic: bool = False):
+    """
+    Picks the caption track to use from a yt-dlp info dict.
+
+    Uploaded subtitles in the first of `languages` that has any are preferred;
+    automatic captions are only considered if `include_automatic` is set and
+    there are no uploaded subtitles in any of the languages.
+
+    Returns (language, format dict with 'url' and 'ext', is_automatic), or None if there is no usable track.
+    """
+    sources = [(info_dict.get('subtitles') or {}, False)]
+    if include_automatic:
+        sources.append((info_dict.get('automatic_captions') or {}, True))
+    for tracks, is_automatic in sources:
+        for wanted in languages:
+            # Exact language before regional variants; for automatic captions the original before translations
+            candidates = sorted((language for language in tracks if _matches(language, wanted)),
+                                key=lambda language: (language != wanted and language != f'{wanted}-orig',
+                                                      not language.endswith('-orig'), language))
+            for language in candidates:
+                formats = {f.get('ext'): f for f in tracks[language] if f.get('url')}
+                for ext in CAPTION_FORMATS:
+                    if ext in formats:
+                        return language, formats[ext], is_automatic
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert a caption file to transcript text.")
+    parser.add_argument('caption_file')
+    parser.add_argument('--markdown', metavar='TITLE', help="Print the Markdown transcript file instead.")
+    args = parser.parse_args()
+
+    ext = os.path.splitext(args.caption_file)[1]
+    with open(args.caption_file, 'r', encoding='utf-8') as f:
+        data = f.read()
+    try:
+        text = parse_captions(data, ext)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if args.markdown:
+        from transcript import format_text_into_paragraphs
+        print(f"# Transcription of {args.markdown}\n\n{format_text_into_paragraphs(text)}")
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,16 @@
 import sys
 import os
 import configparser
-import json
 import shutil
-import requests
 from pathlib import Path
 
 # Add the src directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import cache
+import llm
+import classifier
+
 # Load configuration
 def load_config():
     config = configparser.ConfigParser()
@@ -40,119 +42,108 @@ def load_config():
 
 LLM_PROVIDER, MODEL_NAME, API_URL, SUMMARY_OUTPUT_DIR, CATEGORY_OUTPUT_DIR, OPENROUTER_API_KEY = load_config()
 
-def analyze_with_llm(text, prompt):
+# Categories a summary can be assigned to; anything else the LLM answers is filed under 'Other'.
+CATEGORIES = [
+    'Technology',
+    'Health & Wellness',
+    'Finance & Business',
+    'Education & Learning',
+    'Entertainment & Arts',
+    'Science & Nature',
+    'Lifestyle & Hobbies',
+    'News & Politics',
+    'Other',
+]
+
+def normalize_category(answer):
+    """
+    Maps an LLM's category answer onto CATEGORIES, tolerating case, quotes,
+    markdown emphasis and 'and' for '&'. Returns None if it matches none of them.
+    """
+    def simplify(name):
+        name = name.lower().replace(' and ', ' & ')
+        return " ".join("".join(c for c in name if c.isalnum() or c in ' &').split())
+
+    answer = simplify(answer.strip().splitlines()[0] if answer.strip() else "")
+    for category in CATEGORIES:
+        if simplify(category) == answer:
+            return category
+    return None
+
+def analyze_with_llm(text, prompt, use_cache=True):
     """
     Analyze text using the same LLM used in summarization.
+    With `use_cache` False, the LLM is asked even if the response cache holds an answer.
     """
-    headers = {}
-    if LLM_PROVIDER == 'openrouter':
-        headers['Authorization'] = f'Bearer {OPENROUTER_API_KEY}'
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{prompt}\n\n---\n\n{text}",
-                }
-            ],
-        }
-    elif LLM_PROVIDER == 'ollama':
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{prompt}\n\n---\n\n{text}",
-                }
-            ],
-            "stream": False
-        }
-    else: # Default to lmstudio
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{prompt}\n\n---\n\n{text}",
-                }
-            ],
-        }
-    
     try:
-        response = requests.post(API_URL, json=payload, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-        
-        if LLM_PROVIDER == 'ollama':
-            if "message" in data and "content" in data["message"]:
-                return data["message"]["content"]
-        else: # lmstudio or openrouter
-            if "choices" in data and data["choices"] and "message" in data["choices"][0] and "content" in data["choices"][0]["message"]:
-                return data["choices"][0]["message"]["content"]
-
-        print(f"Unexpected API response format: {json.dumps(data, indent=2)}")
-        return ""
-            
-    except requests.exceptions.RequestException as e:
+        return llm.get_client().complete(prompt, text, use_cache)
+    except llm.LLMError as e:
         print(f"An error occurred during the API request: {e}")
-        if e.response:
-            print(f"LM Studio Response: {e.response.text}")
         print(f"Please ensure the model '{MODEL_NAME}' is loaded in your LLM provider and that the server is running correctly at {API_URL}.")
         return ""
-        
     except Exception as e:
         print(f"An unexpected error occurred during analysis: {e}")
         return ""
 
-def categorize_summary(summary_filepath):
+def llm_category(summary_content, use_cache=True):
+    """
+    Asks the LLM for the summary's category. Answers outside CATEGORIES become 'Other';
+    returns None if the LLM gave no answer.
+    """
+    # The summary is appended to the prompt by analyze_with_llm
+    category_list = "\n".join(f"    - {name}" for name in CATEGORIES)
+    prompt = f"""
+    Analyze the following summary and assign it to one of the following categories:
+{category_list}
+
+    Provide only the category name from the list above. Do not include any other text or explanation.
+    """
+
+    # Analyze the content using the LLM
+    answer = analyze_with_llm(summary_content, prompt, use_cache).strip()
+    if not answer:
+        return None
+    return normalize_category(answer) or 'Other'
+
+def categorize_summary(summary_filepath, category=None, use_cache=True):
     """
     Categorize a summary file by analyzing its content and moving it to the appropriate folder.
+    If `category` is already known (e.g. returned together with the summary), it is used as is. Otherwise
+    the local classifier decides when it is confident enough, and the LLM is asked when it is not
+    (bypassing the LLM response cache if `use_cache` is False).
+    Returns the file's new path, or None if it could not be categorized.
     """
     # Check if the file exists
     if not os.path.exists(summary_filepath):
         print(f"Error: Summary file not found at {summary_filepath}")
-        return False
-    
-    # Read the summary file
-    try:
-        with open(summary_filepath, 'r', encoding='utf-8') as f:
-            summary_content = f.read()
-    except Exception as e:
-        print(f"Error reading summary file: {e}")
-        return False
+        return None
     
     # Extract the title from the filename
     filename = os.path.basename(summary_filepath)
     title_part = filename.replace('-summarized.md', '')
     
-    # Create a prompt for categorization
-    prompt = f"""
-    Analyze the following summary and assign it to one of the following categories:
-    - Technology
-    - Health & Wellness
-    - Finance & Business
-    - Education & Learning
-    - Entertainment & Arts
-    - Science & Nature
-    - Lifestyle & Hobbies
-    - News & Politics
-    - Other
+    if category is not None:
+        category = normalize_category(category) or 'Other'
+    else:
+        # Read the summary file
+        try:
+            with open(summary_filepath, 'r', encoding='utf-8') as f:
+                summary_content = f.read()
+        except Exception as e:
+            print(f"Error reading summary file: {e}")
+            return None
 
-    Provide only the category name from the list above. Do not include any other text or explanation.
+        # The local classifier answers in milliseconds; the LLM is only asked when it is unsure
+        category, confidence = classifier.classify(summary_content)
+        if category is not None and confidence >= classifier.MIN_CONFIDENCE:
+            print(f"Local classifier chose '{category}' (confidence {confidence:.2f}).")
+        else:
+            category = llm_category(summary_content, use_cache)
 
-    Summary:
-    {summary_content}
+        # If no category was determined, use the title
+        if category is None:
+            category = title_part
 
-    Category:
-    """
-    
-    # Analyze the content using the LLM
-    category = analyze_with_llm(summary_content, prompt).strip()
-    
-    # If no category was determined, use the title
-    if not category:
-        category = title_part
-    
     # Create the category directory if it doesn't exist
     category_dir = os.path.join(CATEGORY_OUTPUT_DIR, category)
     os.makedirs(category_dir, exist_ok=True)
@@ -164,11 +155,12 @@ def categorize_summary(summary_filepath):
     # Move the file to the category directory
     try:
         shutil.move(summary_filepath, new_filepath)
+        cache.get_index().relocate(summary_filepath, new_filepath)
         print(f"Summary categorized as '{category}' and moved to {new_filepath}")
-        return True
+        return new_filepath
     except Exception as e:
         print(f"Error moving file: {e}")
-        return False
+        return None
 
 def main():
     """
@@ -180,9 +172,9 @@ def main():
         sys.exit(1)
     
     summary_filepath = sys.argv[1]
-    success = categorize_summary(summary_filepath)
+    new_filepath = categorize_summary(summary_filepath)
     
-    if success:
+    if new_filepath:
         print("Categorization completed successfully.")
     else:
         print("Categorization failed.")
@@ -0,0 +1,298 @@
+"""
+Local category classifier for summaries.
+
+Usage:
+    python classifier.py train [--summary-dir DIR]
+    python classifier.py compare [--summary-dir DIR] [--limit 50]
+
+`train` fits the model on the summaries already sorted into category folders
+under summary-save-path and reports its cross-validated accuracy. `compare`
+asks the LLM to categorize a sample of the same summaries and reports how often
+the two agree. Each summary is classified by a model trained on the other
+cross-validation folds, not by the saved model that was trained on it, so the
+figures estimate agreement on summaries the classifier has not seen.
+"""
+import os
+import re
+import sys
+import zlib
+import logging
+import argparse
+import threading
+import configparser
+
+import numpy as np
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+# A linear model over hashed word and word-pair features: no vocabulary to
+# store, training takes well under a second for thousands of summaries, and a
+# prediction is a few hundred multiply-adds.
+
+N_FEATURES = 2 ** 16
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    model_path = config['youtubedl'].get('classifier-model-path', 'assets/category_classifier.npz').strip('"')
+    summary_save_path = config['youtubedl'].get('summary-save-path', 'assets/output').strip('"')
+    try:
+        min_confidence = float(config['youtubedl'].get('classifier-min-confidence', '0.7').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for classifier-min-confidence in configuration. Using default value of 0.7.")
+        min_confidence = 0.7
+    return model_path, summary_save_path, min_confidence
+
+MODEL_PATH, SUMMARY_OUTPUT_DIR, MIN_CONFIDENCE = load_config()
+
+
+def _hashed_tokens(text: str) -> np.ndarray:
+    """Returns the feature index of every word and adjacent word pair in the text."""
+    words = [w for w in _TOKEN_PATTERN.findall(text.lower()) if len(w) > 1]
+    tokens = words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+    # crc32 rather than hash(), which is salted per process
+    return np.array([zlib.crc32(token.encode('utf-8')) % N_FEATURES for token in tokens], dtype=np.int64)
+
+
+class CategoryClassifier:
+    """
+    Multinomial logistic regression on L2-normalized TF-IDF of hashed features.
+
+    `predict` returns the most likely category and its probability; callers
+    decide what probability is confident enough.
+    """
+
+    def __init__(self, categories: list[str], weights: np.ndarray = None, bias: np.ndarray = None,
+                 idf: np.ndarray = None):
+        self.categories = list(categories)
+        self.weights = weights if weights is not None else np.zeros((len(categories), N_FEATURES), dtype=np.float32)
+        self.bias = bias if bias is not None else np.zeros(len(categories), dtype=np.float32)
+        self.idf = idf if idf is not None else np.ones(N_FEATURES, dtype=np.float32)
+
+    def _features(self, text: str) -> tuple[np.ndarray, np.ndarray]:
+        indices, counts = np.unique(_hashed_tokens(text), return_counts=True)
+        values = (1 + np.log(counts)) * self.idf[indices]
+        norm = np.linalg.norm(values)
+        return indices, (values / norm if norm else values).astype(np.float32)
+
+    def fit(self, texts: list[str], labels: list[str], epochs: int = 30, learning_rate: float = 1.0,
+            l2: float = 1e-4, seed: int = 0) -> 'CategoryClassifier':
+        """Trains on `texts` labelled with entries of `self.categories` by stochastic gradient descent."""
+        document_frequency = np.zeros(N_FEATURES, dtype=np.float32)
+        for text in texts:
+            document_frequency[np.unique(_hashed_tokens(text))] += 1
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+
+        samples = [self._features(text) for text in texts]
+        targets = [self.categories.index(label) for label in labels]
+        self.weights[:] = 0
+        self.bias[:] = 0
+        rng = np.random.default_rng(seed)
+        for epoch in range(epochs):
+            step = learning_rate / (1 + epoch)
+            for i in rng.permutation(len(samples)):
+                indices, values = samples[i]
+                probabilities = self._softmax(self.weights[:, indices] @ values + self.bias)
+                probabilities[targets[i]] -= 1  # Gradient of the cross-entropy w.r.t. the logits
+                self.weights[:, indices] -= step * (np.outer(probabilities, values) + l2 * self.weights[:, indices])
+                self.bias -= step * probabilities
+        return self
+
+    @staticmethod
+    def _softmax(logits: np.ndarray) -> np.ndarray:
+        exp = np.exp(logits - logits.max())
+        return exp / exp.sum()
+
+    def predict(self, text: str) -> tuple[str, float]:
+        """Returns (category, probability) for the most likely category."""
+        indices, values = self._features(text)
+        probabilities = self._softmax(self.weights[:, indices] @ values + self.bias)
+        best = int(np.argmax(probabilities))
+        return self.categories[best], float(probabilities[best])
+
+    def save(self, path: str) -> None:
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'wb') as f:
+            np.savez_compressed(f, categories=np.array(self.categories), weights=self.weights, bias=self.bias, idf=self.idf)
+
+    @classmethod
+    def load(cls, path: str) -> 'CategoryClassifier':
+        with np.load(path) as data:
+            if data['weights'].shape[1] != N_FEATURES:
+                raise ValueError(f"Model at '{path}' was trained with a different number of features.")
+            return cls([str(c) for c in data['categories']], data['weights'], data['bias'], data['idf'])
+
+
+def load_training_data(summary_dir: str, categories: list[str]) -> tuple[list[str], list[str]]:
+    """Reads every '*-summarized.md' file in the category folders under `summary_dir`."""
+    texts, labels = [], []
+    for category in categories:
+        category_dir = os.path.join(summary_dir, category)
+        if not os.path.isdir(category_dir):
+            continue
+        for filename in sorted(os.listdir(category_dir)):
+            if filename.endswith('-summarized.md'):
+                with open(os.path.join(category_dir, filename), 'r', encoding='utf-8') as f:
+                    texts.append(f.read())
+                labels.append(category)
+    return texts, labels
+
+
+def _present_categories(summary_dir: str, categories: list[str], labels: list[str]) -> list[str]:
+    present = [category for category in categories if category in labels]
+    if len(present) < 2:
+        raise ValueError(f"Need summaries in at least two category folders under '{summary_dir}' to train.")
+    return present
+
+
+def held_out_predictions(texts: list[str], labels: list[str], categories: list[str], folds: int = 5,
+                         indices=None) -> dict:
+    """
+    Predicts summaries with models that did not see them during training.
+
+    The summaries are shuffled into `folds` cross-validation folds (the same
+    ones on every call), and each is predicted by a model trained on the other
+    folds. Returns {index: (category, probability)} for every summary, or only
+    for those in `indices`.
+    """
+    order = np.random.default_rng(0).permutation(len(texts))
+    wanted = set(range(len(texts)) if indices is None else indices)
+    predictions = {}
+    for fold in range(folds):
+        held_out = set(order[fold::folds].tolist())
+        if not held_out & wanted:
+            continue
+        model = CategoryClassifier(categories).fit([t for i, t in enumerate(texts) if i not in held_out],
+                                                   [l for i, l in enumerate(labels) if i not in held_out])
+        for i in sorted(held_out & wanted):
+            predictions[i] = model.predict(texts[i])
+    return predictions
+
+
+def train(summary_dir: str, categories: list[str], folds: int = 5) -> tuple[CategoryClassifier, float]:
+    """
+    Trains a classifier on the sorted summaries and estimates its accuracy by k-fold cross-validation.
+
+    Returns the classifier trained on all summaries and the accuracy (None if
+    there were too few summaries to cross-validate).
+    """
+    texts, labels = load_training_data(summary_dir, categories)
+    present = _present_categories(summary_dir, categories, labels)
+
+    accuracy = None
+    if len(texts) >= 2 * folds:
+        predictions = held_out_predictions(texts, labels, present, folds)
+        accuracy = sum(predictions[i][0] == labels[i] for i in predictions) / len(texts)
+    return CategoryClassifier(present).fit(texts, labels), accuracy
+
+
+_classifier = None
+_classifier_mtime = None
+_classifier_lock = threading.Lock()
+
+
+def get_classifier() -> CategoryClassifier:
+    """Returns the trained model at classifier-model-path, reloading it after retraining, or None if there is none."""
+    global _classifier, _classifier_mtime
+    with _classifier_lock:
+        try:
+            mtime = os.path.getmtime(MODEL_PATH)
+        except OSError:
+            return None
+        if _classifier is None or mtime != _classifier_mtime:
+            try:
+                _classifier = CategoryClassifier.load(MODEL_PATH)
+                _classifier_mtime = mtime
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Could not load category classifier from '{MODEL_PATH}': {e}")
+                return None
+        return _classifier
+
+
+def classify(text: str) -> tuple[str, float]:
+    """Returns (category, probability) from the local model, or (None, 0.0) if none has been trained."""
+    model = get_classifier()
+    if model is None:
+        return None, 0.0
+    return model.predict(text)
+
+
+def _compare_with_llm(summary_dir: str, limit: int, folds: int = 5) -> None:
+    import categorize
+
+    texts, labels = load_training_data(summary_dir, categorize.CATEGORIES)
+    try:
+        present = _present_categories(summary_dir, categorize.CATEGORIES, labels)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+    if len(texts) < 2 * folds:
+        print(f"Need at least {2 * folds} summaries to compare on summaries the classifier was not trained on.")
+        sys.exit(1)
+    sample = np.random.default_rng(0).permutation(len(texts))[:limit].tolist()
+    print(f"Each summary is classified by a model trained on the other {folds - 1} of {folds} cross-validation "
+          f"folds, so none is classified by a model that saw it. The saved model is not used.\n")
+    predictions = held_out_predictions(texts, labels, present, folds, sample)
+
+    compared = agreed = confident = confident_agreed = 0
+    for i in sample:
+        llm_category = categorize.llm_category(texts[i])
+        if llm_category is None:
+            continue
+        category, probability = predictions[i]
+        compared += 1
+        agreed += category == llm_category
+        if probability >= MIN_CONFIDENCE:
+            confident += 1
+            confident_agreed += category == llm_category
+        print(f"folder {labels[i]:<22} local {category:<22} ({probability:.2f})   LLM {llm_category}")
+
+    if not compared:
+        print("The LLM did not categorize any summary.")
+        return
+    print(f"\nAgreement with the LLM on held-out summaries: {agreed / compared:.1%} of {compared} summaries.")
+    if confident:
+        print(f"Above classifier-min-confidence ({MIN_CONFIDENCE}): {confident / compared:.1%} of summaries, "
+              f"agreement {confident_agreed / confident:.1%}. These would skip the LLM.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local category classifier for summaries.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    train_parser = subparsers.add_parser('train', help="Retrain from the summaries sorted into category folders.")
+    train_parser.add_argument('--summary-dir', default=SUMMARY_OUTPUT_DIR)
+    compare_parser = subparsers.add_parser('compare', help="Report agreement between the classifier and the LLM.")
+    compare_parser.add_argument('--summary-dir', default=SUMMARY_OUTPUT_DIR)
+    compare_parser.add_argument('--limit', type=int, default=50, help="Number of summaries to send to the LLM.")
+    args = parser.parse_args()
+
+    if args.command == 'train':
+        import categorize
+        try:
+            model, accuracy = train(args.summary_dir, categorize.CATEGORIES)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        texts, labels = load_training_data(args.summary_dir, model.categories)
+        for category in model.categories:
+            print(f"{category:<22} {labels.count(category):>5} summaries")
+        if accuracy is not None:
+            print(f"Cross-validated accuracy: {accuracy:.1%}")
+        model.save(MODEL_PATH)
+        print(f"Model saved to {MODEL_PATH}")
+    elif args.command == 'compare':
+        _compare_with_llm(args.summary_dir, args.limit)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+import os
+import sys
+import logging
+import itertools
+import threading
+import configparser
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# A pool of CPU worker processes, each holding its own ASR model replica, so
+# transcription on CPU-only nodes scales past what one PyTorch process can use.
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    try:
+        workers = int(config['youtubedl'].get('cpu-workers', '1').strip('"'))
+        threads_per_worker = int(config['youtubedl'].get('cpu-threads-per-worker', '0').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for cpu-workers or cpu-threads-per-worker in configuration. Using a single worker.")
+        workers, threads_per_worker = 1, 0
+    return max(1, workers), max(0, threads_per_worker)
+
+CPU_WORKERS, CPU_THREADS_PER_WORKER = load_config()
+
+
+def _init_worker(threads: int) -> None:
+    """Runs once in each worker process: pins it to the CPU and limits its torch threads."""
+    os.environ['CUDA_VISIBLE_DEVICES'] = ''
+    import torch
+    torch.set_num_threads(threads)
+    torch.set_num_interop_threads(1)
+
+
+def _transcribe_batch(chunks: list, timestamps: bool) -> tuple[list[dict], dict]:
+    """Worker task: transcribes one batch of chunks with this process's model replica."""
+    import model_manager
+    import transcribe
+
+    stats = {}
+    with model_manager.manager.acquire('cpu', stats) as asr_model:
+        results = transcribe._transcribe_in_batches(asr_model, chunks, 'cpu', len(chunks), timestamps)
+    return results, stats
+
+
+class CpuWorkerPool:
+    """
+    Spreads batches of audio chunks over `workers` processes and returns results in chunk order.
+
+    Each worker runs `threads_per_worker` torch threads (0 divides the machine's
+    cores evenly). Only a few batches per worker are in flight at a time, so a
+    lazy chunk iterator is never read far ahead of inference.
+    """
+
+    def __init__(self, workers: int, threads_per_worker: int = 0):
+        self.workers = workers
+        self.threads_per_worker = threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+        self._executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=_init_worker,
+            initargs=(self.threads_per_worker,),
+        )
+        logging.info(f"Started {workers} CPU transcription workers with {self.threads_per_worker} threads each.")
+
+    def transcribe(self, audio_chunks, batch_size: int, timestamps: bool = False, stats: dict = None,
+                   on_results=None) -> list[dict]:
+        """
+        Transcribes chunks across the workers.
+
+        Args:
+            audio_chunks: Iterable of AudioChunk, possibly lazy.
+            batch_size: Chunks per task sent to a worker.
+            timestamps: Whether to request word timestamps.
+            stats: Optional dict that receives the slowest worker's model load and warm-up time.
+            on_results: Optional callable that receives the results of each task, in chunk order, as they come in.
+
+        Returns:
+            One result dict per chunk, in chunk order.
+        """
+        chunk_iter = iter(audio_chunks)
+        in_flight = deque()
+        results = []
+        load_timings = {'model_load_s': 0.0, 'warmup_s': 0.0}
+
+        def submit_next() -> bool:
+            batch = list(itertools.islice(chunk_iter, batch_size))
+            if batch:
+                in_flight.append(self._executor.submit(_transcribe_batch, batch, timestamps))
+            return bool(batch)
+
+        for _ in range(self.workers * 2):
+            if not submit_next():
+                break
+        try:
+            while in_flight:
+                batch_results, worker_stats = in_flight.popleft().result()
+                results.extend(batch_results)
+                if on_results is not None:
+                    on_results(batch_results)
+                for key in load_timings:
+                    load_timings[key] = max(load_timings[key], worker_stats.get(key, 0.0))
+                submit_next()
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
+            raise
+        if stats is not None:
+            stats.update(load_timings)
+        return results
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> CpuWorkerPool:
+    """Returns the process-wide pool configured by cpu-workers, starting it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = CpuWorkerPool(CPU_WORKERS, CPU_THREADS_PER_WORKER)
+        return _pool
@@ -1,9 +1,16 @@
 import configparser
 import sys
+import copy
+import time
+import shutil
+import hashlib
+import threading
 import yt_dlp
 import os
-import librosa
-import soundfile as sf
+
+import cache
+import captions
+from audio import MODEL_SAMPLE_RATE, convert_for_model
 
 DOWNLOAD_DIR = "assets/input"
 
@@ -17,83 +24,244 @@ def load_config():
     
     summary_save_path = config['youtubedl'].get('summary-save-path', 'assets/output').strip('"')
     transcribed_text_save_path = config['youtubedl'].get('transcribed-text-save-path', 'assets/output').strip('"')
-    return summary_save_path, transcribed_text_save_path
+    try:
+        video_info_ttl_s = float(config['youtubedl'].get('video-info-ttl', '1800').strip('"'))
+    except ValueError:
+        print("Warning: Invalid value for video-info-ttl in configuration. Using default value of 1800.")
+        video_info_ttl_s = 1800.0
+    # 'off' always transcribes; 'manual' uses uploaded subtitles; 'auto' also accepts automatic captions
+    captions_mode = config['youtubedl'].get('captions', 'off').strip('"').lower()
+    if captions_mode not in ('off', 'manual', 'auto'):
+        print(f"Warning: Unknown captions mode '{captions_mode}' in configuration. Using 'off'.")
+        captions_mode = 'off'
+    caption_languages = [language.strip() for language in
+                         config['youtubedl'].get('caption-languages', 'en').strip('"').split(',') if language.strip()]
+    try:
+        work_dir_max_age_days = float(config['youtubedl'].get('work-dir-max-age-days', '2').strip('"'))
+    except ValueError:
+        print("Warning: Invalid value for work-dir-max-age-days in configuration. Using default value of 2.")
+        work_dir_max_age_days = 2.0
+    return (summary_save_path, transcribed_text_save_path, video_info_ttl_s, captions_mode, caption_languages or ['en'],
+            work_dir_max_age_days * 86400)
+
+(SUMMARY_OUTPUT_DIR, TRANSCRIBED_OUTPUT_DIR, VIDEO_INFO_TTL_S, CAPTIONS_MODE, CAPTION_LANGUAGES,
+ WORK_DIR_MAX_AGE_S) = load_config()
+
+# Video metadata by video key: (expiry time, info dict). Shared by the web
+# server's info endpoint and the pipeline, so one submission extracts it once.
+_info_cache = {}
+_info_cache_lock = threading.Lock()
+
+# Extra yt-dlp InfoExtractor classes tried before the built-in ones (see register_extractor).
+_extra_extractors = []
+
+def _sanitize_filename(title):
+    return "".join(c for c in title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+
+def video_key(url, local=False):
+    """
+    Returns a stable identifier for the video behind `url` without any network access,
+    so different URLs for the same video (e.g. youtu.be links, extra query parameters) match.
+
+    With `local` True, `url` is the path of a media file on this machine.
+    """
+    if local:
+        return f"file:{os.path.abspath(url)}"
+    for extractor in [*_extra_extractors, *yt_dlp.extractor.gen_extractor_classes()]:
+        if extractor.ie_key() != 'Generic' and extractor.suitable(url):
+            video_id = extractor.get_temp_id(url)
+            if video_id:
+                return f"{extractor.ie_key()}:{video_id}"
+    return url.strip()
+
+def work_dir(key):
+    """
+    Returns the working directory under DOWNLOAD_DIR for the video with key `key` (see `video_key`).
+
+    Every run for the same video uses the same directory, so a run after a
+    failed or cancelled one finds its audio and transcription checkpoint.
+    """
+    return os.path.join(DOWNLOAD_DIR, hashlib.sha256(key.encode('utf-8')).hexdigest()[:16])
+
+def remove_stale_work_dirs(max_age_s=None, keep=()):
+    """
+    Removes working directories that nothing has written to for `max_age_s` seconds (default: work-dir-max-age-days).
+
+    Only directories named like those from `work_dir` (or the per-job ones of
+    earlier versions) are considered; paths in `keep` are left alone. A
+    maximum age of 0 keeps everything.
+    """
+    max_age_s = WORK_DIR_MAX_AGE_S if max_age_s is None else max_age_s
+    if max_age_s <= 0 or not os.path.isdir(DOWNLOAD_DIR):
+        return
+    keep = {os.path.abspath(path) for path in keep}
+    cutoff = time.time() - max_age_s
+    for name in os.listdir(DOWNLOAD_DIR):
+        path = os.path.join(DOWNLOAD_DIR, name)
+        if (not os.path.isdir(path) or os.path.abspath(path) in keep or len(name) not in (16, 32)
+                or any(c not in '0123456789abcdef' for c in name)):
+            continue
+        try:
+            last_modified = max([os.path.getmtime(path)] + [os.path.getmtime(os.path.join(root, filename))
+                                                            for root, _, filenames in os.walk(path)
+                                                            for filename in filenames])
+        except OSError:
+            continue
+        if last_modified < cutoff:
+            print(f"Removing stale working directory '{path}'.")
+            shutil.rmtree(path, ignore_errors=True)
+
+def _local_media_info(path):
+    """Builds a yt-dlp style info dict for a local media file."""
+    title = os.path.splitext(os.path.basename(path))[0]
+    return {
+        'id': _sanitize_filename(title).replace(' ', '_') or 'local_media',
+        'title': title,
+        'description': f"Local file: {os.path.abspath(path)}",
+        'filepath': os.path.abspath(path),
+    }
+
+def register_extractor(extractor_class):
+    """
+    Makes yt-dlp try `extractor_class` before its built-in extractors.
+
+    Lets tests serve metadata and media from a local stub extractor instead of the network.
+    """
+    if extractor_class not in _extra_extractors:
+        _extra_extractors.insert(0, extractor_class)
+
+def _youtube_dl(params):
+    ydl = yt_dlp.YoutubeDL(params, auto_init=False)
+    for extractor_class in _extra_extractors:
+        ydl.add_info_extractor(extractor_class())
+    ydl.add_default_info_extractors()
+    return ydl
+
+def get_video_info(url, local=False):
+    """
+    Gets video information (title, formats, etc.) without downloading the video.
 
-SUMMARY_OUTPUT_DIR, TRANSCRIBED_OUTPUT_DIR = load_config()
+    Results are cached per video for `video-info-ttl` seconds; every caller
+    receives its own copy. The info includes the available formats, so it can
+    be passed to `download_youtube` without extracting it again.
 
-def get_video_info(url):
-    """Gets video information (title, etc.) without downloading the video."""
+    Paths are only read as local media files when `local` is True; the web
+    server never passes it, so its clients cannot name files on this machine.
+    """
+    if local:
+        return _local_media_info(url)
+    key = video_key(url)
+    with _info_cache_lock:
+        expires_at, cached_info = _info_cache.get(key, (0, None))
+        if cached_info is not None and expires_at > time.monotonic():
+            return copy.deepcopy(cached_info)
     try:
         ydl_opts_info = {
             'quiet': True,
-            'extract_flat': True,
-            'force_generic_extractor': True,
+            'extract_flat': 'in_playlist',
         }
-        with yt_dlp.YoutubeDL(ydl_opts_info) as ydl:
+        with _youtube_dl(ydl_opts_info) as ydl:
             info_dict = ydl.extract_info(url, download=False)
             if info_dict is None:
                 print(f"Error: Could not get information for URL: {url}")
                 return None
-            return info_dict
     except Exception as e:
         print(f"Error getting video information: {e}")
         return None
+    with _info_cache_lock:
+        now = time.monotonic()
+        for expired_key in [k for k, (expires_at, _) in _info_cache.items() if expires_at <= now]:
+            del _info_cache[expired_key]
+        _info_cache[key] = (now + VIDEO_INFO_TTL_S, info_dict)
+    return copy.deepcopy(info_dict)
 
-def download_youtube(url):
+def get_captions(url, info_dict):
+    """
+    Fetches the video's captions as transcript text, following the `captions` policy.
+
+    Only the chosen caption track is requested; no audio is downloaded.
+
+    Returns:
+        (text, language, is_automatic), or None if captions are off, the video
+        has no captions in `caption-languages`, or they could not be fetched.
+    """
+    if CAPTIONS_MODE == 'off':
+        return None
+    track = captions.select_track(info_dict, CAPTION_LANGUAGES, include_automatic=CAPTIONS_MODE == 'auto')
+    if track is None:
+        return None
+    language, caption_format, is_automatic = track
+    try:
+        with _youtube_dl({'quiet': True}) as ydl:
+            data = ydl.urlopen(caption_format['url']).read().decode('utf-8')
+        text = captions.parse_captions(data, caption_format['ext'])
+    except Exception as e:
+        print(f"Could not fetch {language} captions: {e}")
+        return None
+    if not text.strip():
+        return None
+    return text, language, is_automatic
+
+def download_youtube(url, download_dir=DOWNLOAD_DIR, info_dict=None, local=False):
+    """
+    Downloads the audio of `url` (or, with `local` True, converts the media file at path `url`) into `download_dir`.
+
+    `info_dict` is the video's metadata from `get_video_info`; it is fetched if
+    not given. The download reuses it rather than extracting the video again.
+
+    Returns:
+        (filepath, video_title, is_transcript_existing), where filepath is the
+        existing transcript if one was found, otherwise the 16 kHz mono audio file.
+    """
     try:
-        os.makedirs(DOWNLOAD_DIR, exist_ok=True)
+        os.makedirs(download_dir, exist_ok=True)
 
-        info_dict = get_video_info(url)
+        if info_dict is None:
+            info_dict = get_video_info(url, local)
         if info_dict is None:
             sys.exit(1)
             
         video_title = info_dict.get('title', 'unknown_title')
         
-        # Sanitize video_title for use as a filename
-        sanitized_video_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        
-        # Check for existing transcript file in the new transcribed-text-save-path
-        expected_transcript_filepath = os.path.join(TRANSCRIBED_OUTPUT_DIR, f"{sanitized_video_title}.md")
-        if os.path.exists(expected_transcript_filepath):
+        # Check the cache index for a transcript of this video made with the current settings
+        expected_transcript_filepath = cache.get_index().lookup(
+            video_key(url, local), cache.STAGE_TRANSCRIPT, *cache.accepted_fingerprints(cache.STAGE_TRANSCRIPT, CAPTIONS_MODE != 'off'))
+        if expected_transcript_filepath is not None:
             print(f"Transcript for '{video_title}' already exists at '{expected_transcript_filepath}'. Skipping download and transcription.")
             return expected_transcript_filepath, video_title, True # Added a flag for existing transcript
 
         # If transcript not found, check for existing audio file
-        # Use ydl.prepare_filename to get the exact filename yt-dlp would generate
-        ydl_opts_filename = {
-            'quiet': True,
-            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(id)s.%(ext)s'),
-        }
-        with yt_dlp.YoutubeDL(ydl_opts_filename) as ydl:
-            base_filepath_without_ext = os.path.splitext(ydl.prepare_filename(info_dict))[0]
-        expected_mono_filepath = f"{base_filepath_without_ext}_mono.wav"
+        outtmpl = os.path.join(download_dir, '%(id)s_mono.%(ext)s')
+        expected_mono_filepath = os.path.join(download_dir, f"{info_dict['id']}_mono.wav")
 
         if os.path.exists(expected_mono_filepath):
             print(f"Warning: Audio file '{expected_mono_filepath}' already exists. Skipping download.")
             return expected_mono_filepath, video_title, False # Flag indicates no existing transcript
 
+        if local:
+            convert_for_model(url, expected_mono_filepath)
+            print(f"Converted local file to {MODEL_SAMPLE_RATE} Hz mono: {expected_mono_filepath}")
+            return expected_mono_filepath, video_title, False
+
+        # Let ffmpeg decode, downmix and resample to the ASR input format in the same
+        # pass that extracts the audio, so no intermediate full-rate WAV is written.
         ydl_opts = {
             'format': 'bestaudio/best',
-            'overwrites': False, 
+            'overwrites': False,
             'postprocessors': [{
                 'key': 'FFmpegExtractAudio',
                 'preferredcodec': 'wav',
-                'preferredquality': '192',
             }],
-            'outtmpl': os.path.join(DOWNLOAD_DIR, '%(id)s.%(ext)s'),
+            'postprocessor_args': {
+                'extractaudio': ['-ac', '1', '-ar', str(MODEL_SAMPLE_RATE), '-acodec', 'pcm_s16le'],
+            },
+            'outtmpl': outtmpl,
         }
-        with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-            downloaded_info_dict = ydl.extract_info(url, download=True)
-            filepath = downloaded_info_dict['requested_downloads'][0]['filepath']
-
-        print(f"Downloaded: {filepath}")
-
-        # Convert to mono
-        audio, sr = librosa.load(filepath, sr=None, mono=True)
-        mono_filepath = os.path.splitext(filepath)[0] + "_mono.wav"
-        sf.write(mono_filepath, audio, sr)
-        print(f"Converted to mono: {mono_filepath}")
+        with _youtube_dl(ydl_opts) as ydl:
+            downloaded_info_dict = ydl.process_ie_result(info_dict, download=True)
+            mono_filepath = downloaded_info_dict['requested_downloads'][0]['filepath']
 
+        print(f"Downloaded and converted to {MODEL_SAMPLE_RATE} Hz mono: {mono_filepath}")
         print("Download and conversion completed successfully.")
         return mono_filepath, video_title, False # Flag indicates no existing transcript
     except Exception as e:
@@ -103,7 +271,7 @@ def download_youtube(url):
 
 if __name__ == '__main__':
     if len(sys.argv) < 2:
-        print("Usage: python download.py <youtube_url>")
+        print("Usage: python download.py <youtube_url | local_media_file>")
         sys.exit(1)
     video_url = sys.argv[1]
-    download_youtube(video_url)
+    download_youtube(video_url, local=os.path.isfile(video_url))
@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import logging
+import threading
+import configparser
+from collections import deque
+
+# One inference thread per GPU that serves every job transcribing at the same
+# time. Chunks from all jobs go into shared batches, so several short videos
+# keep the GPU as busy as one long one, instead of taking turns on the model
+# with batches of their own.
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    enabled = config['youtubedl'].getboolean('shared-gpu-batching', True)
+    try:
+        max_wait_ms = float(config['youtubedl'].get('gpu-batch-wait-ms', '50').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for gpu-batch-wait-ms in configuration. Using default value of 50.")
+        max_wait_ms = 50.0
+    return enabled, max(0.0, max_wait_ms) / 1000
+
+SHARED_GPU_BATCHING, MAX_BATCH_WAIT_S = load_config()
+
+
+class _Stream:
+    """The chunks of one `transcribe` call: those waiting for the GPU, and finished results not yet collected."""
+
+    def __init__(self, timestamps: bool):
+        self.timestamps = timestamps
+        self.pending = deque()
+        self.completed = deque()
+        self.outstanding = 0  # Submitted chunks whose results have not been produced yet
+        self.error = None
+        self.stats = {'model_load_s': 0.0, 'warmup_s': 0.0}
+
+
+class SharedGpuBatcher:
+    """
+    Batches audio chunks from all concurrent transcriptions on one device.
+
+    Each `transcribe` call registers a stream of chunks and feeds it from the
+    caller's thread, decoding at most two batches ahead. A single worker
+    thread forms batches of up to `batch_size` chunks: it waits until that
+    many are queued or `max_wait_s` has passed since it started collecting,
+    then takes chunks from the waiting streams round-robin, one at a time, so
+    every active job gets an equal share of each batch however long its video
+    is. Results are routed back to their stream in chunk order.
+    """
+
+    def __init__(self, device: str, max_wait_s: float = MAX_BATCH_WAIT_S):
+        self.device = device
+        self.max_wait_s = max_wait_s
+        self.batch_size = 1
+        self._streams = []
+        self._next_stream = 0
+        self._cond = threading.Condition()
+        self._worker = None
+
+    def transcribe(self, audio_chunks, batch_size: int, timestamps: bool = False, stats: dict = None,
+                   on_results=None) -> list[dict]:
+        """
+        Transcribes chunks on the shared worker, blocking until all are done.
+
+        Args:
+            audio_chunks: Iterable of AudioChunk, possibly lazy.
+            batch_size: Largest batch the device can take; the latest caller's value applies to all streams.
+            timestamps: Whether to request word timestamps.
+            stats: Optional dict that receives model load and warm-up time spent on this call's batches.
+            on_results: Optional callable that receives results, in chunk order, as they come in.
+
+        Returns:
+            One result dict per chunk, in chunk order. Raises the inference error if a batch fails.
+        """
+        stream = _Stream(timestamps)
+        with self._cond:
+            self.batch_size = max(1, batch_size)
+            self._streams.append(stream)
+            self._ensure_worker()
+
+        chunk_iter = iter(audio_chunks)
+        exhausted = False
+        results = []
+        try:
+            while True:
+                # Decode in this thread, outside the lock, keeping the next batch ready while one runs
+                while not exhausted and stream.outstanding < 2 * self.batch_size:
+                    chunk = next(chunk_iter, None)
+                    if chunk is None:
+                        exhausted = True
+                        break
+                    with self._cond:
+                        stream.pending.append(chunk)
+                        stream.outstanding += 1
+                        self._cond.notify_all()
+
+                with self._cond:
+                    while (not stream.completed and stream.error is None and stream.outstanding > 0
+                           and (exhausted or stream.outstanding >= 2 * self.batch_size)):
+                        self._cond.wait()
+                    if stream.error is not None:
+                        raise stream.error
+                    new_results = list(stream.completed)
+                    stream.completed.clear()
+                    finished = exhausted and stream.outstanding == 0
+
+                if new_results:
+                    results.extend(new_results)
+                    if on_results is not None:
+                        on_results(new_results)
+                if finished:
+                    break
+        finally:
+            with self._cond:
+                self._streams.remove(stream)
+                stream.pending.clear()
+
+        if stats is not None:
+            stats.update(stream.stats)
+        return results
+
+    def _ensure_worker(self) -> None:
+        """Starts the worker thread if it is not running. Caller must hold the condition."""
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name=f'asr-batcher-{self.device}', daemon=True)
+            self._worker.start()
+
+    def _queued(self) -> int:
+        return sum(len(stream.pending) for stream in self._streams)
+
+    def _take_batch(self) -> tuple[list, list]:
+        """Takes up to `batch_size` chunks round-robin across streams. Caller must hold the condition."""
+        batch, owners = [], []
+        count = len(self._streams)
+        order = [self._streams[(self._next_stream + i) % count] for i in range(count)]
+        # Start with a different stream each time, so no stream is always first in line
+        self._next_stream = (self._next_stream + 1) % max(1, count)
+        timestamps = next(stream.timestamps for stream in order if stream.pending)
+        while len(batch) < self.batch_size:
+            took = False
+            for stream in order:
+                if stream.pending and stream.timestamps == timestamps and len(batch) < self.batch_size:
+                    batch.append(stream.pending.popleft())
+                    owners.append(stream)
+                    took = True
+            if not took:
+                break
+        return batch, owners
+
+    def _infer(self, batch: list, timestamps: bool, load_stats: dict) -> list[dict]:
+        """Transcribes one batch on the device's model, filling `load_stats` with model load and warm-up time."""
+        import model_manager
+        import transcribe
+
+        with model_manager.manager.acquire(self.device, load_stats) as asr_model:
+            # Halves the batch and retries on out-of-memory, as for a job's own batches
+            return transcribe._transcribe_in_batches(asr_model, batch, self.device, len(batch), timestamps)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._queued():
+                    self._cond.wait()
+                deadline = time.monotonic() + self.max_wait_s
+                while self._queued() < self.batch_size and time.monotonic() < deadline:
+                    self._cond.wait(deadline - time.monotonic())
+                if not self._queued():
+                    continue  # The waiting job went away
+                batch, owners = self._take_batch()
+
+            load_stats = {}
+            results, error = [], None
+            try:
+                results = self._infer(batch, owners[0].timestamps, load_stats)
+            except Exception as e:
+                logging.error(f"Shared {self.device.upper()} batch of {len(batch)} chunks from "
+                              f"{len(set(map(id, owners)))} jobs failed: {e}")
+                error = e
+
+            with self._cond:
+                for stream in {id(stream): stream for stream in owners}.values():
+                    for key in ('model_load_s', 'warmup_s'):
+                        stream.stats[key] += load_stats.get(key, 0.0)
+                    stream.stats['inference_mode'] = load_stats.get('inference_mode')
+                    if error is not None:
+                        stream.error = error
+                if error is None:
+                    for stream, result in zip(owners, results):
+                        stream.completed.append(result)
+                        stream.outstanding -= 1
+                self._cond.notify_all()
+
+
+_batchers = {}
+_batchers_lock = threading.Lock()
+
+
+def get_batcher(device: str) -> SharedGpuBatcher:
+    """Returns the process-wide batcher for `device`, creating it on first use."""
+    with _batchers_lock:
+        if device not in _batchers:
+            _batchers[device] = SharedGpuBatcher(device)
+        return _batchers[device]
@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import uuid
+import sqlite3
+import logging
+import threading
+import configparser
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import summyt
+import download
+
+# Background job subsystem for the web server. Jobs run `summyt.process_video`
+# on a bounded worker pool, independently of the HTTP request that created
+# them, and their state is kept in SQLite so queued and finished jobs survive a
+# restart.
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    db_path = config['youtubedl'].get('jobs-db-path', 'assets/jobs.db').strip('"')
+    try:
+        max_concurrent_jobs = int(config['youtubedl'].get('max-concurrent-jobs', '1').strip('"'))
+        max_queued_jobs = int(config['youtubedl'].get('max-queued-jobs', '20').strip('"'))
+    except ValueError:
+        print("Warning: Invalid value for max-concurrent-jobs or max-queued-jobs in configuration. Using 1 and 20.")
+        max_concurrent_jobs, max_queued_jobs = 1, 20
+    return db_path, max(1, max_concurrent_jobs), max(0, max_queued_jobs)
+
+DB_PATH, MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS = load_config()
+
+QUEUED, RUNNING, COMPLETED, FAILED, CANCELLED = 'queued', 'running', 'completed', 'failed', 'cancelled'
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# process_video's defaults, filled into a job's options before comparing them, so
+# requests that leave an option out (e.g. /summarize sends no enforced_category)
+# match requests that spell out the same value.
+_DEFAULT_OPTIONS = {'enable_hashtag': True, 'enforced_category': None, 'save_md_summary': True, 'use_cache': True}
+
+# Number of finished jobs whose progress history is kept in memory for late followers.
+_FINISHED_EVENT_HISTORY = 100
+
+
+class QueueFullError(Exception):
+    """Raised when a job is submitted while every worker is busy and the queue is full."""
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class JobStore:
+    """SQLite persistence for job state. Safe to use from several threads."""
+
+    def __init__(self, db_path: str):
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    url TEXT NOT NULL,
+                    options TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    updated_at REAL NOT NULL
+                )""")
+
+    def insert(self, job_id: str, url: str, options: dict) -> None:
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO jobs (id, url, options, status, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, url, json.dumps(options), QUEUED, now, now))
+
+    def update(self, job_id: str, **fields) -> None:
+        if fields.get('result') is not None:
+            fields['result'] = json.dumps(fields['result'])
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{key} = ?" for key in fields)
+        with self._lock, self._conn:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def get(self, job_id: str) -> dict:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._to_dict(row) if row else None
+
+    def with_status(self, *statuses: str) -> list[dict]:
+        placeholders = ", ".join("?" for _ in statuses)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT * FROM jobs WHERE status IN ({placeholders}) ORDER BY created_at", statuses).fetchall()
+        return [self._to_dict(row) for row in rows]
+
+    @staticmethod
+    def _to_dict(row) -> dict:
+        job = dict(row)
+        job['options'] = json.loads(job['options'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+
+class JobManager:
+    """
+    Runs submitted videos through the pipeline on `max_workers` threads.
+
+    Progress updates from `process_video` are recorded per job so that any
+    number of clients can follow a job with `iter_events`, and the latest state
+    is written to the store. At most `max_queued` jobs may wait for a worker;
+    beyond that `submit` raises QueueFullError.
+    """
+
+    def __init__(self, store: JobStore, max_workers: int, max_queued: int):
+        self.store = store
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='summyt-job')
+        self._condition = threading.Condition()
+        self._events = {}
+        self._cancel_events = {}  # Job ID -> threading.Event that cancel() sets for a running job
+        self._in_flight = {}  # Single-flight key -> job ID of the queued or running job
+        self._finished = deque()
+        self._active = 0
+
+    def start(self) -> None:
+        """Re-queues jobs that were queued or interrupted mid-run when the server last stopped."""
+        for job in self.store.with_status(QUEUED, RUNNING):
+            logging.info(f"Resuming job {job['id']} for {job['url']}.")
+            self.store.update(job['id'], status=QUEUED, progress=0, message='Re-queued after restart.')
+            self._enqueue(job['id'], job['url'], job['options'])
+
+    def submit(self, url: str, options: dict = None) -> str:
+        """
+        Queues a video for processing and returns its job ID.
+
+        If the same video is already queued or running with the same options,
+        no new job is created: the existing job's ID is returned, so the caller
+        follows that job's progress and receives its result. A job for the same
+        video with other options runs separately, but shares the download and
+        transcription (see summyt.process_video); only its summary differs.
+        """
+        options = options or {}
+        key = self._flight_key(url, options)
+        with self._condition:
+            existing_job_id = self._in_flight.get(key)
+            if existing_job_id is not None:
+                logging.info(f"Attaching request for {url} to in-flight job {existing_job_id}.")
+                return existing_job_id
+            if self._active >= self.max_workers + self.max_queued:
+                raise QueueFullError(f"All {self.max_workers} workers are busy and {self.max_queued} jobs are already queued.")
+            job_id = uuid.uuid4().hex
+            self.store.insert(job_id, url, options)
+            self._enqueue(job_id, url, options)
+        return job_id
+
+    @staticmethod
+    def _flight_key(url: str, options: dict) -> str:
+        return f"{download.video_key(url)}|{json.dumps(dict(_DEFAULT_OPTIONS, **options), sort_keys=True)}"
+
+    def _enqueue(self, job_id: str, url: str, options: dict) -> None:
+        with self._condition:
+            self._active += 1
+            self._events[job_id] = [{'status': 'Queued', 'progress': 0, 'job_id': job_id}]
+            self._cancel_events[job_id] = threading.Event()
+            self._in_flight[self._flight_key(url, options)] = job_id
+        self._executor.submit(self._run, job_id, url, options)
+
+    def cancel(self, job_id: str) -> bool:
+        """
+        Requests cancellation. Returns False if the job does not exist or has already finished.
+
+        A running job stops at its next audio chunk, LLM request or progress update.
+        """
+        # Under the same lock as the QUEUED -> RUNNING transition in _run, so exactly one of them wins
+        with self._condition:
+            job = self.store.get(job_id)
+            if job is None or job['status'] in FINISHED_STATES:
+                return False
+            if job['status'] == QUEUED:
+                # Not started yet: finish it now; the worker will skip it.
+                self._finish(job_id, CANCELLED, {'status': 'Cancelled', 'progress': 0, 'cancelled': True}, message='Cancelled')
+            elif job_id in self._cancel_events:
+                self._cancel_events[job_id].set()
+        return True
+
+    def _record(self, job_id: str, update: dict) -> None:
+        update = dict(update, job_id=job_id)
+        with self._condition:
+            self._events.setdefault(job_id, []).append(update)
+            self._condition.notify_all()
+
+    def _finish(self, job_id: str, status: str, final_update: dict = None, **fields) -> None:
+        """Records the last update, then marks the job finished, so followers always see the final event."""
+        if final_update is not None:
+            self._record(job_id, final_update)
+        with self._condition:
+            # Together with the in-flight entry, so a request made once the job reads as finished starts a new one
+            self.store.update(job_id, status=status, **fields)
+            for key in [key for key, in_flight_id in self._in_flight.items() if in_flight_id == job_id]:
+                del self._in_flight[key]
+            self._finished.append(job_id)
+            # Only the most recent finished jobs keep their full event history in memory.
+            while len(self._finished) > _FINISHED_EVENT_HISTORY:
+                self._events.pop(self._finished.popleft(), None)
+            self._condition.notify_all()
+
+    def _run(self, job_id: str, url: str, options: dict) -> None:
+        cancel_event = self._cancel_events[job_id]
+        try:
+            with self._condition:
+                if self.store.get(job_id)['status'] == CANCELLED:
+                    return
+                self.store.update(job_id, status=RUNNING)
+            result = None
+            progress_updates = summyt.process_video(url, cancel_event=cancel_event, **options)
+            try:
+                for update in progress_updates:
+                    if cancel_event.is_set():
+                        raise JobCancelled()
+                    self._record(job_id, update)
+                    # Streamed summary text is only kept in memory; the stored state changes with the status.
+                    if 'summary_delta' not in update:
+                        self.store.update(job_id, progress=update.get('progress', 0), message=update.get('status'))
+                    if 'summary' in update:
+                        result = update
+            finally:
+                progress_updates.close()
+            self._finish(job_id, COMPLETED, progress=100, result=result)
+        except (Exception, SystemExit) as e:
+            # SystemExit: some pipeline stages exit on fatal errors when run from the CLI.
+            if cancel_event.is_set():
+                # JobCancelled, or the CancelledError (or failure) of a stage that noticed the request first
+                self._finish(job_id, CANCELLED, {'status': 'Cancelled', 'progress': 0, 'cancelled': True},
+                             message='Cancelled')
+                return
+            logging.error(f"Job {job_id} failed: {e}")
+            self._finish(job_id, FAILED, {'status': f'Error: {e}', 'progress': 0, 'error': str(e)},
+                         error=str(e), message=f"Error: {e}")
+        finally:
+            with self._condition:
+                self._active -= 1
+                self._cancel_events.pop(job_id, None)
+                self._condition.notify_all()
+
+    def get(self, job_id: str) -> dict:
+        return self.store.get(job_id)
+
+    def iter_events(self, job_id: str, timeout_s: float = 15):
+        """
+        Yields the job's progress updates from the beginning, then new ones as they arrive, until it finishes.
+
+        For jobs whose history is no longer in memory (e.g. finished before a
+        restart), only the final state is yielded. Yields None after `timeout_s`
+        seconds without news so callers can send keep-alives.
+        """
+        position = 0
+        while True:
+            timed_out = False
+            with self._condition:
+                events = self._events.get(job_id)
+                if events is None:
+                    break
+                if position >= len(events):
+                    if self.store.get(job_id)['status'] in FINISHED_STATES:
+                        return
+                    timed_out = not self._condition.wait(timeout_s)
+                new_events = events[position:]
+            position += len(new_events)
+            if timed_out:
+                yield None
+            for event in new_events:
+                yield event
+
+        job = self.store.get(job_id)
+        if job is None:
+            return
+        if job['result'] is not None:
+            yield dict(job['result'], job_id=job_id)
+        else:
+            final_update = {'status': job['message'] or job['status'], 'progress': job['progress'], 'job_id': job_id}
+            if job['error']:
+                final_update['error'] = job['error']
+            yield final_update
+
+
+_manager = None
+_manager_lock = threading.Lock()
+
+
+def get_manager() -> JobManager:
+    """Returns the process-wide job manager, starting it (and resuming stored jobs) on first use."""
+    global _manager
+    with _manager_lock:
+        if _manager is None:
+            _manager = JobManager(JobStore(DB_PATH), MAX_CONCURRENT_JOBS, MAX_QUEUED_JOBS)
+            _manager.start()
+        return _manager
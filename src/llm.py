@@ -0,0 +1,312 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+import configparser
+from concurrent.futures import CancelledError
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import cache
+
+# Shared client for the configured LLM provider (LM Studio, Ollama or
+# OpenRouter). All summarization and categorization requests go through one
+# pooled HTTP session with timeouts, retries and a per-provider concurrency cap.
+
+PROVIDERS = ('lmstudio', 'ollama', 'openrouter')
+
+# Concurrent requests allowed per provider when <provider>-max-concurrency is not set.
+DEFAULT_MAX_CONCURRENCY = {'lmstudio': 2, 'ollama': 2, 'openrouter': 8}
+
+# Responses that are worth retrying: rate limiting and transient server errors.
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_MAX_BACKOFF_S = 30.0
+
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+    section = config['youtubedl']
+
+    provider = section.get('llm_provider', 'lmstudio').strip('"')
+    if provider == 'ollama':
+        provider_url = section.get('ollama_api_url', '')
+    elif provider == 'openrouter':
+        provider_url = section.get('openrouter-api-url', '')
+    else:
+        provider_url = section.get('provider-url', '')
+    try:
+        settings = {
+            'connect_timeout_s': float(section.get('llm-connect-timeout', '10').strip('"')),
+            'read_timeout_s': float(section.get('llm-read-timeout', '300').strip('"')),
+            'max_retries': int(section.get('llm-max-retries', '3').strip('"')),
+            'backoff_s': float(section.get('llm-retry-backoff', '1.0').strip('"')),
+            'max_concurrency': int(section.get(f'{provider}-max-concurrency',
+                                               str(DEFAULT_MAX_CONCURRENCY.get(provider, 2))).strip('"')),
+        }
+    except ValueError:
+        logging.warning("Invalid LLM timeout, retry or concurrency value in configuration. Using defaults.")
+        settings = {'connect_timeout_s': 10.0, 'read_timeout_s': 300.0, 'max_retries': 3, 'backoff_s': 1.0,
+                    'max_concurrency': DEFAULT_MAX_CONCURRENCY.get(provider, 2)}
+    return {
+        'provider': provider,
+        'url': provider_url.strip('"'),
+        'model': section.get('llm', '').strip('"'),
+        'api_key': section.get('openrouter-api-key', '').strip('"'),
+        **settings,
+    }
+
+
+class LLMError(Exception):
+    """Raised when the provider cannot produce a completion, after any retries."""
+
+
+class LLMClient:
+    """
+    Chat-completion client for one provider endpoint.
+
+    Requests share a pooled `requests.Session`, so connections are reused
+    across calls and threads. At most `max_concurrency` requests are in flight
+    at once, process-wide. Connection errors, 429 and 5xx responses are retried
+    up to `max_retries` times with exponential backoff and full jitter, honoring
+    Retry-After when the provider sends one. A request that gets no response
+    within `read_timeout_s` fails instead of blocking its thread forever.
+
+    With a `response_cache`, a request identical to an earlier one (same
+    provider, model, prompt and text) is answered from the cache unless the
+    caller passes `use_cache=False`.
+    """
+
+    def __init__(self, provider: str, url: str, model: str, api_key: str = '', connect_timeout_s: float = 10,
+                 read_timeout_s: float = 300, max_retries: int = 3, backoff_s: float = 1.0, max_concurrency: int = 2,
+                 response_cache: cache.ResponseCache = None):
+        if provider not in PROVIDERS:
+            logging.warning(f"Unknown LLM provider '{provider}', treating it as an OpenAI-compatible endpoint.")
+        self.provider = provider
+        self.url = url
+        self.model = model
+        self.api_key = api_key
+        self.timeout = (connect_timeout_s, read_timeout_s)
+        self.max_retries = max(0, max_retries)
+        self.backoff_s = backoff_s
+        self.response_cache = response_cache
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, max_concurrency))
+        self._session.mount('http://', adapter)
+        self._session.mount('https://', adapter)
+
+    def _build_request(self, prompt: str, text: str, stream: bool = False) -> tuple[dict, dict]:
+        headers = {}
+        if self.provider == 'openrouter':
+            headers['Authorization'] = f'Bearer {self.api_key}'
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "user",
+                    "content": f"{prompt}\n\n---\n\n{text}" if text else prompt,
+                }
+            ],
+        }
+        if self.provider == 'ollama' or stream:
+            payload["stream"] = stream
+        return payload, headers
+
+    def _parse_response(self, data: dict) -> str:
+        if self.provider == 'ollama':
+            if "message" in data and "content" in data["message"]:
+                return data["message"]["content"]
+        else:  # lmstudio and openrouter
+            if data.get("choices") and "content" in data["choices"][0].get("message", {}):
+                return data["choices"][0]["message"]["content"]
+        raise LLMError(f"Unexpected API response format: {json.dumps(data, indent=2)}")
+
+    def _retry_delay(self, attempt: int, response: requests.Response = None) -> float:
+        if response is not None:
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.replace('.', '', 1).isdigit():
+                return min(float(retry_after), _MAX_BACKOFF_S)
+        return random.uniform(0, min(_MAX_BACKOFF_S, self.backoff_s * 2 ** attempt))
+
+    def _post(self, payload: dict, headers: dict, **kwargs) -> requests.Response:
+        """POSTs to the provider, retrying transient failures. Caller must hold a concurrency slot."""
+        for attempt in range(self.max_retries + 1):
+            response = None
+            try:
+                response = self._session.post(self.url, json=payload, headers=headers, timeout=self.timeout, **kwargs)
+                if response.status_code not in RETRY_STATUS_CODES:
+                    response.raise_for_status()
+                    return response
+                error = LLMError(f"{self.provider} returned HTTP {response.status_code}: {response.text[:500]}")
+                # Hand the connection back to the pool before the next attempt; streamed bodies are not read otherwise
+                response.close()
+            except requests.exceptions.ConnectionError as e:
+                error = LLMError(f"Could not connect to {self.provider} at {self.url}: {e}")
+            except requests.exceptions.Timeout as e:
+                # A read timeout means the model stalled; retrying would most likely stall again.
+                raise LLMError(f"{self.provider} did not respond within {self.timeout[1]:g}s: {e}") from e
+            except requests.exceptions.RequestException as e:
+                body = ''
+                if e.response is not None:
+                    body = e.response.text[:500]
+                    e.response.close()
+                raise LLMError(f"Request to {self.provider} failed: {e} {body}".strip()) from e
+            if attempt == self.max_retries:
+                raise error
+            delay = self._retry_delay(attempt, response)
+            logging.warning(f"{error} Retrying in {delay:.1f}s ({attempt + 1}/{self.max_retries}).")
+            time.sleep(delay)
+
+    def _cache_key(self, prompt: str, text: str, use_cache: bool) -> str:
+        if self.response_cache is None or not use_cache:
+            return None
+        return self.response_cache.key(self.provider, self.model, prompt, text)
+
+    def complete(self, prompt: str, text: str = '', use_cache: bool = True) -> str:
+        """Sends the prompt, followed by `text` if given, and returns the model's reply. Raises LLMError."""
+        cache_key = self._cache_key(prompt, text, use_cache)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Using cached {self.provider} reply.")
+                return cached
+
+        payload, headers = self._build_request(prompt, text)
+        with self._slots:
+            response = self._post(payload, headers)
+        try:
+            data = response.json()
+        except ValueError as e:
+            raise LLMError(f"{self.provider} returned invalid JSON: {response.text[:500]}") from e
+        reply = self._parse_response(data)
+        if cache_key is not None and reply.strip():
+            self.response_cache.put(cache_key, reply)
+        return reply
+
+    def stream(self, prompt: str, text: str = '', use_cache: bool = True):
+        """
+        Like `complete`, but yields the reply in pieces as the model generates them.
+
+        Ollama streams newline-delimited JSON; the OpenAI-style providers stream
+        Server-Sent Events. Failures before the first piece are retried as usual;
+        a connection lost mid-reply raises LLMError.
+        """
+        cache_key = self._cache_key(prompt, text, use_cache)
+        if cache_key is not None:
+            cached = self.response_cache.get(cache_key)
+            if cached is not None:
+                logging.info(f"Using cached {self.provider} reply.")
+                yield cached
+                return
+
+        pieces = []
+        payload, headers = self._build_request(prompt, text, stream=True)
+        self._slots.acquire()
+        response = None
+        try:
+            response = self._post(payload, headers, stream=True)
+            for line in response.iter_lines():
+                piece = self._parse_stream_line(line.decode('utf-8'))
+                if piece is None:
+                    break
+                if piece:
+                    pieces.append(piece)
+                    yield piece
+        except requests.exceptions.RequestException as e:
+            raise LLMError(f"Stream from {self.provider} was interrupted: {e}") from e
+        except ValueError as e:
+            raise LLMError(f"{self.provider} sent a malformed stream line: {e}") from e
+        finally:
+            # Also runs when the consumer closes the generator early or it is garbage collected
+            if response is not None:
+                response.close()
+            self._slots.release()
+        # Only complete replies are cached: a consumer that stops early never gets here
+        reply = "".join(pieces)
+        if cache_key is not None and reply.strip():
+            self.response_cache.put(cache_key, reply)
+
+    def _parse_stream_line(self, line: str) -> str:
+        """Returns the text carried by one line of a streamed reply, "" if none, or None at the end of the reply."""
+        if not line:
+            return ""
+        if self.provider == 'ollama':
+            data = json.loads(line)
+            if 'error' in data:
+                raise LLMError(f"ollama reported an error: {data['error']}")
+            return None if data.get('done') else data.get('message', {}).get('content', '')
+        if not line.startswith('data:'):
+            return ""  # SSE comments (e.g. OpenRouter's keep-alives) and other fields
+        data = line[len('data:'):].strip()
+        if data == '[DONE]':
+            return None
+        data = json.loads(data)
+        if 'error' in data:
+            raise LLMError(f"{self.provider} reported an error: {data['error']}")
+        choices = data.get('choices') or [{}]
+        return choices[0].get('delta', {}).get('content') or ""
+
+    async def acomplete(self, prompt: str, text: str = '', use_cache: bool = True) -> str:
+        """Async version of `complete`; the request runs on a worker thread so the event loop is not blocked."""
+        return await asyncio.to_thread(self.complete, prompt, text, use_cache)
+
+    def complete_many(self, requests_: list[tuple[str, str]], max_concurrency: int = None,
+                      cancel_event: threading.Event = None, use_cache: bool = True) -> list[str]:
+        """
+        Runs several (prompt, text) requests concurrently and returns the replies in order.
+
+        `max_concurrency` further limits how many of these requests run at
+        once; the client's provider-wide cap always applies. Once
+        `cancel_event` is set, requests that have not started are skipped and
+        CancelledError is raised. `use_cache` applies to every request, as in
+        `complete`. Raises the first LLMError after all requests have finished.
+        """
+        async def run_all():
+            limit = asyncio.Semaphore(max_concurrency or len(requests_) or 1)
+
+            async def run_one(prompt, text):
+                async with limit:
+                    if cancel_event is not None and cancel_event.is_set():
+                        raise CancelledError()
+                    return await self.acomplete(prompt, text, use_cache)
+
+            return await asyncio.gather(*(run_one(prompt, text) for prompt, text in requests_), return_exceptions=True)
+
+        results = asyncio.run(run_all())
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError()
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client() -> LLMClient:
+    """Returns the process-wide client for the provider configured in config.ini."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            settings = load_config()
+            if not settings['model'] or not settings['url']:
+                raise LLMError("Missing required configuration values (llm, provider-url, or ollama_api_url)")
+            _client = LLMClient(**settings, response_cache=cache.get_response_cache())
+        return _client
+
@@ -0,0 +1,210 @@
+import os
+import sys
+import time
+import logging
+import threading
+import configparser
+from contextlib import contextmanager, nullcontext
+
+import numpy as np
+import torch
+import nemo.collections.asr as nemo_asr
+
+from audio import MODEL_SAMPLE_RATE
+
+# Keeps one ASR model per device loaded for the lifetime of the process so that
+# consecutive jobs (e.g. from the Flask server) do not pay the load cost again.
+
+# Inference modes supported per device type.
+INFERENCE_MODES = {
+    'cpu': ('fp32', 'int8'),
+    'cuda': ('fp32', 'fp16', 'bf16'),
+}
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    model_name = config['youtubedl'].get('tts-model', 'nvidia/parakeet-tdt-0.6b-v2').strip('"')
+    try:
+        idle_timeout_s = float(config['youtubedl'].get('model-idle-timeout', '600').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for model-idle-timeout in configuration. Using default value of 600.")
+        idle_timeout_s = 600.0
+    warm_up_on_start = config['youtubedl'].getboolean('warm-up-on-start', False)
+
+    inference_modes = {
+        'cpu': config['youtubedl'].get('cpu-inference-mode', 'fp32').strip('"').lower(),
+        'cuda': config['youtubedl'].get('gpu-inference-mode', 'fp32').strip('"').lower(),
+    }
+    for device, mode in inference_modes.items():
+        if mode not in INFERENCE_MODES[device]:
+            logging.warning(f"Unsupported {device} inference mode '{mode}' in configuration. Using fp32.")
+            inference_modes[device] = 'fp32'
+    return model_name, idle_timeout_s, warm_up_on_start, inference_modes
+
+MODEL_NAME, IDLE_TIMEOUT_S, WARM_UP_ON_START, INFERENCE_MODES_BY_DEVICE = load_config()
+
+
+class ModelManager:
+    """
+    Loads the ASR model at most once per device and shares it between callers.
+
+    Inference on a device is serialized with a per-device lock, since a single
+    model replica is not safe to drive from several threads at once. Models that
+    have not been used for `idle_timeout_s` seconds are unloaded by a background
+    reaper thread (a timeout of 0 keeps them loaded forever).
+
+    `inference_modes` maps a device type ('cpu' or 'cuda') to one of
+    INFERENCE_MODES: 'int8' applies dynamic quantization to the CPU model, while
+    'fp16' and 'bf16' run GPU inference under autocast.
+    """
+
+    def __init__(self, model_name: str, idle_timeout_s: float = 0, inference_modes: dict = None):
+        self.model_name = model_name
+        self.idle_timeout_s = idle_timeout_s
+        self.inference_modes = inference_modes or {}
+        self._models = {}
+        self._device_locks = {}
+        self._last_used = {}
+        self._timings = {}
+        self._guard = threading.Lock()
+        self._reaper = None
+
+    def _device_lock(self, device: str) -> threading.Lock:
+        with self._guard:
+            if device not in self._device_locks:
+                self._device_locks[device] = threading.Lock()
+            return self._device_locks[device]
+
+    def inference_mode(self, device: str) -> str:
+        return self.inference_modes.get(device.split(':')[0].lower(), 'fp32')
+
+    def _inference_context(self, device: str):
+        """Returns the autocast context for reduced-precision GPU modes, or a no-op context."""
+        mode = self.inference_mode(device)
+        if mode == 'fp32' or 'cuda' not in device.lower():
+            return nullcontext()
+        dtype = torch.float16
+        if mode == 'bf16':
+            if torch.cuda.is_bf16_supported():
+                dtype = torch.bfloat16
+            else:
+                logging.warning("bf16 is not supported on this GPU, using fp16 autocast instead.")
+        return torch.autocast(device_type='cuda', dtype=dtype)
+
+    def _load(self, device: str):
+        """Loads and warms up the model on `device`. Caller must hold the device lock."""
+        mode = self.inference_mode(device)
+        logging.info(f"Loading {self.model_name} on {device.upper()} ({mode})...")
+        start = time.perf_counter()
+        model = nemo_asr.models.EncDecRNNTBPEModel.from_pretrained(model_name=self.model_name)
+        # 'cpu:0', 'cpu:1', ... are separate replicas for the worker pool, all on the CPU
+        model.to('cpu' if device.lower().startswith('cpu') else device)
+        model.eval()
+        if mode == 'int8':
+            torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True)
+        load_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with self._inference_context(device):
+            model.transcribe(audio=[np.zeros(MODEL_SAMPLE_RATE, dtype=np.float32)], batch_size=1, verbose=False)
+        warmup_s = time.perf_counter() - start
+
+        logging.info(f"Model loaded on {device.upper()} in {load_s:.2f}s (warm-up {warmup_s:.2f}s).")
+        with self._guard:
+            self._models[device] = model
+            self._timings[device] = {'model_load_s': load_s, 'warmup_s': warmup_s}
+        self._ensure_reaper()
+        return model
+
+    @contextmanager
+    def acquire(self, device: str, stats: dict = None):
+        """
+        Context manager yielding the model for `device`, loading it if needed.
+
+        Holds the device lock for the duration of the block and applies the
+        device's inference mode. If `stats` is given, 'model_load_s' and
+        'warmup_s' are set to the time spent loading for this call (0 when the
+        model was already resident) and 'inference_mode' to the mode used.
+        """
+        lock = self._device_lock(device)
+        with lock:
+            model = self._models.get(device)
+            if model is None:
+                model = self._load(device)
+                timings = dict(self._timings[device])
+            else:
+                timings = {'model_load_s': 0.0, 'warmup_s': 0.0}
+            if stats is not None:
+                stats.update(timings)
+                stats['inference_mode'] = self.inference_mode(device)
+            try:
+                with self._inference_context(device):
+                    yield model
+            finally:
+                self._last_used[device] = time.monotonic()
+
+    def warm_up(self, device: str) -> dict:
+        """Loads the model on `device` ahead of the first job and returns its load timings."""
+        with self.acquire(device):
+            pass
+        return dict(self._timings.get(device, {}))
+
+    def unload(self, device: str) -> None:
+        """Drops the model for `device`, waiting for any in-flight inference to finish."""
+        with self._device_lock(device):
+            self._unload_locked(device)
+
+    def _unload_locked(self, device: str) -> None:
+        with self._guard:
+            model = self._models.pop(device, None)
+            self._last_used.pop(device, None)
+        if model is None:
+            return
+        del model
+        if 'cuda' in device.lower() and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        logging.info(f"Unloaded ASR model from {device.upper()}.")
+
+    def loaded_devices(self) -> list[str]:
+        with self._guard:
+            return list(self._models)
+
+    def _ensure_reaper(self) -> None:
+        if self.idle_timeout_s <= 0:
+            return
+        with self._guard:
+            if self._reaper is not None and self._reaper.is_alive():
+                return
+            self._reaper = threading.Thread(target=self._reap_idle, name='asr-model-reaper', daemon=True)
+            self._reaper.start()
+
+    def _reap_idle(self) -> None:
+        interval = max(1.0, min(self.idle_timeout_s / 4, 30.0))
+        while True:
+            time.sleep(interval)
+            for device in self.loaded_devices():
+                lock = self._device_lock(device)
+                # Skip devices that are busy; they will be checked again next round.
+                if not lock.acquire(blocking=False):
+                    continue
+                try:
+                    last_used = self._last_used.get(device)
+                    idle_s = time.monotonic() - last_used if last_used is not None else 0.0
+                    if idle_s >= self.idle_timeout_s:
+                        logging.info(f"ASR model on {device.upper()} idle for {idle_s:.0f}s, unloading.")
+                        self._unload_locked(device)
+                finally:
+                    lock.release()
+            with self._guard:
+                if not self._models:
+                    self._reaper = None
+                    return
+
+
+manager = ModelManager(MODEL_NAME, IDLE_TIMEOUT_S, INFERENCE_MODES_BY_DEVICE)
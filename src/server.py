@@ -2,12 +2,17 @@ from flask import Flask, request, jsonify, render_template, Response
 import sys
 import os
 import json
+import threading
 import configparser
+from urllib.parse import urlparse
 
 # Add the src directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import summyt
+import jobs
+import cache
+import worker_pool
 from download import get_video_info
 
 app = Flask(__name__, template_folder='.')
@@ -16,13 +21,23 @@ app = Flask(__name__, template_folder='.')
 def index():
     return render_template('index.html')
 
+def _is_web_url(url):
+    """
+    Returns True for http(s) URLs. Anything else (file paths, file:// URLs) is
+    refused, so clients cannot make the server read files on this machine.
+    """
+    if not isinstance(url, str):
+        return False
+    parsed = urlparse(url.strip())
+    return parsed.scheme.lower() in ('http', 'https') and bool(parsed.netloc)
+
 @app.route('/get_video_info', methods=['POST'])
 def get_video_info_endpoint():
     data = request.get_json()
     youtube_url = data.get('url')
 
-    if not youtube_url:
-        return jsonify({'error': 'YouTube URL is required'}), 400
+    if not _is_web_url(youtube_url):
+        return jsonify({'error': 'An http(s) YouTube URL is required'}), 400
 
     info = get_video_info(youtube_url)
     if info:
@@ -30,6 +45,23 @@ def get_video_info_endpoint():
     else:
         return jsonify({'error': 'Failed to get video info'}), 500
 
+def _stream_job(job_id):
+    """Server-Sent Events response that follows a job until it finishes."""
+    def generate():
+        for progress_update in jobs.get_manager().iter_events(job_id):
+            if progress_update is None:
+                yield ": keep-alive\n\n"
+            else:
+                yield f"data: {json.dumps(progress_update)}\n\n"
+
+    return Response(generate(), mimetype='text/event-stream')
+
+def _submit_job(youtube_url, options):
+    try:
+        return jobs.get_manager().submit(youtube_url, options), None
+    except jobs.QueueFullError as e:
+        return None, (jsonify({'error': str(e)}), 503)
+
 @app.route('/summarize', methods=['POST'])
 def summarize_endpoint():
     data = request.get_json()
@@ -37,14 +69,14 @@ def summarize_endpoint():
     enable_hashtag = data.get('enable_hashtag', True)
     save_md_summary = data.get('save_md_summary', True)
 
-    if not youtube_url:
-        return jsonify({'error': 'YouTube URL is required'}), 400
-
-    def generate():
-        for progress_update in summyt.process_video(youtube_url, enable_hashtag, save_md_summary=save_md_summary):
-            yield f"data: {json.dumps(progress_update)}\n\n"
+    if not _is_web_url(youtube_url):
+        return jsonify({'error': 'An http(s) YouTube URL is required'}), 400
 
-    return Response(generate(), mimetype='text/event-stream')
+    # The work runs as a background job, so it continues if the client disconnects.
+    job_id, error_response = _submit_job(youtube_url, {'enable_hashtag': enable_hashtag, 'save_md_summary': save_md_summary})
+    if error_response:
+        return error_response
+    return _stream_job(job_id)
 
 @app.route('/summarize_with_category', methods=['POST'])
 def summarize_with_category_endpoint():
@@ -53,14 +85,67 @@ def summarize_with_category_endpoint():
     enable_hashtag = data.get('enable_hashtag', True)
     enforced_category = data.get('enforced_category')
 
-    if not youtube_url:
-        return jsonify({'error': 'YouTube URL is required'}), 400
+    if not _is_web_url(youtube_url):
+        return jsonify({'error': 'An http(s) YouTube URL is required'}), 400
 
-    def generate():
-        for progress_update in summyt.process_video(youtube_url, enable_hashtag, enforced_category=enforced_category):
-            yield f"data: {json.dumps(progress_update)}\n\n"
+    job_id, error_response = _submit_job(youtube_url, {'enable_hashtag': enable_hashtag, 'enforced_category': enforced_category})
+    if error_response:
+        return error_response
+    return _stream_job(job_id)
 
-    return Response(generate(), mimetype='text/event-stream')
+@app.route('/jobs', methods=['POST'])
+def submit_job_endpoint():
+    data = request.get_json()
+    youtube_url = data.get('url')
+
+    if not _is_web_url(youtube_url):
+        return jsonify({'error': 'An http(s) YouTube URL is required'}), 400
+
+    options = {
+        'enable_hashtag': data.get('enable_hashtag', True),
+        'enforced_category': data.get('enforced_category'),
+        'save_md_summary': data.get('save_md_summary', True),
+        'use_cache': data.get('use_cache', True),
+    }
+    job_id, error_response = _submit_job(youtube_url, options)
+    if error_response:
+        return error_response
+    return jsonify({'job_id': job_id}), 202
+
+@app.route('/jobs/<job_id>')
+def get_job_endpoint(job_id):
+    job = jobs.get_manager().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events_endpoint(job_id):
+    if jobs.get_manager().get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return _stream_job(job_id)
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job_endpoint(job_id):
+    if jobs.get_manager().get(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if not jobs.get_manager().cancel(job_id):
+        return jsonify({'success': False, 'error': 'Job has already finished'}), 409
+    return jsonify({'success': True})
+
+@app.route('/llm_cache_stats')
+def llm_cache_stats():
+    response_cache = cache.get_response_cache()
+    if response_cache is None:
+        return jsonify({'enabled': False})
+    return jsonify(dict(response_cache.stats(), enabled=True))
+
+@app.route('/asr_workers')
+def asr_workers():
+    pool = worker_pool.get_pool()
+    if pool is None:
+        return jsonify({'enabled': False})
+    return jsonify({'enabled': True, 'workers': pool.status()})
 
 @app.route('/get_config')
 def get_config():
@@ -149,5 +234,16 @@ def get_categories():
         print(f"get_categories: error={e}")
         return jsonify({'categories': [], 'error': str(e)})
 
+def _start_model_warm_up():
+    """Loads the ASR model in the background so the first request does not pay for it."""
+    if summyt.transcribe is None or not summyt.transcribe.model_manager.WARM_UP_ON_START:
+        return
+    threading.Thread(target=summyt.transcribe.warm_up, name='asr-warm-up', daemon=True).start()
+
 if __name__ == '__main__':
+    # With the debug reloader, only the child process that actually serves requests warms up.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        _start_model_warm_up()
+        # Resume jobs left queued or running by the previous server process.
+        jobs.get_manager()
     app.run(debug=True)
\ No newline at end of file
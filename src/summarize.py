@@ -1,8 +1,16 @@
 import sys
 import os
-import requests
+import re
+import itertools
+import contextlib
+import threading
 import configparser
-import json
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import llm
 
 # Summary output directory will be loaded from config.ini
 # Maximum text length for summarization will be loaded from config.ini
@@ -51,81 +59,306 @@ def load_config():
             print("Warning: Invalid value for max-summary-length in configuration. Using default value of 150000.")
             max_text_length = 150000
 
-        return llm_provider, llm_model.strip('"'), provider_url.strip('"'), summarization_prompt.strip('"'), summary_save_path, max_text_length, openrouter_api_key
+        summarization_mode = config['youtubedl'].get('summarization-mode', 'map-reduce').strip('"').lower()
+        if summarization_mode not in ('single', 'map-reduce'):
+            print(f"Warning: Unknown summarization-mode '{summarization_mode}' in configuration. Using map-reduce.")
+            summarization_mode = 'map-reduce'
+
+        # Input token budget per request, set per provider since local models usually have small contexts
+        try:
+            default_budget = DEFAULT_TOKEN_BUDGETS.get(llm_provider, DEFAULT_TOKEN_BUDGETS['lmstudio'])
+            token_budget = int(config['youtubedl'].get(f'{llm_provider}-token-budget', str(default_budget)).strip('"'))
+            map_concurrency = int(config['youtubedl'].get('map-concurrency', '2').strip('"'))
+        except ValueError:
+            print(f"Warning: Invalid value for {llm_provider}-token-budget or map-concurrency in configuration. Using defaults.")
+            token_budget, map_concurrency = DEFAULT_TOKEN_BUDGETS.get(llm_provider, DEFAULT_TOKEN_BUDGETS['lmstudio']), 2
+        incremental_summarization = config['youtubedl'].getboolean('incremental-summarization', True)
+
+        return (llm_provider, llm_model.strip('"'), provider_url.strip('"'), summarization_prompt.strip('"'), summary_save_path,
+                max_text_length, openrouter_api_key, summarization_mode, max(500, token_budget), max(1, map_concurrency),
+                incremental_summarization)
     except Exception as e:
         print(f"An error occurred while loading the configuration: {e}")
         sys.exit(1)
 
-LLM_PROVIDER, MODEL_NAME, API_URL, SUMMARIZATION_PROMPT, OUTPUT_DIR, MAX_TEXT_LENGTH, OPENROUTER_API_KEY = load_config()
+# Input tokens per request when <provider>-token-budget is not set.
+DEFAULT_TOKEN_BUDGETS = {'lmstudio': 6000, 'ollama': 6000, 'openrouter': 24000}
+
+# Rough characters-per-token ratio used to size pieces without a tokenizer.
+CHARS_PER_TOKEN = 4
+
+MAP_PROMPT = ("The following is part {index} of {count} of a longer transcript. Summarize this part, keeping every "
+              "topic, decision, actionable item and conclusion it contains. Do not add an introduction or conclusion.")
+# Used for sections summarized while the transcript is still being produced, when the part count is not yet known.
+SECTION_PROMPT = ("The following is part {index} of a longer transcript. Summarize this part, keeping every topic, "
+                  "decision, actionable item and conclusion it contains. Do not add an introduction or conclusion.")
+CATEGORY_PROMPT = ("Start your reply with a single line of the form 'Category: <name>', where <name> is exactly one of: "
+                   "{categories}. Choose the one that best fits the transcript. Then leave an empty line and write the "
+                   "summary as instructed above.")
+COMBINE_PROMPT = ("The following are summaries of consecutive parts of one transcript. Merge them into a single shorter "
+                  "set of notes, keeping every distinct topic, decision, actionable item and conclusion.")
+
+(LLM_PROVIDER, MODEL_NAME, API_URL, SUMMARIZATION_PROMPT, OUTPUT_DIR, MAX_TEXT_LENGTH, OPENROUTER_API_KEY,
+ SUMMARIZATION_MODE, TOKEN_BUDGET, MAP_CONCURRENCY, INCREMENTAL_SUMMARIZATION) = load_config()
+
+def _max_request_chars():
+    """Characters of transcript that fit in one request alongside the longest prompt it may be sent with."""
+    # The part-number placeholders are longer than the numbers that replace them
+    prompts = (SUMMARIZATION_PROMPT, MAP_PROMPT, SECTION_PROMPT, COMBINE_PROMPT)
+    return TOKEN_BUDGET * CHARS_PER_TOKEN - max(len(prompt) for prompt in prompts)
+
+def _split_text(text, max_chars):
+    """
+    Splits text into pieces of at most `max_chars` characters.
+
+    Pieces end at paragraph boundaries where possible, then at sentence
+    boundaries; only a single sentence longer than `max_chars` is cut between words.
+    """
+    units = []
+    for paragraph in re.split(r'\n\s*\n', text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            units.append(paragraph)
+            continue
+        for sentence in re.split(r'(?<=[.!?])\s+', paragraph):
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                units.append(sentence[:cut])
+                sentence = sentence[cut:].lstrip()
+            if sentence:
+                units.append(sentence)
+
+    pieces, current = [], ""
+    for unit in units:
+        separator = "\n\n" if current else ""
+        if current and len(current) + len(separator) + len(unit) > max_chars:
+            pieces.append(current)
+            current, separator = "", ""
+        current += separator + unit
+    if current:
+        pieces.append(current)
+    return pieces
+
+def _condense(text, max_chars, cancel_event=None, use_cache=True):
+    """
+    Reduces text that does not fit in one request to partial summaries that do.
+
+    The text is split into pieces that are summarized concurrently (at most
+    MAP_CONCURRENCY requests at once). If the joined partial summaries still do
+    not fit, they are split and condensed again. Raises llm.LLMError on failure,
+    and CancelledError before the next request once `cancel_event` is set.
+    """
+    pieces = _split_text(text, max_chars)
+    prompts_and_pieces = [(MAP_PROMPT.format(index=index, count=len(pieces)), piece)
+                          for index, piece in enumerate(pieces, 1)]
+    print(f"Summarizing {len(prompts_and_pieces)} pieces with up to {MAP_CONCURRENCY} concurrent requests.")
+    return _reduce(llm.get_client().complete_many(prompts_and_pieces, MAP_CONCURRENCY, cancel_event, use_cache),
+                   max_chars, cancel_event, use_cache)
+
+def _reduce(partial_summaries, max_chars, cancel_event=None, use_cache=True):
+    """
+    Joins partial summaries, combining them in further rounds of requests until they fit in one request.
+    Raises llm.LLMError on failure, and CancelledError once `cancel_event` is set.
+    """
+    while True:
+        if not all(summary.strip() for summary in partial_summaries):
+            raise llm.LLMError("Summarization of one or more pieces produced empty text.")
+
+        combined = "\n\n".join(summary.strip() for summary in partial_summaries)
+        if len(combined) <= max_chars:
+            return combined
+        pieces = _split_text(combined, max_chars)
+        if len(pieces) >= len(partial_summaries):
+            # The partial summaries are not getting shorter; stop rather than loop forever.
+            print("Warning: Partial summaries did not shrink. Producing the final summary from the first pass.")
+            return combined
+        print(f"Combining {len(pieces)} pieces with up to {MAP_CONCURRENCY} concurrent requests.")
+        partial_summaries = llm.get_client().complete_many([(COMBINE_PROMPT, piece) for piece in pieces],
+                                                           MAP_CONCURRENCY, cancel_event, use_cache)
+
+class IncrementalSummarizer:
+    """
+    Runs the map step of map-reduce summarization while the transcript is still being produced.
+
+    Text passed to `add` is collected until it holds more than one request's
+    worth; every complete piece is then summarized in the background (at most
+    MAP_CONCURRENCY requests at once) while transcription carries on. Once the
+    transcript is done, `condense` only has to summarize the last piece before
+    the partial summaries are combined, so the LLM works during transcription
+    instead of after it. Pass the object to `summarize_text_stream` as `partials`.
+    `use_cache` is passed to every LLM request it makes (see llm.LLMClient.complete).
+    """
+
+    def __init__(self, max_chars=None, use_cache=True):
+        self.max_chars = max_chars or _max_request_chars()
+        self.use_cache = use_cache
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=MAP_CONCURRENCY, thread_name_prefix='summarize-section')
+        self._buffer = ""
+        self._futures = []
+
+    def add(self, text):
+        """Appends transcribed text, submitting every piece that can no longer grow."""
+        if not text.strip():
+            return
+        with self._lock:
+            self._buffer = f"{self._buffer} {text.strip()}" if self._buffer else text.strip()
+            if len(self._buffer) <= self.max_chars:
+                return
+            # The last piece may still be continued by the next text, so it stays in the buffer. Raw ASR
+            # output has no paragraphs; rejoining keeps _split_text from treating the remainder as one.
+            *complete, remainder = _split_text(self._buffer, self.max_chars)
+            self._buffer = " ".join(remainder.split())
+            for piece in complete:
+                self._submit(piece)
+
+    def _submit(self, piece):
+        prompt = SECTION_PROMPT.format(index=len(self._futures) + 1)
+        self._futures.append(self._executor.submit(lambda: llm.get_client().complete(prompt, piece, self.use_cache)))
 
-def summarize_text(text):
+    def reset(self):
+        """Discards everything added so far, e.g. because transcription starts over."""
+        with self._lock:
+            for future in self._futures:
+                future.cancel()
+            self._futures = []
+            self._buffer = ""
+
+    def condense(self, cancel_event=None):
+        """
+        Summarizes what is left and combines all partial summaries into text that fits in one request.
+
+        Returns None if no piece was submitted during transcription; the caller
+        then summarizes the complete transcript as usual. Raises llm.LLMError on
+        failure, and CancelledError soon after `cancel_event` is set.
+        """
+        with self._lock:
+            if not self._futures:
+                return None
+            for piece in _split_text(self._buffer, self.max_chars):
+                self._submit(piece)
+            self._buffer = ""
+            futures = list(self._futures)
+        done_early = sum(future.done() for future in futures)
+        print(f"{done_early} of {len(futures)} pieces were summarized during transcription.")
+        try:
+            partial_summaries = [_wait(future, cancel_event) for future in futures]
+        finally:
+            self.close()
+        return _reduce(partial_summaries, self.max_chars, cancel_event, self.use_cache)
+
+    def close(self):
+        """Stops the background requests that have not started yet."""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+def _wait(future, cancel_event=None, poll_s=0.5):
+    """Returns the future's result, checking `cancel_event` while waiting. Raises CancelledError once it is set."""
+    while True:
+        if cancel_event is not None and cancel_event.is_set():
+            raise CancelledError()
+        try:
+            return future.result(timeout=poll_s if cancel_event is not None else None)
+        except TimeoutError:
+            continue
+
+def incremental_summarizer(use_cache=True):
+    """Returns an IncrementalSummarizer if map-reduce mode and incremental-summarization are enabled, else None."""
+    if SUMMARIZATION_MODE != 'map-reduce' or not INCREMENTAL_SUMMARIZATION:
+        return None
+    return IncrementalSummarizer(use_cache=use_cache)
+
+def _split_category_line(stream, result):
+    """
+    Passes a streamed reply through, minus a leading 'Category: ...' line whose value is stored in `result['category']`.
+    """
+    head = ""
+    for piece in stream:
+        head += piece
+        if "\n" in head.lstrip():
+            break
+    match = re.match(r'\s*[*_#]*\s*category\s*[*_]*\s*:\s*(.*?)\s*(?:\n|$)', head, re.IGNORECASE)
+    if match:
+        result['category'] = match.group(1).strip('*_ ')
+        head = head[match.end():].lstrip("\n")
+    else:
+        print("Warning: The reply did not start with a category line.")
+    # Drop the blank line(s) after the category, however the reply was split into pieces
+    stream = itertools.chain([head], stream)
+    for piece in stream:
+        if piece.strip():
+            yield piece.lstrip("\n")
+            break
+    yield from stream
+
+def _until_cancelled(stream, cancel_event):
+    """Passes a streamed reply through, closing it and raising CancelledError once `cancel_event` is set."""
+    with contextlib.closing(stream):
+        for piece in stream:
+            if cancel_event.is_set():
+                raise CancelledError()
+            yield piece
+
+def summarize_text_stream(text, categories=None, result=None, partials=None, cancel_event=None, use_cache=True):
+    """
+    Summarizes a transcript with the configured LLM, yielding the summary in pieces as it is generated.
+
+    In 'map-reduce' mode, text longer than the provider's token budget is
+    summarized piece by piece and the results are combined, so nothing is
+    dropped; only the final request is streamed. In 'single' mode the text is
+    sent in one request, truncated to max-summary-length characters.
+
+    If `categories` is given, the same request also picks one of them: the
+    LLM's answer is stored in `result['category']` (unvalidated; absent if the
+    reply had no category line) and is not part of the yielded summary.
+
+    `partials` is an IncrementalSummarizer that was fed the transcript while it
+    was produced; its partial summaries replace the map step on long text.
+
+    With `use_cache` False, every request goes to the LLM instead of being
+    answered from the LLM response cache.
+
+    Raises llm.LLMError if the provider fails, and CancelledError before the
+    next LLM request or streamed piece once `cancel_event` is set.
+    """
     if not text.strip():
         print("Input text is empty. Skipping summarization.")
-        return ""
+        return
 
-    # Truncate text if it exceeds the maximum length
-    if len(text) > MAX_TEXT_LENGTH:
+    if SUMMARIZATION_MODE == 'map-reduce':
+        max_chars = _max_request_chars()
+        if len(text) > max_chars:
+            condensed = partials.condense(cancel_event) if partials is not None else None
+            text = condensed if condensed is not None else _condense(text, max_chars, cancel_event, use_cache)
+    elif len(text) > MAX_TEXT_LENGTH:
+        # Truncate text if it exceeds the maximum length
         print(f"Warning: Input text is too long ({len(text)} characters). Truncating to {MAX_TEXT_LENGTH} characters.")
         text = text[:MAX_TEXT_LENGTH]
 
-    headers = {}
-    if LLM_PROVIDER == 'openrouter':
-        headers['Authorization'] = f'Bearer {OPENROUTER_API_KEY}'
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{SUMMARIZATION_PROMPT}\n\n---\n\n{text}",
-                }
-            ],
-        }
-    elif LLM_PROVIDER == 'ollama':
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{SUMMARIZATION_PROMPT}\n\n---\n\n{text}",
-                }
-            ],
-            "stream": False
-        }
-    else: # Default to lmstudio
-        payload = {
-            "model": MODEL_NAME,
-            "messages": [
-                {
-                    "role": "user",
-                    "content": f"{SUMMARIZATION_PROMPT}\n\n---\n\n{text}",
-                }
-            ],
-        }
-
     print(f"Sending payload to {LLM_PROVIDER} at {API_URL} for model: {MODEL_NAME}")
+    prompt = SUMMARIZATION_PROMPT
+    if categories:
+        prompt = f"{SUMMARIZATION_PROMPT}\n\n{CATEGORY_PROMPT.format(categories=', '.join(categories))}"
+    stream = llm.get_client().stream(prompt, text, use_cache)
+    if cancel_event is not None:
+        stream = _until_cancelled(stream, cancel_event)
+    if not categories:
+        yield from stream
+        return
+    yield from _split_category_line(stream, result if result is not None else {})
 
-
+def summarize_text(text, use_cache=True):
+    """
+    Summarizes a transcript with the configured LLM (see `summarize_text_stream`).
+    Returns the summary, or "" on failure.
+    """
     try:
-        response = requests.post(API_URL, json=payload, headers=headers)
-        response.raise_for_status()
-        data = response.json()
-
-        if LLM_PROVIDER == 'ollama':
-            if "message" in data and "content" in data["message"]:
-                return data["message"]["content"]
-        else: # lmstudio and openrouter
-            if "choices" in data and data["choices"] and "message" in data["choices"][0] and "content" in data["choices"][0]["message"]:
-                return data["choices"][0]["message"]["content"]
-        
-        print(f"Unexpected API response format: {json.dumps(data, indent=2)}")
-        return ""
-
-    except requests.exceptions.RequestException as e:
+        return "".join(summarize_text_stream(text, use_cache=use_cache))
+    except llm.LLMError as e:
         print(f"An error occurred during the API request: {e}")
-        if e.response:
-            print(f"LM Studio Response: {e.response.text}")
-        print(f"Please ensure the model '{MODEL_NAME}' is loaded in LM Studio and that the server is running correctly at {API_URL}.")
-
+        print(f"Please ensure the model '{MODEL_NAME}' is loaded in your LLM provider and that the server is running correctly at {API_URL}.")
         return ""
     except Exception as e:
         print(f"An unexpected error occurred during summarization: {e}")
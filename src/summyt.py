@@ -1,17 +1,26 @@
 import sys
 import os
+import re
+import glob
 import configparser
 import time
+import shutil
+import hashlib
+import threading
 import nltk
+from concurrent.futures import CancelledError
 from nltk.corpus import stopwords
 from collections import Counter
 
 # Add the src directory to the Python path
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
+import cache
 import download
+import llm
 import summarize
 import categorize
+import transcript
 
 try:
     import transcribe
@@ -41,9 +50,10 @@ def load_config():
     summary_save_path = config['youtubedl'].get('summary-save-path', 'assets/output').strip('"')
     transcribed_text_save_path = config['youtubedl'].get('transcribed-text-save-path', 'assets/output').strip('"')
     enable_categorization = config['youtubedl'].getboolean('enable-categorization', False)
-    return summary_save_path, transcribed_text_save_path, enable_categorization
+    combined_categorization = config['youtubedl'].getboolean('combined-categorization', True)
+    return summary_save_path, transcribed_text_save_path, enable_categorization, combined_categorization
 
-SUMMARY_OUTPUT_DIR, TRANSCRIBED_OUTPUT_DIR, ENABLE_CATEGORIZATION = load_config()
+SUMMARY_OUTPUT_DIR, TRANSCRIBED_OUTPUT_DIR, ENABLE_CATEGORIZATION, COMBINED_CATEGORIZATION = load_config()
 
 def _extract_keyword(text: str) -> str:
     """
@@ -60,60 +70,192 @@ def _extract_keyword(text: str) -> str:
     most_common = word_counts.most_common(1)
     return most_common[0][0] if most_common else "summary"
 
-def process_video(youtube_url, enable_hashtag=True, enforced_category=None, save_md_summary=True):
-    start_time = time.time()
-
-    yield {'status': 'Getting video information...', 'progress': 5}
-    # Get video info early to construct expected summary filename
-    info_dict = download.get_video_info(youtube_url)
-    if info_dict is None:
-        raise Exception("Could not get video information.")
-    video_title = info_dict.get('title', 'unknown_title')
+def _output_path(directory, video_title, video_key, suffix=''):
+    """
+    Returns the path for an output file named after the video title.
 
-    # Sanitize video_title for use as a filename
+    If that file already holds another video's output (two videos with the same
+    title), a short tag derived from the video key is added to the name instead.
+    """
     sanitized_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    expected_summary_filepath = os.path.join(SUMMARY_OUTPUT_DIR, f"{sanitized_title}-summarized.md")
+    path = os.path.join(directory, f"{sanitized_title}{suffix}.md")
+    if cache.get_index().owner(path) not in (None, video_key):
+        tag = hashlib.sha256(video_key.encode('utf-8')).hexdigest()[:8]
+        path = os.path.join(directory, f"{sanitized_title} {tag}{suffix}.md")
+    return path
 
-    if os.path.exists(expected_summary_filepath) and save_md_summary:
-        yield {'status': 'Summary already exists. Reading existing summary...', 'progress': 100}
-        with open(expected_summary_filepath, 'r', encoding='utf-8') as f:
-            summary = f.read()
-        processing_time = time.time() - start_time
-        yield {'status': 'Completed', 'progress': 100, 'summary': summary, 'processing_time': f"{processing_time:.2f} seconds"}
-        return
+def _read_head(path, line_count):
+    """Returns the first `line_count` lines of a text file without line endings, or [] if it cannot be read."""
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return [line.rstrip('\n') for _, line in zip(range(line_count), f)]
+    except (OSError, UnicodeDecodeError):
+        return []
+
+def _index_existing_outputs():
+    """
+    Adds summaries and transcripts written before the cache index existed to the index.
+
+    Summaries are found by their '-summarized.md' name in the summary and
+    category directories and identified by their '[Watch on YouTube](url)'
+    line; transcripts are matched to them by the title in their first line.
+    They are taken to have been made with the current settings, as the
+    file-name lookup that the index replaced assumed. Files the index already
+    knows are left alone.
+    """
+    index = cache.get_index()
+    transcripts_by_title = {}
+    for path in glob.glob(os.path.join(glob.escape(TRANSCRIBED_OUTPUT_DIR), '*.md')):
+        head = _read_head(path, 1)
+        if not path.endswith('-summarized.md') and head and head[0].startswith('# Transcription of '):
+            transcripts_by_title[head[0][len('# Transcription of '):]] = path
+
+    summary_paths = (glob.glob(os.path.join(glob.escape(SUMMARY_OUTPUT_DIR), '*-summarized.md'))
+                     + glob.glob(os.path.join(glob.escape(categorize.CATEGORY_OUTPUT_DIR), '*', '*-summarized.md')))
+    indexed = 0
+    for summary_path in summary_paths:
+        # Header written by summarize_and_save: optional '#keyword', the link, a blank line, then the title
+        head = _read_head(summary_path, 4)
+        has_hashtag = bool(head) and head[0].startswith('#') and not head[0].startswith('# ')
+        head = head[1:] if has_hashtag else head
+        link = re.fullmatch(r'\[Watch on YouTube\]\((.+)\)', head[0]) if head else None
+        if link is None:
+            continue
+        video_key = download.video_key(link.group(1))
+        outputs = [(cache.STAGE_SUMMARY, cache.fingerprint(cache.STAGE_SUMMARY, enable_hashtag=has_hashtag), summary_path)]
+        title = head[2][len('# Summary of '):] if len(head) > 2 and head[2].startswith('# Summary of ') else None
+        if title in transcripts_by_title:
+            outputs.append((cache.STAGE_TRANSCRIPT, cache.fingerprint(cache.STAGE_TRANSCRIPT), transcripts_by_title[title]))
+        for stage, fingerprint, path in outputs:
+            if index.owner(path) is None and index.lookup(video_key, stage, fingerprint) is None:
+                index.record(video_key, stage, fingerprint, path)
+                indexed += 1
+    if indexed:
+        print(f"Added {indexed} existing summaries and transcripts to the cache index.")
+
+def index_existing_outputs_once():
+    """Runs `_index_existing_outputs` the first time the pipeline uses a cache index database."""
+    cache.get_index().run_once('index-existing-outputs', _index_existing_outputs)
+
+# The pipeline stages. process_video chains them; batch mode runs each on worker threads of its own.
+
+def download_stage(youtube_url, work_dir, info_dict, video_key, local=False):
+    """
+    Downloads the audio into `work_dir`, unless a cached transcript or the video's captions make that unnecessary.
+    With `local` True, `youtube_url` is a media file path and is converted instead.
+    Yields progress updates and returns (filepath, video_title, is_transcript_existing).
+    """
+    if download.CAPTIONS_MODE != 'off' and not local:
+        if cache.get_index().lookup(video_key, cache.STAGE_TRANSCRIPT,
+                                    *cache.accepted_fingerprints(cache.STAGE_TRANSCRIPT, True)) is None:
+            yield {'status': 'Looking for captions...', 'progress': 10}
+            captions = download.get_captions(youtube_url, info_dict)
+            if captions is not None:
+                caption_text, language, is_automatic = captions
+                video_title = info_dict.get('title', 'unknown_title')
+                transcript_filepath = _output_path(TRANSCRIBED_OUTPUT_DIR, video_title, video_key)
+                try:
+                    transcript.write_transcript(transcript_filepath, video_title, caption_text)
+                except IOError as e:
+                    raise Exception(f"Failed to write transcript to {transcript_filepath}: {e}")
+                source = f"captions:{language}"
+                cache.get_index().record(video_key, cache.STAGE_TRANSCRIPT, cache.fingerprint(cache.STAGE_TRANSCRIPT, source),
+                                         transcript_filepath, source)
+                kind = 'automatic captions' if is_automatic else 'subtitles'
+                yield {'status': f"Using the video's {language} {kind} instead of transcribing the audio.", 'progress': 30}
+                return transcript_filepath, video_title, True
+            yield {'status': 'No captions available.', 'progress': 10}
 
-    transcribed_text = ""
     yield {'status': 'Proceeding with audio download and local transcription.', 'progress': 10}
     yield {'status': f'Downloading audio from {youtube_url}...', 'progress': 20}
-    downloaded_filepath, video_title, is_transcript_existing = download.download_youtube(youtube_url)
+    downloaded_filepath, video_title, is_transcript_existing = download.download_youtube(youtube_url, work_dir, info_dict,
+                                                                                           local=local)
 
     if downloaded_filepath is None:
         raise Exception("Failed to download audio.")
+    return downloaded_filepath, video_title, is_transcript_existing
 
+def transcribe_stage(downloaded_filepath, video_title, is_transcript_existing, video_key, partials=None, stats=None,
+                     cancel_event=None):
+    """
+    Transcribes the downloaded audio, or reads the cached transcript it points to.
+    The transcript is fed to `partials` (see summarize.IncrementalSummarizer) while it is produced,
+    and `stats`, if given, receives the transcription statistics (device, timings, skipped audio).
+    Setting `cancel_event` stops transcription between chunks with CancelledError.
+    Yields progress updates and returns the transcribed text.
+    """
     if is_transcript_existing:
         yield {'status': f'Using existing transcript from: {downloaded_filepath}', 'progress': 40}
         try:
-            with open(downloaded_filepath, 'r', encoding='utf-8') as f:
-                # Skip the first two lines (title and empty line)
-                f.readline()
-                f.readline()
-                transcribed_text = f.read()
+            return transcript.read_transcript(downloaded_filepath)
         except FileNotFoundError:
             raise Exception(f"Existing transcript file not found at {downloaded_filepath}.")
-    else:
-        yield {'status': f'Processing audio file: {downloaded_filepath}', 'progress': 30}
-        if transcribe:
-            yield {'status': 'Transcribing audio...', 'progress': 50}
-            # Pass video_title and TRANSCRIBED_OUTPUT_DIR to transcribe_audio
-            transcribed_text = transcribe.transcribe_audio(downloaded_filepath, video_title, TRANSCRIBED_OUTPUT_DIR)
-            if not transcribed_text.strip():
-                raise Exception("Transcription failed or produced empty text.")
-            yield {'status': 'Transcription complete.', 'progress': 70}
-        else:
-            raise Exception("Skipping transcription due to missing nemo-toolkit[asr].")
 
+    yield {'status': f'Processing audio file: {downloaded_filepath}', 'progress': 30}
+    if not transcribe:
+        raise Exception("Skipping transcription due to missing nemo-toolkit[asr].")
+    yield {'status': 'Transcribing audio...', 'progress': 50}
+    transcription_stats = {}
+    transcript_filepath = _output_path(TRANSCRIBED_OUTPUT_DIR, video_title, video_key)
+    transcribed_text = transcribe.transcribe_audio(downloaded_filepath, video_title, TRANSCRIBED_OUTPUT_DIR,
+                                                   transcription_stats, output_filepath=transcript_filepath,
+                                                   text_sink=partials, cancel_event=cancel_event)
+    if not transcribed_text.strip():
+        raise Exception("Transcription failed or produced empty text.")
+    if stats is not None:
+        stats.update(transcription_stats)
+    if os.path.exists(transcript_filepath):
+        cache.get_index().record(video_key, cache.STAGE_TRANSCRIPT, cache.fingerprint(cache.STAGE_TRANSCRIPT),
+                                 transcript_filepath)
+    status = 'Transcription complete.'
+    if 'audio_skipped_s' in transcription_stats:
+        status += f" Skipped {transcription_stats['audio_skipped_s']:.0f}s of {transcription_stats['audio_total_s']:.0f}s of non-speech audio."
+    yield {'status': status, 'progress': 70, 'transcription_stats': transcription_stats}
+    return transcribed_text
+
+def transcript_source_of(downloaded_filepath, is_transcript_existing):
+    """Returns where the transcript used for a video came from (see cache.SOURCE_ASR), given what `download_stage` returned."""
+    if is_transcript_existing:
+        return cache.get_index().source(downloaded_filepath) or cache.SOURCE_ASR
+    return cache.SOURCE_ASR
+
+def _download_and_transcribe(youtube_url, work_dir, video_key, info_dict, partials=None, stats=None,
+                             cancel_event=None, local=False):
+    """
+    Downloads the audio into `work_dir` and transcribes it, or reuses a cached transcript.
+    Yields progress updates and returns (transcribed_text, video_title, transcript_source).
+    """
+    downloaded_filepath, video_title, is_transcript_existing = yield from download_stage(youtube_url, work_dir,
+                                                                                         info_dict, video_key, local)
+    transcribed_text = yield from transcribe_stage(downloaded_filepath, video_title, is_transcript_existing, video_key,
+                                                   partials, stats, cancel_event)
+    return transcribed_text, video_title, transcript_source_of(downloaded_filepath, is_transcript_existing)
+
+def summarize_and_save(youtube_url, video_key, video_title, transcribed_text, transcript_source,
+                       enable_hashtag=True, enforced_category=None, save_md_summary=True, partials=None,
+                       cancel_event=None, use_cache=True):
+    """
+    Summarizes the transcript, saves the summary and files it under its category.
+    `transcript_source` is where the transcript came from (see `transcript_source_of`); the cache index keeps it with the summary.
+    `partials` carries the sections already summarized during transcription, if any.
+    Setting `cancel_event` stops summarization before the next LLM request or streamed piece with CancelledError.
+    With `use_cache` False, LLM requests bypass the LLM response cache.
+    Yields progress updates and returns the final summary content.
+    """
     yield {'status': 'Summarizing text...', 'progress': 80}
-    summarized_text = summarize.summarize_text(transcribed_text)
+    # Forward the summary as it is generated; the final update still carries the complete text.
+    summary_pieces = []
+    # Ask for the category in the same request when it is going to be needed
+    combine_category = ENABLE_CATEGORIZATION and COMBINED_CATEGORIZATION and save_md_summary and not enforced_category
+    summary_result = {}
+    try:
+        for piece in summarize.summarize_text_stream(transcribed_text, categorize.CATEGORIES if combine_category else None,
+                                                     summary_result, partials, cancel_event, use_cache):
+            summary_pieces.append(piece)
+            yield {'status': 'Summarizing text...', 'progress': 85, 'summary_delta': piece}
+    except llm.LLMError as e:
+        raise Exception(f"Summarization failed: {e}")
+    summarized_text = "".join(summary_pieces)
 
     if not summarized_text.strip():
         raise Exception("Summarization failed or produced empty text.")
@@ -131,15 +273,16 @@ def process_video(youtube_url, enable_hashtag=True, enforced_category=None, save
     # Compose final summary content
     final_summary_content = "\n".join(header_lines) + f"\n\n# Summary of {video_title}\n\n" + summarized_text
 
-    # Sanitize video_title for use as a filename
-    sanitized_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-    output_filename = os.path.join(SUMMARY_OUTPUT_DIR, f"{sanitized_title}-summarized.md")
+    output_filename = _output_path(SUMMARY_OUTPUT_DIR, video_title, video_key, '-summarized')
 
     if save_md_summary:
         try:
             os.makedirs(SUMMARY_OUTPUT_DIR, exist_ok=True)
             with open(output_filename, 'w', encoding='utf-8') as f:
                 f.write(final_summary_content)
+            cache.get_index().record(video_key, cache.STAGE_SUMMARY,
+                                     cache.fingerprint(cache.STAGE_SUMMARY, transcript_source, enable_hashtag=enable_hashtag),
+                                     output_filename, transcript_source)
             yield {'status': f'Summary saved to {output_filename}', 'progress': 95}
         except IOError as e:
             raise Exception(f"Failed to write summary to {output_filename}: {e}")
@@ -147,32 +290,171 @@ def process_video(youtube_url, enable_hashtag=True, enforced_category=None, save
     if enforced_category:
         yield {'status': f'Enforcing category: {enforced_category}...', 'progress': 98}
         # Construct the new path with the enforced category
-        category_dir = os.path.join(CATEGORY_OUTPUT_DIR, enforced_category)
+        category_dir = os.path.join(categorize.CATEGORY_OUTPUT_DIR, enforced_category)
         os.makedirs(category_dir, exist_ok=True)
         new_filepath = os.path.join(category_dir, os.path.basename(output_filename))
         try:
             shutil.move(output_filename, new_filepath)
+            cache.get_index().relocate(output_filename, new_filepath)
             yield {'status': f'Summary moved to {new_filepath}', 'progress': 99}
         except Exception as e:
             raise Exception(f"Error moving file to enforced category {enforced_category}: {e}")
     elif ENABLE_CATEGORIZATION and save_md_summary:
-        yield {'status': 'Categorizing summary...', 'progress': 98}
-        categorize.categorize_summary(output_filename)
+        category = categorize.normalize_category(summary_result.get('category', ''))
+        if category:
+            yield {'status': f'Filing summary under {category}...', 'progress': 98}
+        else:
+            # Not requested with the summary, or the answer was not a known category: ask separately
+            yield {'status': 'Categorizing summary...', 'progress': 98}
+        categorize.categorize_summary(output_filename, category, use_cache)
+
+    return final_summary_content
+
+# Video key -> [lock, number of runs holding or waiting for it]. Only one run in
+# this process downloads and transcribes a given video at a time; the others wait
+# and then pick up its cached transcript.
+_video_locks = {}
+_video_locks_guard = threading.Lock()
+
+def acquire_video_lock(video_key, cancel_event=None):
+    """
+    Takes the video's single-flight lock, waiting while another run downloads or transcribes the same video.
+    Yields a progress update if it has to wait. Setting `cancel_event` stops the wait with CancelledError.
+    Pair with `release_video_lock`.
+    """
+    with _video_locks_guard:
+        entry = _video_locks.setdefault(video_key, [threading.Lock(), 0])
+        entry[1] += 1
+    lock = entry[0]
+    try:
+        if not lock.acquire(blocking=False):
+            yield {'status': 'Waiting for another job that is transcribing this video...', 'progress': 8}
+            while not lock.acquire(timeout=0.5):
+                if cancel_event is not None and cancel_event.is_set():
+                    raise CancelledError()
+    except BaseException:
+        release_video_lock(video_key, acquired=False)
+        raise
+
+def release_video_lock(video_key, acquired=True):
+    with _video_locks_guard:
+        entry = _video_locks[video_key]
+        if acquired:
+            entry[0].release()
+        entry[1] -= 1
+        if entry[1] == 0:
+            del _video_locks[video_key]
+
+def locked_work_dirs():
+    """Returns the working directories of the videos that runs in this process are using or waiting for."""
+    with _video_locks_guard:
+        return [download.work_dir(video_key) for video_key in _video_locks]
+
+def process_video(youtube_url, enable_hashtag=True, enforced_category=None, save_md_summary=True, cancel_event=None,
+                  use_cache=True, local=False):
+    """
+    Runs a video through download, transcription and summarization, yielding progress updates.
+
+    Finished summaries and transcripts are looked up in the cache index by
+    video ID and settings fingerprint, so a video is only processed again when
+    the settings that affect its output change.
+
+    Audio is downloaded into the video's working directory under the input
+    directory (see download.work_dir), which is removed once transcription
+    succeeds. After a failure or cancellation it is kept, so running the same
+    video again reuses its audio and transcription checkpoint. Directories left
+    untouched for work-dir-max-age-days are removed by later runs.
+
+    Only one run in the process downloads and transcribes a given video at a
+    time, whatever its summary options; a second run for the same video waits
+    and then reuses the transcript the first one cached.
+
+    For long videos, completed sections of the transcript are summarized while
+    the rest is still being transcribed, so the final summary follows
+    transcription closely instead of starting after it.
+
+    `cancel_event` is an optional threading.Event. Once it is set, the run
+    stops at the next audio chunk or LLM request with CancelledError, rather
+    than only between progress updates.
+
+    With `use_cache` False, summarization and categorization ask the LLM
+    again instead of reusing replies from the LLM response cache. Finished
+    summaries and transcripts in the cache index are still reused.
+
+    With `local` True, `youtube_url` is the path of a media file on this
+    machine. Only the command line and batch mode pass it; the web server
+    accepts http(s) URLs alone.
+    """
+    start_time = time.time()
+
+    yield {'status': 'Checking for an existing summary...', 'progress': 5}
+    index_existing_outputs_once()
+    video_key = download.video_key(youtube_url, local)
+    cached_summary_filepath = None
+    if save_md_summary:
+        summary_fingerprints = cache.accepted_fingerprints(cache.STAGE_SUMMARY, download.CAPTIONS_MODE != 'off',
+                                                           enable_hashtag=enable_hashtag)
+        cached_summary_filepath = cache.get_index().lookup(video_key, cache.STAGE_SUMMARY, *summary_fingerprints)
+
+    if cached_summary_filepath is not None:
+        yield {'status': f'Summary already exists at {cached_summary_filepath}. Reading existing summary...', 'progress': 100}
+        with open(cached_summary_filepath, 'r', encoding='utf-8') as f:
+            summary = f.read()
+        processing_time = time.time() - start_time
+        yield {'status': 'Completed', 'progress': 100, 'summary': summary, 'processing_time': f"{processing_time:.2f} seconds"}
+        return
+
+    yield {'status': 'Getting video information...', 'progress': 7}
+    # Fetched once and passed on, so the download does not extract it again
+    info_dict = download.get_video_info(youtube_url, local)
+    if info_dict is None:
+        raise Exception("Could not get video information.")
+
+    work_dir = download.work_dir(video_key)
+    partials = summarize.incremental_summarizer(use_cache)
+    # Stays empty when an existing transcript is reused
+    transcription_stats = {}
+    try:
+        # Keyed by the video alone: runs with different summary options still share one download and transcription
+        yield from acquire_video_lock(video_key, cancel_event)
+        try:
+            download.remove_stale_work_dirs(keep=locked_work_dirs())
+            transcribed_text, video_title, transcript_source = yield from _download_and_transcribe(
+                youtube_url, work_dir, video_key, info_dict, partials, transcription_stats, cancel_event, local)
+            shutil.rmtree(work_dir, ignore_errors=True)
+        finally:
+            release_video_lock(video_key)
+
+        final_summary_content = yield from summarize_and_save(youtube_url, video_key, video_title, transcribed_text,
+                                                             transcript_source, enable_hashtag, enforced_category,
+                                                             save_md_summary, partials, cancel_event, use_cache)
+    finally:
+        if partials is not None:
+            partials.close()
 
     processing_time = time.time() - start_time
-    yield {'status': 'Completed', 'progress': 100, 'summary': final_summary_content, 'processing_time': f"{processing_time:.2f} seconds"}
+    final_update = {'status': 'Completed', 'progress': 100, 'summary': final_summary_content,
+                    'processing_time': f"{processing_time:.2f} seconds"}
+    if transcription_stats:
+        # Kept with the job's result, unlike the transient progress update that first reported them
+        final_update['transcription_stats'] = transcription_stats
+    yield final_update
 
 def main():
-    if len(sys.argv) < 2:
-        print("Usage: python summyt.py <youtube_url>")
+    if len(sys.argv) < 2 or any(arg != '--no-llm-cache' for arg in sys.argv[2:]):
+        print("Usage: python summyt.py <youtube_url | local_media_file> [--no-llm-cache]")
         sys.exit(1)
     
     youtube_url = sys.argv[1]
+    use_cache = '--no-llm-cache' not in sys.argv[2:]
 
     try:
         # For CLI usage, we just print the final summary and time
         final_result = None
-        for progress_update in process_video(youtube_url):
+        for progress_update in process_video(youtube_url, use_cache=use_cache,
+                                             local=os.path.isfile(youtube_url)):
+            if 'summary_delta' in progress_update:
+                continue
             if 'summary' in progress_update:
                 final_result = progress_update
             print(f"Status: {progress_update['status']} (Progress: {progress_update['progress']}%) ")
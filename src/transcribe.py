@@ -1,13 +1,20 @@
 import os
 import sys
+import json
 import logging
 import torch
-import nltk
-import nemo.collections.asr as nemo_asr
-import librosa
-import soundfile as sf
-import tempfile
-import shutil
+import itertools
+import time
+import configparser
+from functools import lru_cache
+from concurrent.futures import CancelledError
+
+import model_manager
+import cpu_pool
+import gpu_batcher
+import worker_pool
+from audio import iter_audio_chunks
+from transcript import merge_chunk_results, to_source_timeline, write_transcript
 
 # Configure logging for clear output
 logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
@@ -17,105 +24,339 @@ logging.getLogger('pytorch_lightning').setLevel(logging.ERROR)
 
 # OUTPUT_DIR will be loaded from config.ini in summyt.py and passed here
 
-def _check_gpu_compatibility() -> bool:
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    # 'auto' sizes batches from free device memory; a number fixes the batch size.
+    batch_size = config['youtubedl'].get('asr-batch-size', 'auto').strip('"').lower()
+    if batch_size != 'auto':
+        try:
+            batch_size = max(1, int(batch_size))
+        except ValueError:
+            logging.warning("Invalid value for asr-batch-size in configuration. Using 'auto'.")
+            batch_size = 'auto'
+
+    try:
+        chunk_duration_s = float(config['youtubedl'].get('chunk-duration', '30').strip('"'))
+        chunk_overlap_s = float(config['youtubedl'].get('chunk-overlap', '0').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for chunk-duration or chunk-overlap in configuration. Using 30 s chunks without overlap.")
+        chunk_duration_s, chunk_overlap_s = 30.0, 0.0
+    cut_at_silence = config['youtubedl'].getboolean('cut-at-silence', False)
+
+    # Energy-based voice activity filter; None disables it.
+    try:
+        vad_threshold_db = float(config['youtubedl'].get('vad-threshold-db', '-45').strip('"'))
+        vad_min_silence_s = float(config['youtubedl'].get('vad-min-silence', '1.0').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for vad-threshold-db or vad-min-silence in configuration. Using -45 dB and 1.0 s.")
+        vad_threshold_db, vad_min_silence_s = -45.0, 1.0
+    if not config['youtubedl'].getboolean('vad', False):
+        vad_threshold_db = None
+    checkpoints = config['youtubedl'].getboolean('transcription-checkpoints', True)
+    return batch_size, chunk_duration_s, chunk_overlap_s, cut_at_silence, vad_threshold_db, vad_min_silence_s, checkpoints
+
+(ASR_BATCH_SIZE, CHUNK_DURATION_S, CHUNK_OVERLAP_S, CUT_AT_SILENCE,
+ VAD_THRESHOLD_DB, VAD_MIN_SILENCE_S, TRANSCRIPTION_CHECKPOINTS) = load_config()
+
+# Rough device memory needed per 30 s chunk in a batch (activations, not weights).
+_GPU_BYTES_PER_CHUNK = 512 * 1024 ** 2
+_MAX_AUTO_BATCH_SIZE = 32
+_CPU_AUTO_BATCH_SIZE = 4
+
+@lru_cache(maxsize=None)
+def compatible_gpus() -> tuple[str, ...]:
     """
-    Checks for a compatible NVIDIA GPU and ensures CUDA operations are working.
-    Returns True if a compatible GPU is found, False otherwise.
+    Checks every NVIDIA GPU for an architecture this PyTorch build supports and working CUDA operations.
+    Returns the devices that pass, e.g. ('cuda:0', 'cuda:1'), or an empty tuple.
+    The result is cached, so the test allocations only happen once per process.
     """
     if not torch.cuda.is_available():
         logging.info("NVIDIA GPU not available or CUDA is not set up.")
-        return False
+        return ()
 
-    try:
-        device_properties = torch.cuda.get_device_properties(0)
-        capability = f"sm_{device_properties.major}{device_properties.minor}"
-        supported_archs = torch.cuda.get_arch_list()
+    supported_archs = torch.cuda.get_arch_list()
+    devices = []
+    for index in range(torch.cuda.device_count()):
+        device = f'cuda:{index}'
+        try:
+            device_properties = torch.cuda.get_device_properties(index)
+            capability = f"sm_{device_properties.major}{device_properties.minor}"
 
-        logging.info(f"Detected GPU: {device_properties.name} (CUDA Capability: {capability})")
+            logging.info(f"Detected GPU {index}: {device_properties.name} (CUDA Capability: {capability})")
 
-        if capability not in supported_archs:
-            logging.warning(f"GPU architecture '{capability}' is not in the supported list by this PyTorch build.")
-            logging.warning(f"Supported architectures: {supported_archs}")
-            return False
+            if capability not in supported_archs:
+                logging.warning(f"GPU architecture '{capability}' is not in the supported list by this PyTorch build.")
+                logging.warning(f"Supported architectures: {supported_archs}")
+                continue
 
-        # Perform a quick test to confirm CUDA is operational
-        test_tensor = torch.randn(1, 1).cuda()
-        _ = test_tensor + test_tensor
-        logging.info("GPU is compatible and CUDA operations are working.")
-        return True
+            # Perform a quick test to confirm CUDA is operational
+            test_tensor = torch.randn(1, 1).to(device)
+            _ = test_tensor + test_tensor
+            devices.append(device)
+        except Exception as e:
+            logging.error(f"GPU {index} compatibility check failed with an error: {e}")
 
-    except Exception as e:
-        logging.error(f"GPU compatibility check failed with an error: {e}")
-        return False
+    if devices:
+        logging.info(f"Compatible GPUs with working CUDA operations: {', '.join(devices)}.")
+    return tuple(devices)
 
-def _create_audio_chunks(audio_filepath: str, chunk_duration_s: int = 30) -> list[str]:
+def _check_gpu_compatibility() -> bool:
     """
-    Splits an audio file into smaller chunks of a specified duration.
+    Returns True if at least one compatible GPU is found, False otherwise.
+    """
+    return bool(compatible_gpus())
 
-    Args:
-        audio_filepath: Path to the audio file.
-        chunk_duration_s: The duration of each chunk in seconds.
+def _resolve_batch_size(device: str) -> int:
+    """
+    Returns the configured batch size, or derives one from free memory when set to 'auto'.
+    """
+    if ASR_BATCH_SIZE != 'auto':
+        return ASR_BATCH_SIZE
+    if 'cuda' in device.lower() and torch.cuda.is_available():
+        free_bytes, _ = torch.cuda.mem_get_info(torch.device(device))
+        # Leave a quarter of the free memory as headroom for fragmentation.
+        return max(1, min(_MAX_AUTO_BATCH_SIZE, int(free_bytes * 0.75) // _GPU_BYTES_PER_CHUNK))
+    return _CPU_AUTO_BATCH_SIZE
+
+def _is_out_of_memory(error: Exception) -> bool:
+    if isinstance(error, (torch.cuda.OutOfMemoryError, MemoryError)):
+        return True
+    message = str(error).lower()
+    return isinstance(error, RuntimeError) and ('out of memory' in message or "can't allocate memory" in message)
 
-    Returns:
-        A list of filepaths to the created audio chunks.
+def _chunk_result(chunk, hypothesis) -> dict:
     """
-    try:
-        audio, sr = librosa.load(audio_filepath, sr=None, mono=True)
-        chunk_samples = chunk_duration_s * sr
-        num_chunks = len(audio) // chunk_samples + (1 if len(audio) % chunk_samples > 0 else 0)
-
-        temp_dir = tempfile.mkdtemp()
-        chunk_paths = []
-
-        for i in range(num_chunks):
-            start_sample = i * chunk_samples
-            end_sample = start_sample + chunk_samples
-            chunk_audio = audio[start_sample:end_sample]
-            chunk_filename = os.path.join(temp_dir, f"chunk_{i}.wav")
-            sf.write(chunk_filename, chunk_audio, sr)
-            chunk_paths.append(chunk_filename)
-        
-        return chunk_paths
+    Converts a model hypothesis into a plain dict with absolute word timings when available.
+    """
+    words = None
+    timestamp = getattr(hypothesis, 'timestamp', None) if hypothesis else None
+    if isinstance(timestamp, dict) and timestamp.get('word'):
+        words = [[w['word'], chunk.start_s + w['start'], chunk.start_s + w['end']] for w in timestamp['word']]
+    return {
+        'index': chunk.index,
+        'start_s': chunk.start_s,
+        'end_s': chunk.end_s,
+        'text': hypothesis.text if hypothesis else "",
+        'words': words,
+    }
+
+class _Checkpoint:
+    """
+    Chunk results of one audio file, saved next to it as they are produced.
 
-    except Exception as e:
-        logging.error(f"Failed to create audio chunks: {e}")
-        return []
+    The file starts with a header describing the audio and the settings that
+    determine how it is chunked and transcribed, followed by one JSON line per
+    chunk result in chunk order. A checkpoint whose header does not match the
+    current audio and settings is ignored, and a line cut short by a crash is
+    dropped along with everything after it.
+    """
 
-def _perform_transcription(audio_filepath: str, device: str) -> str:
+    def __init__(self, audio_filepath: str, timestamps: bool):
+        self.path = _checkpoint_path(audio_filepath)
+        self.header = {
+            'audio_size': os.path.getsize(audio_filepath),
+            'settings': [model_manager.MODEL_NAME, CHUNK_DURATION_S, CHUNK_OVERLAP_S, CUT_AT_SILENCE,
+                         VAD_THRESHOLD_DB, VAD_MIN_SILENCE_S, timestamps],
+        }
+
+    def load(self) -> list[dict]:
+        """Returns the saved results of chunks 0..n-1, starting a new checkpoint if there are none to resume."""
+        results = []
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                if json.loads(f.readline() or 'null') == self.header:
+                    for line in f:
+                        result = json.loads(line)
+                        if result.get('index') != len(results):
+                            break
+                        results.append(result)
+        except FileNotFoundError:
+            pass
+        except ValueError:
+            pass  # Truncated last line; the results before it are still good
+        # Rewrite the file so it holds exactly what is resumed from, under the current header
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                f.write(json.dumps(self.header) + "\n")
+                f.writelines(json.dumps(result) + "\n" for result in results)
+        except OSError as e:
+            logging.warning(f"Cannot write transcription checkpoint '{self.path}': {e}. Continuing without one.")
+            self.path = None
+        return results
+
+    def append(self, results: list[dict]) -> None:
+        if self.path is None:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.writelines(json.dumps(result) + "\n" for result in results)
+
+def _checkpoint_path(audio_filepath: str) -> str:
+    return os.path.splitext(audio_filepath)[0] + '.chunks.jsonl'
+
+def _transcribe_in_batches(asr_model, audio_chunks, device: str, batch_size: int, timestamps: bool = False,
+                           on_results=None) -> list[dict]:
     """
-    Performs audio transcription using the specified device ('cuda' or 'cpu').
+    Transcribes the chunks several at a time, keeping the output in chunk order.
+
+    `audio_chunks` may be a lazy iterator; only one batch of chunks is pulled
+    from it at a time. If a batch runs out of memory, the batch size is halved
+    and the same chunks are retried; the smaller size is kept for the remaining
+    chunks. Only an OOM at batch size 1 is raised to the caller.
+
+    `on_results`, if given, is called with the results of each batch as soon as it is done.
+
+    Returns:
+        One result dict per chunk (see `_chunk_result`), in the same order as `audio_chunks`.
+    """
+    chunk_iter = iter(audio_chunks)
+    pending = []
+    results = []
+    while True:
+        pending.extend(itertools.islice(chunk_iter, max(0, batch_size - len(pending))))
+        if not pending:
+            break
+        batch = pending[:batch_size]
+        try:
+            transcriptions = asr_model.transcribe(audio=[chunk.samples for chunk in batch], batch_size=len(batch),
+                                                  timestamps=timestamps, verbose=False)
+        except Exception as e:
+            if not _is_out_of_memory(e) or batch_size == 1:
+                raise
+            if 'cuda' in device.lower() and torch.cuda.is_available():
+                torch.cuda.empty_cache()
+            batch_size = max(1, batch_size // 2)
+            logging.warning(f"Out of memory on {device.upper()}, retrying with batch size {batch_size}.")
+            continue
+        batch_results = [_chunk_result(chunk, hypothesis) for chunk, hypothesis in zip(batch, transcriptions)]
+        results.extend(batch_results)
+        if on_results is not None:
+            on_results(batch_results)
+        del pending[:len(batch)]
+    return results
+
+def _until_cancelled(audio_chunks, cancel_event):
+    """Passes chunks through, raising CancelledError instead of handing out the next one once `cancel_event` is set."""
+    for chunk in audio_chunks:
+        if cancel_event.is_set():
+            raise CancelledError()
+        yield chunk
+
+def _perform_transcription(audio_filepath: str, device: str, stats: dict = None, text_sink=None,
+                           cancel_event=None) -> str:
+    """
+    Performs audio transcription using the specified device ('cuda:N' or 'cpu'),
+    or 'pool' for the multi-device worker pool.
+
+    With transcription-checkpoints enabled, every chunk result is saved to a
+    checkpoint next to the audio file as soon as it is produced, and a run
+    that finds a checkpoint for the same audio and settings only transcribes
+    the chunks after the last saved one. A CPU retry after a GPU failure, or a
+    later run for the same video (which downloads into the same directory, see
+    download.work_dir), therefore picks up where the failed attempt stopped.
 
     Args:
         audio_filepath: Path to the audio file.
-        device: The compute device to use ('cuda' or 'cpu').
+        device: The compute device to use ('cuda:N', 'cpu' or 'pool').
+        stats: Optional dict that receives model load, warm-up and inference timings.
+        text_sink: Optional object whose `add(text)` receives the text of each batch of chunks as it is transcribed.
+        cancel_event: Optional threading.Event; once set, no further chunks are
+            transcribed and CancelledError is raised. The checkpoint is kept.
 
     Returns:
         The transcribed text, or an empty string if transcription fails.
     """
-    logging.info(f"Loading Parakeet model for transcription on {device.upper()}...")
+    if stats is None:
+        stats = {}
     try:
-        # Load the pre-trained EncDecRNNTBPEModel
-        asr_model = nemo_asr.models.EncDecRNNTBPEModel.from_pretrained(model_name="nvidia/parakeet-tdt-0.6b-v2")
-        asr_model.to(device) 
-
-        logging.info("Creating audio chunks to manage memory...")
-        audio_chunks = _create_audio_chunks(audio_filepath)
-        if not audio_chunks:
-            return ""
-
-        logging.info(f"Starting transcription on {device.upper()}...")
-        full_transcription = ""
-        for chunk_path in audio_chunks:
-            transcriptions = asr_model.transcribe(audio=[chunk_path], batch_size=1)
-            if transcriptions and transcriptions[0]:
-                full_transcription += transcriptions[0].text + " "
-
-        # Clean up temporary chunk files
-        shutil.rmtree(os.path.dirname(audio_chunks[0]))
-
-        logging.info(f"Transcription on {device.upper()} completed successfully.")
+        if device == 'pool':
+            pool = worker_pool.get_pool()
+            # Sized for the smallest local GPU; workers still halve batches that run out of memory
+            local_gpus = [worker.device for worker in pool.workers if worker.device and 'cuda' in worker.device]
+            batch_size = min(map(_resolve_batch_size, local_gpus or ['cpu']))
+        else:
+            batch_size = _resolve_batch_size(device)
+        start = time.perf_counter()
+        # Chunks are decoded lazily, so audio decoding overlaps with inference.
+        vad_info = {}
+        audio_chunks = iter_audio_chunks(audio_filepath, CHUNK_DURATION_S, CHUNK_OVERLAP_S, CUT_AT_SILENCE,
+                                         vad_threshold_db=VAD_THRESHOLD_DB, vad_min_silence_s=VAD_MIN_SILENCE_S,
+                                         vad_info=vad_info)
+        # Word timestamps are only needed to merge overlapping windows.
+        timestamps = CHUNK_OVERLAP_S > 0
+
+        checkpoint = _Checkpoint(audio_filepath, timestamps) if TRANSCRIPTION_CHECKPOINTS else None
+        resumed = checkpoint.load() if checkpoint is not None else []
+        stats['chunks_resumed'] = len(resumed)
+        if resumed:
+            logging.info(f"Resuming transcription after {len(resumed)} chunks saved by an earlier attempt.")
+            # Chunks are still decoded in full so they are cut as before and the skipped audio covers the whole file
+            audio_chunks = (chunk for chunk in audio_chunks if chunk.index >= len(resumed))
+        if cancel_event is not None:
+            audio_chunks = _until_cancelled(audio_chunks, cancel_event)
+
+        def on_results(batch_results):
+            if checkpoint is not None:
+                checkpoint.append(batch_results)
+            if text_sink is not None:
+                # Passed on as transcribed; only the returned transcript has overlapping windows merged
+                text_sink.add(" ".join(r['text'] for r in batch_results if r['text']))
+
+        if resumed and text_sink is not None:
+            text_sink.add(" ".join(r['text'] for r in resumed if r['text']))
+
+        # Pool workers and the shared GPU worker load the model inside the timed section
+        load_in_timed_section = True
+        if device == 'pool':
+            logging.info(f"Starting transcription on the ASR worker pool ({len(pool.workers)} workers) with batch "
+                         f"size {batch_size}...")
+            results = resumed + pool.transcribe(audio_chunks, batch_size, timestamps, stats, on_results)
+        elif device == 'cpu' and cpu_pool.CPU_WORKERS > 1:
+            pool = cpu_pool.get_pool()
+            logging.info(f"Starting transcription on {pool.workers} CPU workers with batch size {batch_size}...")
+            results = resumed + pool.transcribe(audio_chunks, batch_size, timestamps, stats, on_results)
+        elif device != 'cpu' and gpu_batcher.SHARED_GPU_BATCHING:
+            logging.info(f"Starting transcription on the shared {device.upper()} worker with batches of up to "
+                         f"{batch_size} chunks...")
+            batcher = gpu_batcher.get_batcher(device)
+            results = resumed + batcher.transcribe(audio_chunks, batch_size, timestamps, stats, on_results)
+        else:
+            load_in_timed_section = False
+            with model_manager.manager.acquire(device, stats) as asr_model:
+                start = time.perf_counter()
+                logging.info(f"Starting transcription on {device.upper()} with batch size {batch_size}...")
+                results = resumed + _transcribe_in_batches(asr_model, audio_chunks, device, batch_size, timestamps,
+                                                           on_results)
+
+        if vad_info.get('offset_map'):
+            # Chunks (and checkpointed results) are timed on the condensed timeline; merge on the recording's
+            results = to_source_timeline(results, vad_info['offset_map'])
+        full_transcription = merge_chunk_results(results)
+        if 'total_s' in vad_info:
+            stats['audio_total_s'] = vad_info['total_s']
+            stats['audio_skipped_s'] = vad_info['skipped_s']
+        stats['inference_s'] = time.perf_counter() - start
+        if load_in_timed_section:
+            stats['inference_s'] -= stats['model_load_s'] + stats['warmup_s']
+        stats['device'] = device
+        stats['batch_size'] = batch_size
+
+        if 'audio_skipped_s' in stats:
+            logging.info(f"Voice activity filter skipped {stats['audio_skipped_s']:.1f}s of "
+                         f"{stats['audio_total_s']:.1f}s of audio.")
+        logging.info(f"Transcription on {device.upper()} completed successfully "
+                     f"(load {stats['model_load_s']:.2f}s, warm-up {stats['warmup_s']:.2f}s, "
+                     f"inference {stats['inference_s']:.2f}s).")
         return full_transcription.strip()
 
+    except CancelledError:
+        logging.info(f"Transcription on {device.upper()} cancelled.")
+        raise
     except Exception as e:
         logging.error(f"An error occurred during transcription on {device.upper()}: {e}")
         # Clean up memory if a CUDA error occurs
@@ -123,47 +364,64 @@ def _perform_transcription(audio_filepath: str, device: str) -> str:
             torch.cuda.empty_cache()
         raise  # Re-raise the exception to be caught by the calling function
 
-def _ensure_nltk_data():
-    """
-    Ensure NLTK 'punkt' tokenizer is downloaded.
+def warm_up() -> dict:
     """
-    try:
-        nltk.data.find('tokenizers/punkt')
-    except LookupError:
-        logging.info("NLTK 'punkt' not found. Downloading...")
-        nltk.download('punkt', quiet=True)
+    Loads the ASR model on the preferred device ahead of the first job.
 
-def format_text_into_paragraphs(text: str, sentences_per_paragraph: int = 5) -> str:
-    """
-    Formats a long string of text into paragraphs.
+    Returns:
+        The model load and warm-up timings.
     """
-    if not text.strip():
-        return ""
-    _ensure_nltk_data()
-    sentences = nltk.sent_tokenize(text)
-    paragraphs = [" ".join(sentences[i:i+sentences_per_paragraph]) 
-                  for i in range(0, len(sentences), sentences_per_paragraph)]
-    return "\n\n".join(paragraphs)
+    pool = worker_pool.get_pool()
+    if pool is not None:
+        return pool.warm_up()
+    gpus = compatible_gpus()
+    device = gpus[0] if gpus else 'cpu'
+    try:
+        return model_manager.manager.warm_up(device)
+    except Exception as e:
+        logging.error(f"Model warm-up on {device.upper()} failed: {e}")
+        return {}
 
-def transcribe_audio(audio_filepath: str, video_title: str, transcribed_output_dir: str) -> str:
+def transcribe_audio(audio_filepath: str, video_title: str, transcribed_output_dir: str, stats: dict = None,
+                     output_filepath: str = None, text_sink=None, cancel_event=None) -> str:
     """
-    Transcribes an audio file, attempting GPU first and falling back to CPU.
+    Transcribes an audio file, attempting the worker pool or GPU first and falling back to CPU.
     Saves the transcribed text to a Markdown file in the specified output directory.
+    The audio file is left in place; removing it is up to the caller.
 
     Args:
         audio_filepath: The path to the audio file to transcribe.
         video_title: The title of the video, used for naming the output file.
         transcribed_output_dir: The directory where the transcribed text will be saved.
+        stats: Optional dict that receives the device used and the model load,
+            warm-up and inference timings of the successful attempt.
+        output_filepath: Where to save the transcript. Defaults to the sanitized
+            title with a .md extension inside `transcribed_output_dir`.
+        text_sink: Optional object that receives the transcript while it is
+            produced: `add(text)` for each batch of chunks, in order, and
+            `reset()` if transcription starts over on the CPU after a GPU failure.
+        cancel_event: Optional threading.Event that stops transcription between
+            chunks when set; CancelledError is then raised and there is no CPU retry.
 
     Returns:
         The transcribed text.
     """
     transcribed_text = None
 
-    # Attempt transcription on GPU if compatible
-    if _check_gpu_compatibility():
+    # Several devices or remote workers go through the pool, a single compatible GPU is used directly
+    if worker_pool.get_pool() is not None:
+        try:
+            transcribed_text = _perform_transcription(audio_filepath, 'pool', stats, text_sink, cancel_event)
+        except CancelledError:
+            raise
+        except Exception as e:
+            logging.warning(f"Worker pool transcription failed. Falling back to CPU. Error: {e}")
+    elif _check_gpu_compatibility():
         try:
-            transcribed_text = _perform_transcription(audio_filepath, 'cuda')
+            transcribed_text = _perform_transcription(audio_filepath, compatible_gpus()[0], stats, text_sink,
+                                                      cancel_event)
+        except CancelledError:
+            raise
         except Exception as e:
             logging.warning(f"GPU transcription failed. Falling back to CPU. Error: {e}")
     else:
@@ -171,59 +429,35 @@ def transcribe_audio(audio_filepath: str, video_title: str, transcribed_output_d
 
     # Fallback to CPU if GPU is not compatible or failed
     if transcribed_text is None:
+        if text_sink is not None:
+            text_sink.reset()
         try:
-            transcribed_text = _perform_transcription(audio_filepath, 'cpu')
+            transcribed_text = _perform_transcription(audio_filepath, 'cpu', stats, text_sink, cancel_event)
+        except CancelledError:
+            raise
         except Exception as e:
             logging.critical(f"CPU transcription also failed. Error: {e}")
             return ""  # Return empty string on critical failure
 
     if transcribed_text:
-        logging.info("Formatting transcribed text into paragraphs.")
-        formatted_text = format_text_into_paragraphs(transcribed_text)
-
-        # Sanitize video_title for use as a filename
-        sanitized_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        output_filename = os.path.join(transcribed_output_dir, f"{sanitized_title}.md")
+        output_filename = output_filepath
+        if output_filename is None:
+            # Sanitize video_title for use as a filename
+            sanitized_title = "".join(c for c in video_title if c.isalnum() or c in (' ', '-', '_')).rstrip()
+            output_filename = os.path.join(transcribed_output_dir, f"{sanitized_title}.md")
 
-        os.makedirs(transcribed_output_dir, exist_ok=True)
-        
         logging.info(f"Saving transcription to {output_filename}")
         try:
-            with open(output_filename, 'w', encoding='utf-8') as f:
-                f.write(f"# Transcription of {video_title}\n\n")
-                f.write(formatted_text)
+            write_transcript(output_filename, video_title, transcribed_text)
             logging.info("Transcription saved.")
+            # The transcript is saved, so the chunk results are no longer needed
+            try:
+                os.remove(_checkpoint_path(audio_filepath))
+            except FileNotFoundError:
+                pass
         except IOError as e:
             logging.error(f"Failed to write to file {output_filename}: {e}")
             # Do not exit, just log the error, as transcription itself might have succeeded
-
-        # Delete all .wav files from the input directory after successful transcription
-        try:
-            # Extract the directory from the audio_filepath
-            input_directory = os.path.dirname(audio_filepath)
-            if not input_directory:
-                input_directory = "."  # Use current directory if no path is specified
-                
-            # Find all .wav files in the input directory
-            wav_files = [f for f in os.listdir(input_directory) if f.lower().endswith('.wav')]
-            
-            if wav_files:
-                logging.info(f"Found {len(wav_files)} .wav file(s) in {input_directory}")
-                deleted_count = 0
-                for filename in wav_files:
-                    file_path = os.path.join(input_directory, filename)
-                    try:
-                        os.remove(file_path)
-                        logging.info(f"Deleted .wav file: {file_path}")
-                        deleted_count += 1
-                    except Exception as e:
-                        logging.error(f"Failed to delete file {file_path}: {e}")
-                
-                logging.info(f"Successfully deleted {deleted_count} of {len(wav_files)} .wav files")
-            else:
-                logging.info(f"No .wav files found in {input_directory}")
-        except Exception as e:
-            logging.error(f"Failed to process .wav files in directory {input_directory}: {e}")
     else:
         logging.error("Transcription resulted in empty text. No output file will be created.")
         
@@ -20,7 +20,8 @@ warnings.filterwarnings('ignore', message='.*CUDA.*')
 warnings.filterwarnings('ignore', message='.*conditional node support.*')
 
 # Now import the transcription functionality
-from transcribe import transcribe_audio, format_text_into_paragraphs
+from transcribe import transcribe_audio
+from transcript import format_text_into_paragraphs
 
 # Make the functions available when this module is imported
 __all__ = ['transcribe_audio', 'format_text_into_paragraphs']
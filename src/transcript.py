@@ -0,0 +1,102 @@
+import os
+import logging
+import nltk
+
+from audio import to_source_time
+
+# The Markdown transcript format shared by ASR and caption transcripts: a
+# title line, an empty line, then the text in paragraphs of a few sentences.
+# Also joins the per-chunk ASR results into one text.
+
+def _ensure_nltk_data():
+    """
+    Ensure NLTK 'punkt' tokenizer is downloaded.
+    """
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        logging.info("NLTK 'punkt' not found. Downloading...")
+        nltk.download('punkt', quiet=True)
+
+def format_text_into_paragraphs(text: str, sentences_per_paragraph: int = 5) -> str:
+    """
+    Formats a long string of text into paragraphs.
+    """
+    if not text.strip():
+        return ""
+    _ensure_nltk_data()
+    sentences = nltk.sent_tokenize(text)
+    paragraphs = [" ".join(sentences[i:i+sentences_per_paragraph])
+                  for i in range(0, len(sentences), sentences_per_paragraph)]
+    return "\n\n".join(paragraphs)
+
+def write_transcript(filepath: str, video_title: str, text: str) -> None:
+    """Saves a transcript as Markdown, creating the directory if needed. Raises IOError."""
+    os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(f"# Transcription of {video_title}\n\n")
+        f.write(format_text_into_paragraphs(text))
+
+def read_transcript(filepath: str) -> str:
+    """Returns the text of a transcript written by `write_transcript`, without its title. Raises FileNotFoundError."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        # Skip the first two lines (title and empty line)
+        f.readline()
+        f.readline()
+        return f.read()
+
+def _normalize_word(word: str) -> str:
+    return "".join(c for c in word.lower() if c.isalnum())
+
+def _drop_repeated_prefix(previous_words: list[str], words: list[str], max_words: int = 30) -> list[str]:
+    """
+    Removes the longest prefix of `words` that repeats the end of `previous_words`.
+    Used to merge overlapping chunks when no word timestamps are available.
+    """
+    previous = [_normalize_word(w) for w in previous_words[-max_words:]]
+    current = [_normalize_word(w) for w in words[:max_words]]
+    for n in range(min(len(previous), len(current)), 0, -1):
+        if previous[-n:] == current[:n]:
+            return words[n:]
+    return words
+
+def to_source_timeline(results: list[dict], offset_map: list) -> list[dict]:
+    """
+    Returns copies of chunk results with their times moved from the silence-skipped
+    timeline back to the original recording (see audio.to_source_time).
+    """
+    return [dict(result,
+                 start_s=to_source_time(offset_map, result['start_s']),
+                 end_s=to_source_time(offset_map, result['end_s']),
+                 words=[[word, to_source_time(offset_map, start), to_source_time(offset_map, end)]
+                        for word, start, end in result['words']] if result['words'] is not None else None)
+            for result in results]
+
+def merge_chunk_results(results: list[dict]) -> str:
+    """
+    Joins per-chunk transcripts, removing text duplicated by overlapping windows.
+
+    With word timestamps, each overlap is split at its midpoint: the earlier
+    chunk keeps the words centred before it and the later chunk the words after
+    it, so a word cut at one chunk's edge is taken from the chunk where it is
+    complete. Without timestamps, the longest repeated word sequence at the
+    boundary is dropped from the later chunk.
+    """
+    merged = []
+    for i, result in enumerate(results):
+        previous = results[i - 1] if i > 0 else None
+        following = results[i + 1] if i + 1 < len(results) else None
+        overlaps_previous = previous is not None and result['start_s'] < previous['end_s']
+
+        if result['words'] is not None and (previous is None or previous['words'] is not None):
+            lower = (result['start_s'] + previous['end_s']) / 2 if overlaps_previous else float('-inf')
+            upper = float('inf')
+            if following is not None and following['start_s'] < result['end_s'] and following['words'] is not None:
+                upper = (following['start_s'] + result['end_s']) / 2
+            merged.extend(w for w, start, end in result['words'] if lower <= (start + end) / 2 < upper)
+        else:
+            words = result['text'].split()
+            if overlaps_previous:
+                words = _drop_repeated_prefix(merged, words)
+            merged.extend(words)
+    return " ".join(merged)
@@ -0,0 +1,473 @@
+"""
+Transcription across several devices: local GPUs and remote workers.
+
+Usage:
+    python worker_pool.py serve --device cuda:0 [--host 127.0.0.1] [--port 6001]
+    python worker_pool.py status
+
+`serve` runs a worker for one device of this machine that other machines
+list in asr-remote-workers. `status` checks every configured worker once.
+
+Requests and replies are pickled, and unpickling data from an untrusted peer
+runs arbitrary code, so the only protection is the shared asr-worker-authkey.
+Neither side talks to the other unless that key is set; there is no default.
+
+Each worker holds one model replica. Jobs split their audio into batches of
+chunks that go into one queue shared by all workers, so faster devices simply
+take more batches. A worker whose batch fails is taken out of rotation and its
+batch handed to another; a periodic health check brings it back once it
+answers again. Listing pseudo-devices such as 'cpu:0,cpu:1' in asr-devices
+runs the same scheduling with one CPU replica per entry, which is how the
+pool can be exercised on a machine without GPUs.
+"""
+import os
+import sys
+import time
+import logging
+import argparse
+import itertools
+import threading
+import configparser
+from collections import deque
+from multiprocessing.connection import Client, Listener
+
+import numpy as np
+
+# Add the src directory to the Python path
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from audio import MODEL_SAMPLE_RATE, AudioChunk
+
+DEFAULT_PORT = 6001
+
+
+def load_config():
+    config = configparser.ConfigParser()
+    config_path = os.path.join(os.path.dirname(__file__), 'config.ini')
+    if not os.path.exists(config_path):
+        print(f"Error: Configuration file '{config_path}' not found.")
+        sys.exit(1)
+    config.read(config_path)
+
+    # 'auto' uses every compatible local GPU; otherwise a list such as 'cuda:0,cuda:2' or 'cpu:0,cpu:1'
+    devices = config['youtubedl'].get('asr-devices', 'auto').strip('"').strip()
+    remote_workers = [address.strip() for address in
+                      config['youtubedl'].get('asr-remote-workers', '').strip('"').split(',') if address.strip()]
+    # Must be set explicitly (and kept secret) before serving or using remote workers
+    authkey = config['youtubedl'].get('asr-worker-authkey', '').strip('"').strip()
+    try:
+        health_check_interval_s = float(config['youtubedl'].get('asr-health-check-interval', '30').strip('"'))
+        remote_timeout_s = float(config['youtubedl'].get('asr-remote-timeout', '600').strip('"'))
+    except ValueError:
+        logging.warning("Invalid value for asr-health-check-interval or asr-remote-timeout in configuration. "
+                        "Using 30 and 600 seconds.")
+        health_check_interval_s, remote_timeout_s = 30.0, 600.0
+    return (devices, remote_workers, authkey.encode('utf-8'), max(1.0, health_check_interval_s),
+            max(1.0, remote_timeout_s))
+
+ASR_DEVICES, REMOTE_WORKERS, AUTHKEY, HEALTH_CHECK_INTERVAL_S, REMOTE_TIMEOUT_S = load_config()
+
+_NO_AUTHKEY_ERROR = ("asr-worker-authkey is not set. Remote workers exchange pickled data, so they are only used "
+                     "with a secret key shared by both sides.")
+
+
+def _silence_chunk() -> AudioChunk:
+    return AudioChunk(0, 0.0, np.zeros(MODEL_SAMPLE_RATE, dtype=np.float32))
+
+
+class LocalDeviceWorker:
+    """Runs batches on one device of this machine through the shared model manager."""
+
+    def __init__(self, device: str):
+        self.device = device
+        self.name = device
+        self.healthy = True
+        self.busy = False
+        self.last_error = None
+
+    def transcribe_batch(self, chunks: list, timestamps: bool) -> tuple[list[dict], dict]:
+        """Returns one result per chunk, in order, and the model load timings of this call."""
+        import model_manager
+        import transcribe
+
+        stats = {}
+        with model_manager.manager.acquire(self.device, stats) as asr_model:
+            results = transcribe._transcribe_in_batches(asr_model, chunks, self.device, len(chunks), timestamps)
+        return results, stats
+
+    def ping(self) -> dict:
+        """
+        Transcribes a second of silence, loading the model if needed. Raises if the device does not work.
+
+        Returns:
+            The model load timings of the call, which are zero if the model was already loaded.
+        """
+        return self.transcribe_batch([_silence_chunk()], False)[1]
+
+    def is_alive(self) -> bool:
+        # Failures of a device in this process show up as failed batches
+        return True
+
+
+class RemoteWorker:
+    """
+    A worker on another machine (or process) started with `python worker_pool.py serve`.
+
+    Requests go over one authenticated multiprocessing connection, opened on
+    first use and reopened after a failure. A reply that does not arrive within
+    `timeout_s` counts as a failure.
+    """
+
+    def __init__(self, address: str, authkey: bytes = AUTHKEY, timeout_s: float = REMOTE_TIMEOUT_S):
+        if not authkey:
+            raise ValueError(_NO_AUTHKEY_ERROR)
+        host, _, port = address.rpartition(':')
+        self.address = (host or 'localhost', int(port or DEFAULT_PORT))
+        self.authkey = authkey
+        self.timeout_s = timeout_s
+        self.device = None  # Whatever the remote side serves
+        self.name = f"{self.address[0]}:{self.address[1]}"
+        self.healthy = True
+        self.busy = False
+        self.last_error = None
+        self._conn = None
+        self._lock = threading.Lock()
+
+    def _request(self, message: tuple, timeout_s: float):
+        with self._lock:
+            try:
+                if self._conn is None:
+                    self._conn = Client(self.address, authkey=self.authkey)
+                self._conn.send(message)
+                if not self._conn.poll(timeout_s):
+                    raise TimeoutError(f"No reply from {self.name} within {timeout_s:g}s.")
+                status, payload = self._conn.recv()
+            except BaseException:
+                # A late reply must not be read as the answer to the next request
+                if self._conn is not None:
+                    self._conn.close()
+                    self._conn = None
+                raise
+        if status != 'ok':
+            raise RuntimeError(f"{self.name}: {payload}")
+        return payload
+
+    def transcribe_batch(self, chunks: list, timestamps: bool) -> tuple[list[dict], dict]:
+        return self._request(('transcribe', chunks, timestamps), self.timeout_s)
+
+    def ping(self) -> dict:
+        # Loading the model on a cold worker can take a while
+        return self._request(('ping',), min(self.timeout_s, 300.0))
+
+    def is_alive(self) -> bool:
+        """Checks that the worker answers, without touching its model (so it can still unload when idle)."""
+        try:
+            self._request(('alive',), 10.0)
+            return True
+        except Exception as e:
+            self.last_error = str(e) or type(e).__name__
+            return False
+
+
+class WorkerPool:
+    """
+    Schedules batches of chunks from all concurrent transcriptions across workers.
+
+    Every worker has a thread that takes the oldest queued batch whenever it
+    is free, adding further queued batches (from any job) while they fit in one
+    batch of the first one's size. Each job keeps at most two batches per
+    healthy worker queued or running, so a long video cannot crowd out jobs
+    that arrive after it. A batch that fails takes its worker out of rotation
+    and goes back to the front of the queue; it fails its job once as many
+    different workers as the pool has have failed it, or when no healthy worker is left.
+    """
+
+    def __init__(self, workers: list, health_check_interval_s: float = HEALTH_CHECK_INTERVAL_S):
+        self.workers = workers
+        self.health_check_interval_s = health_check_interval_s
+        self._queue = deque()  # [job, batch number, chunks, timestamps, batch size, failed worker names]
+        self._cond = threading.Condition()
+        for worker in workers:
+            threading.Thread(target=self._serve, args=(worker,), name=f'asr-worker-{worker.name}', daemon=True).start()
+        threading.Thread(target=self._check_health, name='asr-worker-health', daemon=True).start()
+        logging.info(f"Started ASR worker pool: {', '.join(worker.name for worker in workers)}.")
+
+    def _healthy_count(self) -> int:
+        return sum(worker.healthy for worker in self.workers)
+
+    def transcribe(self, audio_chunks, batch_size: int, timestamps: bool = False, stats: dict = None,
+                   on_results=None) -> list[dict]:
+        """
+        Transcribes chunks on the pool, blocking until all are done.
+
+        Args:
+            audio_chunks: Iterable of AudioChunk, possibly lazy.
+            batch_size: Chunks per batch sent to a worker.
+            timestamps: Whether to request word timestamps.
+            stats: Optional dict that receives the slowest model load and warm-up, and the workers used.
+            on_results: Optional callable that receives results, in chunk order, as they come in.
+
+        Returns:
+            One result dict per chunk, in chunk order. Raises if a batch could not be transcribed anywhere.
+        """
+        job = {'results': {}, 'delivered': 0, 'submitted': 0, 'error': None, 'workers': set(),
+               'load': {'model_load_s': 0.0, 'warmup_s': 0.0}}
+        chunk_iter = iter(audio_chunks)
+        exhausted = False
+        results = []
+        try:
+            while True:
+                while not exhausted and job['submitted'] - job['delivered'] < 2 * max(1, self._healthy_count()):
+                    chunks = list(itertools.islice(chunk_iter, batch_size))
+                    if not chunks:
+                        exhausted = True
+                        break
+                    with self._cond:
+                        if not self._healthy_count():
+                            raise RuntimeError("No healthy ASR workers are available.")
+                        self._queue.append([job, job['submitted'], chunks, timestamps, batch_size, set()])
+                        job['submitted'] += 1
+                        self._cond.notify_all()
+
+                with self._cond:
+                    while (job['error'] is None and job['delivered'] not in job['results']
+                           and job['delivered'] < job['submitted']
+                           and (exhausted or job['submitted'] - job['delivered'] >= 2 * max(1, self._healthy_count()))):
+                        self._cond.wait()
+                    if job['error'] is not None:
+                        raise job['error']
+                    new_results = []
+                    while job['delivered'] in job['results']:
+                        new_results.extend(job['results'].pop(job['delivered']))
+                        job['delivered'] += 1
+                    finished = exhausted and job['delivered'] == job['submitted']
+
+                if new_results:
+                    results.extend(new_results)
+                    if on_results is not None:
+                        on_results(new_results)
+                if finished:
+                    break
+        finally:
+            with self._cond:
+                for item in [item for item in self._queue if item[0] is job]:
+                    self._queue.remove(item)
+
+        if stats is not None:
+            stats.update(job['load'])
+            stats['workers'] = sorted(job['workers'])
+        return results
+
+    def _take(self) -> list:
+        """Takes the oldest queued batch plus any later ones that fit with it. Caller must hold the condition."""
+        first = self._queue.popleft()
+        items, size = [first], len(first[2])
+        for item in list(self._queue):
+            if item[3] == first[3] and size + len(item[2]) <= first[4]:
+                self._queue.remove(item)
+                items.append(item)
+                size += len(item[2])
+        return items
+
+    def _serve(self, worker) -> None:
+        while True:
+            with self._cond:
+                while not (worker.healthy and not worker.busy and self._queue):
+                    self._cond.wait()
+                items = self._take()
+                worker.busy = True
+
+            try:
+                results, load_stats = worker.transcribe_batch([chunk for item in items for chunk in item[2]], items[0][3])
+                error = None
+            except Exception as e:
+                error = e
+
+            with self._cond:
+                worker.busy = False
+                if error is None:
+                    offset = 0
+                    for job, number, chunks, *_ in items:
+                        job['results'][number] = results[offset:offset + len(chunks)]
+                        offset += len(chunks)
+                        job['workers'].add(worker.name)
+                        for key in job['load']:
+                            job['load'][key] = max(job['load'][key], load_stats.get(key, 0.0))
+                else:
+                    worker.healthy = False
+                    worker.last_error = str(error) or type(error).__name__
+                    logging.warning(f"ASR worker {worker.name} failed and is out of rotation until it passes a "
+                                    f"health check: {worker.last_error}")
+                    for item in reversed(items):
+                        item[5].add(worker.name)
+                        if len(item[5]) >= len(self.workers):
+                            item[0]['error'] = item[0]['error'] or error
+                        else:
+                            self._queue.appendleft(item)
+                    self._fail_if_no_workers()
+                self._cond.notify_all()
+
+    def _fail_if_no_workers(self) -> None:
+        """Fails every queued batch if no worker is in rotation. Caller must hold the condition."""
+        if not self._healthy_count():
+            for item in self._queue:
+                item[0]['error'] = item[0]['error'] or RuntimeError("No healthy ASR workers are left.")
+            self._queue.clear()
+
+    def _check_health(self) -> None:
+        """
+        Every `health_check_interval_s`, pings workers out of rotation and puts
+        those that answer back in; idle remote workers are checked for a reply
+        so one that went away is taken out before a job's batch runs into it.
+        """
+        while True:
+            time.sleep(self.health_check_interval_s)
+            for worker in self.workers:
+                with self._cond:
+                    if worker.busy:
+                        continue  # Working, so evidently reachable
+                    worker.busy = True
+                    was_healthy = worker.healthy
+                try:
+                    if was_healthy:
+                        healthy = worker.is_alive()
+                    else:
+                        worker.ping()
+                        healthy = True
+                except Exception as e:
+                    worker.last_error = str(e) or type(e).__name__
+                    healthy = False
+                with self._cond:
+                    worker.busy = False
+                    if healthy and not was_healthy:
+                        logging.info(f"ASR worker {worker.name} passed its health check and is back in rotation.")
+                        worker.last_error = None
+                    elif was_healthy and not healthy:
+                        logging.warning(f"ASR worker {worker.name} failed its health check: {worker.last_error}")
+                    worker.healthy = healthy
+                    self._fail_if_no_workers()
+                    self._cond.notify_all()
+
+    def warm_up(self) -> dict:
+        """Loads the model on every worker and returns the slowest load and warm-up times."""
+        timings = {'model_load_s': 0.0, 'warmup_s': 0.0}
+        for worker in self.workers:
+            try:
+                load_stats = worker.ping()
+            except Exception as e:
+                logging.error(f"Warm-up of ASR worker {worker.name} failed: {e}")
+                continue
+            for key in timings:
+                timings[key] = max(timings[key], load_stats.get(key, 0.0))
+        return timings
+
+    def status(self) -> list[dict]:
+        with self._cond:
+            return [{'worker': worker.name, 'healthy': worker.healthy, 'busy': worker.busy,
+                     'last_error': worker.last_error} for worker in self.workers]
+
+
+_pool = None
+_pool_checked = False
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> WorkerPool:
+    """
+    Returns the process-wide pool for asr-devices and asr-remote-workers, or
+    None when they amount to a single local device, which transcribe.py then uses directly.
+    """
+    global _pool, _pool_checked
+    with _pool_lock:
+        if not _pool_checked:
+            _pool_checked = True
+            if ASR_DEVICES.lower() == 'auto':
+                import transcribe
+                devices = transcribe.compatible_gpus()
+            else:
+                devices = [device.strip() for device in ASR_DEVICES.split(',') if device.strip()]
+            workers = [LocalDeviceWorker(device) for device in devices]
+            if REMOTE_WORKERS and not AUTHKEY:
+                logging.error(f"Ignoring asr-remote-workers: {_NO_AUTHKEY_ERROR}")
+            elif REMOTE_WORKERS:
+                workers += [RemoteWorker(address) for address in REMOTE_WORKERS]
+            if len(workers) > 1 or any(isinstance(worker, RemoteWorker) for worker in workers):
+                _pool = WorkerPool(workers)
+        return _pool
+
+
+def serve(device: str, host: str, port: int) -> None:
+    """
+    Answers 'transcribe' and 'ping' requests for `device`, one thread per connection.
+    Raises ValueError if asr-worker-authkey is not set.
+    """
+    if not AUTHKEY:
+        raise ValueError(_NO_AUTHKEY_ERROR)
+    worker = LocalDeviceWorker(device)
+
+    def handle(conn):
+        with conn:
+            while True:
+                try:
+                    message = conn.recv()
+                except EOFError:
+                    return
+                try:
+                    if message[0] == 'alive':
+                        conn.send(('ok', None))
+                    elif message[0] == 'ping':
+                        conn.send(('ok', worker.ping()))
+                    elif message[0] == 'transcribe':
+                        conn.send(('ok', worker.transcribe_batch(message[1], message[2])))
+                    else:
+                        conn.send(('error', f"Unknown request '{message[0]}'."))
+                except Exception as e:
+                    logging.error(f"Request from a client failed: {e}")
+                    conn.send(('error', str(e)))
+
+    with Listener((host, port), authkey=AUTHKEY) as listener:
+        logging.info(f"ASR worker for {device.upper()} listening on {host}:{port}.")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                # Most likely a client with the wrong authkey
+                logging.warning(f"Rejected connection: {e}")
+                continue
+            threading.Thread(target=handle, args=(conn,), daemon=True).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-device ASR worker pool.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    serve_parser = subparsers.add_parser('serve', help="Run a remote worker for one device of this machine.")
+    serve_parser.add_argument('--device', default='cuda:0', help="e.g. cuda:0, cuda:1 or cpu.")
+    serve_parser.add_argument('--host', default='127.0.0.1',
+                              help="Address to listen on. Use this machine's LAN address to accept other machines.")
+    serve_parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    subparsers.add_parser('status', help="Ping every configured worker once.")
+    args = parser.parse_args()
+
+    if args.command == 'serve':
+        try:
+            serve(args.device, args.host, args.port)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+    elif args.command == 'status':
+        pool = get_pool()
+        if pool is None:
+            print("asr-devices and asr-remote-workers describe a single local device; no pool is used.")
+            return
+        for worker in pool.workers:
+            start = time.perf_counter()
+            try:
+                worker.ping()
+                print(f"{worker.name:<24} ok ({time.perf_counter() - start:.1f}s)")
+            except Exception as e:
+                print(f"{worker.name:<24} FAILED: {e}")
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    main()
@@ -0,0 +1,37 @@
+import functools
+import os
+import sys
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+# The modules under test import each other as top-level modules from src/.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'src'))
+
+
+@pytest.fixture
+def cache_index(tmp_path, monkeypatch):
+    """Points the process-wide cache index at an empty database in `tmp_path`."""
+    import cache
+    index = cache.ResultCache(str(tmp_path / 'cache.db'))
+    monkeypatch.setattr(cache, '_index', index)
+    return index
+
+
+class _QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def media_server(tmp_path):
+    """Serves files from `tmp_path / 'media'` over HTTP; yields the base URL."""
+    media_dir = tmp_path / 'media'
+    media_dir.mkdir()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), functools.partial(_QuietHandler, directory=str(media_dir)))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,24 @@
+import yt_dlp
+
+# A yt-dlp extractor for tests: it answers URLs like https://stub.invalid/watch/<id>
+# from `VIDEOS` instead of the network. Register it with download.register_extractor.
+
+# Video ID -> info dict returned by the extractor; tests fill this in.
+VIDEOS = {}
+
+# Number of extractions per video ID, to check that metadata is fetched once.
+extraction_counts = {}
+
+
+def stub_url(video_id):
+    return f"https://stub.invalid/watch/{video_id}"
+
+
+class StubIE(yt_dlp.extractor.common.InfoExtractor):
+    IE_NAME = 'stub'
+    _VALID_URL = r'https?://stub\.invalid/watch/(?P<id>\w+)'
+
+    def _real_extract(self, url):
+        video_id = self._match_id(url)
+        extraction_counts[video_id] = extraction_counts.get(video_id, 0) + 1
+        return dict(VIDEOS[video_id], id=video_id)
@@ -0,0 +1,140 @@
+import threading
+import time
+
+import pytest
+
+import batch
+import download
+import summyt
+
+
+class _Partials:
+    """Stands in for summarize.IncrementalSummarizer; only records that it was closed."""
+
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+class _StubStages:
+    """
+    Stands in for summyt's pipeline stages. Every stage start is recorded as
+    (stage, url); a stage fails for the URLs in `fail[stage]`, and transcription
+    of the URLs in `hold` waits until `release` is set.
+    """
+
+    def __init__(self):
+        self.events = []
+        self.lock = threading.Lock()
+        self.fail = {stage: set() for stage in batch.STAGES}
+        self.hold = set()
+        self.release = threading.Event()
+        self.partials = {}
+
+    def _run(self, stage, url):
+        with self.lock:
+            self.events.append((stage, url))
+        yield {'status': f'{stage} {url}', 'progress': 50}
+        if stage == 'transcribe' and url in self.hold:
+            assert self.release.wait(5)
+        if url in self.fail[stage]:
+            raise Exception(f"{stage} failed")
+
+    def download_stage(self, url, work_dir, info_dict, video_key, local=False):
+        yield from self._run('download', url)
+        return f"{url}.wav", info_dict['title'], False
+
+    def transcribe_stage(self, filepath, video_title, is_transcript_existing, video_key, partials=None, stats=None,
+                         cancel_event=None):
+        self.partials[filepath[:-len('.wav')]] = partials
+        yield from self._run('transcribe', filepath[:-len('.wav')])
+        return f"transcript of {video_title}"
+
+    def summarize_and_save(self, url, video_key, video_title, transcribed_text, transcript_source, enable_hashtag=True,
+                           partials=None, use_cache=True, **options):
+        yield from self._run('summarize', url)
+        return f"summary of {transcribed_text}"
+
+    def started(self, stage):
+        with self.lock:
+            return [url for event_stage, url in self.events if event_stage == stage]
+
+
+@pytest.fixture
+def stages(tmp_path, monkeypatch, cache_index):
+    stub = _StubStages()
+    monkeypatch.setattr(download, 'DOWNLOAD_DIR', str(tmp_path / 'input'))
+    monkeypatch.setattr(download, 'get_video_info', lambda url, local=False: {'title': f"title {url[-1]}"})
+    monkeypatch.setattr(batch.summarize, 'incremental_summarizer', lambda use_cache=True: _Partials())
+    monkeypatch.setattr(summyt, 'index_existing_outputs_once', lambda: None)
+    for name in ('download_stage', 'transcribe_stage', 'summarize_and_save'):
+        monkeypatch.setattr(summyt, name, getattr(stub, name))
+    yield stub
+    stub.release.set()
+
+
+def _videos(count):
+    return [(f"https://www.youtube.com/watch?v={letter * 11}", False) for letter in 'abcdefgh'[:count]]
+
+
+def _workers(count):
+    return {stage: count for stage in batch.STAGES}
+
+
+def test_every_video_goes_through_the_stages_in_order(stages):
+    videos = _videos(4)
+
+    report = batch.BatchRunner(videos, _workers(1), queue_size=1).run()
+
+    urls = [url for url, _ in videos]
+    assert (report['completed'], report['failed']) == (4, 0)
+    # One worker per stage takes the videos in the order given
+    assert stages.started('download') == stages.started('transcribe') == stages.started('summarize') == urls
+    for url in urls:
+        assert stages.events.index(('download', url)) < stages.events.index(('transcribe', url)) \
+            < stages.events.index(('summarize', url))
+    assert all(partials.closed for partials in stages.partials.values())
+    assert summyt._video_locks == {}
+
+
+def test_bounded_queue_holds_back_downloads_while_transcription_is_busy(stages):
+    videos = _videos(6)
+    stages.hold.add(videos[0][0])
+    runner = batch.BatchRunner(videos, _workers(1), queue_size=1)
+    thread = threading.Thread(target=runner.run)
+    thread.start()
+
+    # Transcribing the first video; the second waits in the queue; the third is downloaded and waiting to be queued
+    deadline = time.monotonic() + 5
+    while len(stages.started('download')) < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    time.sleep(0.2)
+    assert len(stages.started('download')) == 3
+    assert stages.started('transcribe') == [videos[0][0]]
+
+    stages.release.set()
+    thread.join(5)
+    assert not thread.is_alive()
+    assert len(runner.completed) == 6
+
+
+def test_failing_video_is_reported_without_stopping_the_others(stages):
+    videos = _videos(5)
+    urls = [url for url, _ in videos]
+    stages.fail['download'].add(urls[1])
+    stages.fail['transcribe'].add(urls[2])
+    stages.fail['summarize'].add(urls[3])
+
+    report = batch.BatchRunner(videos, _workers(2), queue_size=1).run()
+
+    assert sorted(report['failures']) == sorted([(urls[1], 'download', "download failed"),
+                                                 (urls[2], 'transcribe', "transcribe failed"),
+                                                 (urls[3], 'summarize', "summarize failed")])
+    assert [report['stages'][stage]['failed'] for stage in batch.STAGES] == [1, 1, 1]
+    assert sorted(stages.started('summarize')) == sorted([urls[0], urls[3], urls[4]])
+    assert report['completed'] == 2
+    # Failed videos let go of their lock and incremental summarizer
+    assert summyt._video_locks == {}
+    assert stages.partials[urls[2]].closed and stages.partials[urls[3]].closed
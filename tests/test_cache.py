@@ -0,0 +1,196 @@
+import sqlite3
+
+import pytest
+
+import cache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Replaces the cache's time.time with a clock the test moves forward."""
+    now = [1_000_000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    return now
+
+
+def _output(tmp_path, name, size=10):
+    path = tmp_path / name
+    path.write_text('x' * size, encoding='utf-8')
+    return str(path)
+
+
+def test_lookup_finds_recorded_output(tmp_path, cache_index):
+    path = _output(tmp_path, 'a.md')
+    cache_index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', path)
+
+    assert cache_index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') == path
+    assert cache_index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp2') is None
+    assert cache_index.lookup('Youtube:a', cache.STAGE_SUMMARY, 'fp1') is None
+    assert cache_index.owner(path) == 'Youtube:a'
+
+
+def test_lookup_tries_fingerprints_in_order(tmp_path, cache_index):
+    first, second = _output(tmp_path, 'first.md'), _output(tmp_path, 'second.md')
+    cache_index.record('Youtube:a', cache.STAGE_SUMMARY, 'fp1', first)
+    cache_index.record('Youtube:a', cache.STAGE_SUMMARY, 'fp2', second)
+
+    assert cache_index.lookup('Youtube:a', cache.STAGE_SUMMARY, 'missing', 'fp2', 'fp1') == second
+
+
+def test_lookup_drops_entries_whose_file_is_gone(tmp_path, cache_index):
+    path = _output(tmp_path, 'a.md')
+    cache_index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', path)
+    (tmp_path / 'a.md').unlink()
+
+    assert cache_index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') is None
+    assert cache_index.owner(path) is None
+
+
+def test_lookup_does_not_serve_expired_entries(tmp_path, clock):
+    index = cache.ResultCache(str(tmp_path / 'cache.db'), max_age_s=60)
+    path = _output(tmp_path, 'a.md')
+    index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', path)
+
+    clock[0] += 59
+    assert index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') == path
+    clock[0] += 2
+    assert index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') is None
+    assert (tmp_path / 'a.md').exists()
+
+
+def test_recording_a_file_again_replaces_its_old_entry(tmp_path, cache_index):
+    path = _output(tmp_path, 'Same Title.md')
+    cache_index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', path)
+    cache_index.record('Youtube:b', cache.STAGE_TRANSCRIPT, 'fp1', path)
+
+    assert cache_index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') is None
+    assert cache_index.owner(path) == 'Youtube:b'
+
+
+def test_relocate_follows_a_moved_file(tmp_path, cache_index):
+    old_path = _output(tmp_path, 'a-summarized.md')
+    cache_index.record('Youtube:a', cache.STAGE_SUMMARY, 'fp1', old_path, 'captions:en')
+    (tmp_path / 'Science').mkdir()
+    new_path = str(tmp_path / 'Science' / 'a-summarized.md')
+    (tmp_path / 'a-summarized.md').rename(new_path)
+
+    cache_index.relocate(old_path, new_path)
+
+    assert cache_index.lookup('Youtube:a', cache.STAGE_SUMMARY, 'fp1') == new_path
+    assert cache_index.owner(old_path) is None
+    assert cache_index.source(new_path) == 'captions:en'
+
+
+def test_evict_drops_least_recently_used_entries_but_keeps_files(tmp_path, clock):
+    index = cache.ResultCache(str(tmp_path / 'cache.db'), max_size_bytes=25)
+    a, b, c = (_output(tmp_path, f'{name}.md') for name in 'abc')
+    index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', a)
+    clock[0] += 1
+    index.record('Youtube:b', cache.STAGE_TRANSCRIPT, 'fp1', b)
+    clock[0] += 1
+    assert index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') == a  # Now more recent than b
+    clock[0] += 1
+
+    index.record('Youtube:c', cache.STAGE_TRANSCRIPT, 'fp1', c)
+
+    assert index.lookup('Youtube:b', cache.STAGE_TRANSCRIPT, 'fp1') is None
+    assert index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') == a
+    assert index.lookup('Youtube:c', cache.STAGE_TRANSCRIPT, 'fp1') == c
+    assert (tmp_path / 'b.md').exists()
+
+
+def test_evict_drops_expired_entries(tmp_path, clock):
+    index = cache.ResultCache(str(tmp_path / 'cache.db'), max_age_s=60)
+    index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', _output(tmp_path, 'a.md'))
+    clock[0] += 61
+    index.record('Youtube:b', cache.STAGE_TRANSCRIPT, 'fp1', _output(tmp_path, 'b.md'))
+
+    assert index.owner(str(tmp_path / 'a.md')) is None
+    assert index.evict() == 0
+
+
+def test_transcript_source_is_recorded(tmp_path, cache_index):
+    asr, captions = _output(tmp_path, 'asr.md'), _output(tmp_path, 'captions.md')
+    cache_index.record('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1', asr)
+    cache_index.record('Youtube:b', cache.STAGE_TRANSCRIPT, 'fp2', captions, 'captions:de')
+
+    assert cache_index.source(asr) == cache.SOURCE_ASR
+    assert cache_index.source(captions) == 'captions:de'
+    assert cache_index.source(str(tmp_path / 'unknown.md')) is None
+
+
+def test_caption_settings_only_change_caption_fingerprints(monkeypatch):
+    asr = cache.fingerprint(cache.STAGE_TRANSCRIPT)
+    from_captions = cache.fingerprint(cache.STAGE_TRANSCRIPT, 'captions:en')
+    summary = cache.fingerprint(cache.STAGE_SUMMARY, 'captions:en', enable_hashtag=True)
+
+    monkeypatch.setattr(cache, '_CAPTION_CONFIG', {'captions': 'auto', 'caption-languages': 'de,en'})
+
+    assert cache.fingerprint(cache.STAGE_TRANSCRIPT) == asr
+    assert cache.fingerprint(cache.STAGE_TRANSCRIPT, 'captions:en') != from_captions
+    assert cache.fingerprint(cache.STAGE_SUMMARY, 'captions:en', enable_hashtag=True) != summary
+    assert from_captions != asr
+
+
+def test_accepted_fingerprints_include_captions_only_when_on():
+    asr = cache.fingerprint(cache.STAGE_SUMMARY, enable_hashtag=False)
+    from_captions = cache.fingerprint(cache.STAGE_SUMMARY, 'captions:en', enable_hashtag=False)
+
+    assert cache.accepted_fingerprints(cache.STAGE_SUMMARY, False, enable_hashtag=False) == [asr]
+    assert cache.accepted_fingerprints(cache.STAGE_SUMMARY, True, enable_hashtag=False) == [asr, from_captions]
+
+
+def test_index_without_source_column_is_upgraded(tmp_path):
+    path = _output(tmp_path, 'a.md')
+    conn = sqlite3.connect(str(tmp_path / 'cache.db'))
+    with conn:
+        conn.execute("""
+            CREATE TABLE entries (video_key TEXT NOT NULL, stage TEXT NOT NULL, fingerprint TEXT NOT NULL,
+                                  path TEXT NOT NULL, size INTEGER NOT NULL, created_at REAL NOT NULL,
+                                  last_access REAL NOT NULL, PRIMARY KEY (video_key, stage, fingerprint))""")
+        conn.execute("INSERT INTO entries VALUES ('Youtube:a', 'transcript', 'fp1', ?, 10, 0, 0)", (path,))
+    conn.close()
+
+    index = cache.ResultCache(str(tmp_path / 'cache.db'))
+    index.record('Youtube:b', cache.STAGE_TRANSCRIPT, 'fp1', _output(tmp_path, 'b.md'), 'captions:en')
+
+    assert index.lookup('Youtube:a', cache.STAGE_TRANSCRIPT, 'fp1') == path
+    assert index.source(path) == cache.SOURCE_ASR
+    assert index.source(str(tmp_path / 'b.md')) == 'captions:en'
+
+
+def test_response_cache_expires_replies_after_ttl(tmp_path, clock):
+    responses = cache.ResponseCache(str(tmp_path / 'llm.db'), ttl_s=60)
+    responses.put('k', 'reply')
+
+    clock[0] += 59
+    assert responses.get('k') == 'reply'
+    clock[0] += 2
+    assert responses.get('k') is None
+    stats = responses.stats()
+    assert (stats['hits'], stats['misses'], stats['evictions'], stats['entries']) == (1, 1, 1, 0)
+
+
+def test_response_cache_drops_least_recently_used_beyond_size(tmp_path, clock):
+    responses = cache.ResponseCache(str(tmp_path / 'llm.db'), max_size_bytes=25)
+    responses.put('a', 'x' * 10)
+    clock[0] += 1
+    responses.put('b', 'y' * 10)
+    clock[0] += 1
+    assert responses.get('a') == 'x' * 10  # Now more recent than b
+    clock[0] += 1
+
+    responses.put('c', 'z' * 10)
+
+    assert responses.get('b') is None
+    assert responses.get('a') == 'x' * 10
+    assert responses.get('c') == 'z' * 10
+    assert responses.stats()['evictions'] == 1
+    assert responses.stats()['size_bytes'] == 20
+
+
+def test_response_cache_key_covers_every_part():
+    assert cache.ResponseCache.key('lmstudio', 'model', 'prompt', 'text') == \
+        cache.ResponseCache.key('lmstudio', 'model', 'prompt', 'text')
+    assert cache.ResponseCache.key('lmstudio', 'model', 'prompt', 'text') != \
+        cache.ResponseCache.key('lmstudio', 'model', 'prompt text', '')
@@ -0,0 +1,152 @@
+import os
+import shutil
+
+import pytest
+
+import captions
+import download
+import summyt
+from stub_extractor import stub_url
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+SPOKEN_TEXT = "Welcome back to the channel. Today we're looking at rivers & lakes."
+
+
+def _fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), 'r', encoding='utf-8') as f:
+        return f.read()
+
+
+def _run(stage):
+    """Runs a pipeline generator to the end; returns (progress updates, return value)."""
+    updates = []
+    while True:
+        try:
+            updates.append(next(stage))
+        except StopIteration as finished:
+            return updates, finished.value
+
+
+def test_vtt_drops_header_styling_and_annotations():
+    assert captions.parse_vtt(_fixture('manual.en.vtt')) == SPOKEN_TEXT + " Let's go"
+
+
+def test_vtt_rolling_automatic_captions_are_not_repeated():
+    assert captions.parse_vtt(_fixture('auto_rolling.en.vtt')) == \
+        "welcome back to the channel today we're looking at rivers and lakes"
+
+
+def test_srv3_joins_word_segments():
+    assert captions.parse_srv(_fixture('captions.en.srv3')) == SPOKEN_TEXT
+
+
+def test_srv1_double_escaped_entities():
+    data = '<?xml version="1.0"?><transcript><text start="0" dur="1">It&amp;#39;s here</text></transcript>'
+    assert captions.parse_srv(data) == "It's here"
+
+
+def test_parse_captions_picks_parser_by_extension():
+    assert captions.parse_captions(_fixture('captions.en.srv3'), '.srv3') == SPOKEN_TEXT
+    with pytest.raises(ValueError, match='Unsupported'):
+        captions.parse_captions('', 'ttml')
+    with pytest.raises(ValueError, match='Malformed'):
+        captions.parse_captions('<timedtext><body>', 'srv3')
+
+
+def _track(*exts):
+    return [{'ext': ext, 'url': f"https://captions.invalid/{ext}"} for ext in exts]
+
+
+def test_select_track_prefers_uploaded_subtitles_over_automatic():
+    info = {'subtitles': {'en': _track('srv3')}, 'automatic_captions': {'en': _track('vtt')}}
+
+    language, caption_format, is_automatic = captions.select_track(info, ['en'], include_automatic=True)
+    assert (language, caption_format['ext'], is_automatic) == ('en', 'srv3', False)
+
+
+def test_select_track_follows_language_order_and_format_preference():
+    info = {'subtitles': {'de': _track('srv1', 'vtt'), 'fr': _track('vtt')}}
+
+    language, caption_format, _ = captions.select_track(info, ['es', 'de', 'fr'])
+    assert (language, caption_format['ext']) == ('de', 'vtt')
+
+
+def test_select_track_matches_regional_variants_after_exact_language():
+    assert captions.select_track({'subtitles': {'en-GB': _track('vtt')}}, ['en'])[0] == 'en-GB'
+    assert captions.select_track({'subtitles': {'en-GB': _track('vtt'), 'en': _track('vtt')}}, ['en'])[0] == 'en'
+
+
+def test_select_track_prefers_original_automatic_track_over_translations():
+    info = {'automatic_captions': {'en': _track('vtt'), 'en-orig': _track('vtt'), 'en-de': _track('vtt')}}
+    assert captions.select_track(info, ['en'], include_automatic=True)[0] == 'en-orig'
+
+
+def test_select_track_ignores_automatic_captions_unless_allowed():
+    info = {'automatic_captions': {'en': _track('vtt')}}
+    assert captions.select_track(info, ['en']) is None
+    assert captions.select_track({'subtitles': {'en': _track('json3')}}, ['en']) is None
+
+
+@pytest.fixture
+def captioned_video(tmp_path, media_server, monkeypatch, cache_index):
+    """An info dict whose automatic English captions are the rolling VTT fixture, served over HTTP."""
+    shutil.copy(os.path.join(FIXTURES_DIR, 'auto_rolling.en.vtt'), tmp_path / 'media')
+    monkeypatch.setattr(download, 'CAPTIONS_MODE', 'auto')
+    monkeypatch.setattr(download, 'CAPTION_LANGUAGES', ['en'])
+    monkeypatch.setattr(summyt, 'TRANSCRIBED_OUTPUT_DIR', str(tmp_path / 'output'))
+    return {'id': 'cap123', 'title': 'Captioned Video', 'automatic_captions': {
+        'en': [{'ext': 'vtt', 'url': f"{media_server}/auto_rolling.en.vtt"}]}}
+
+
+def test_get_captions_fetches_and_parses_the_track(captioned_video):
+    text, language, is_automatic = download.get_captions(stub_url('cap123'), captioned_video)
+
+    assert text == "welcome back to the channel today we're looking at rivers and lakes"
+    assert (language, is_automatic) == ('en', True)
+
+
+def test_get_captions_follows_captions_mode(captioned_video, monkeypatch):
+    monkeypatch.setattr(download, 'CAPTIONS_MODE', 'manual')
+    assert download.get_captions(stub_url('cap123'), captioned_video) is None
+    monkeypatch.setattr(download, 'CAPTIONS_MODE', 'off')
+    assert download.get_captions(stub_url('cap123'), captioned_video) is None
+
+
+def test_pipeline_uses_captions_instead_of_downloading(captioned_video, monkeypatch, cache_index):
+    def download_youtube(*args):
+        raise AssertionError("audio should not be downloaded")
+    monkeypatch.setattr(download, 'download_youtube', download_youtube)
+    # Paragraph splitting needs NLTK's sentence tokenizer data, which is beside the point here
+    monkeypatch.setattr(summyt.transcript, 'format_text_into_paragraphs', lambda text: text)
+
+    updates, (filepath, title, is_transcript_existing) = _run(
+        summyt.download_stage(stub_url('cap123'), 'unused', captioned_video, 'Stub:cap123'))
+
+    assert is_transcript_existing
+    assert filepath == os.path.join(summyt.TRANSCRIBED_OUTPUT_DIR, 'Captioned Video.md')
+    assert summyt.transcript.read_transcript(filepath).startswith("welcome back to the channel")
+    assert cache_index.lookup('Stub:cap123', summyt.cache.STAGE_TRANSCRIPT,
+                              summyt.cache.fingerprint(summyt.cache.STAGE_TRANSCRIPT, 'captions:en')) == os.path.abspath(filepath)
+    assert cache_index.source(filepath) == 'captions:en'
+    # A speech-recognition transcript is not assumed
+    assert cache_index.lookup('Stub:cap123', summyt.cache.STAGE_TRANSCRIPT,
+                              summyt.cache.fingerprint(summyt.cache.STAGE_TRANSCRIPT)) is None
+    assert "automatic captions" in updates[-1]['status']
+
+
+@pytest.mark.parametrize('without_captions', ['no_tracks', 'fetch_fails'])
+def test_pipeline_falls_back_to_asr_without_captions(captioned_video, monkeypatch, without_captions):
+    if without_captions == 'no_tracks':
+        del captioned_video['automatic_captions']
+    else:
+        captioned_video['automatic_captions']['en'][0]['url'] += '.missing'
+    downloads = []
+    monkeypatch.setattr(download, 'download_youtube',
+                        lambda url, work_dir, info_dict, local=False: downloads.append(url) or ('audio.wav', info_dict['title'], False))
+
+    updates, result = _run(summyt.download_stage(stub_url('cap123'), 'work', captioned_video, 'Stub:cap123'))
+
+    assert result == ('audio.wav', 'Captioned Video', False)
+    assert downloads == [stub_url('cap123')]
+    assert 'No captions available.' in [update['status'] for update in updates]
@@ -0,0 +1,114 @@
+import os
+
+import pytest
+
+import categorize
+import classifier
+
+_TOPICS = {
+    'Technology': "software compiler processor kernel database network code release",
+    'Health & Wellness': "sleep exercise nutrition heart doctor vitamin stress muscle",
+    'Finance & Business': "stock market investor revenue inflation budget interest startup",
+}
+
+
+def _summaries(per_category=6):
+    """Short synthetic summaries, each drawing on its category's vocabulary."""
+    texts, labels = [], []
+    for category, vocabulary in _TOPICS.items():
+        words = vocabulary.split()
+        for i in range(per_category):
+            texts.append(f"This video covers {' and '.join(words[i % 8:] + words[:i % 8])}.")
+            labels.append(category)
+    return texts, labels
+
+
+def _write_summaries(summary_dir, texts, labels):
+    for i, (text, label) in enumerate(zip(texts, labels)):
+        os.makedirs(summary_dir / label, exist_ok=True)
+        (summary_dir / label / f"video {i}-summarized.md").write_text(text, encoding='utf-8')
+
+
+def test_fit_predict_round_trip_survives_save_and_load(tmp_path):
+    texts, labels = _summaries()
+    model = classifier.CategoryClassifier(list(_TOPICS)).fit(texts, labels)
+
+    assert [model.predict(text)[0] for text in texts] == labels
+    category, probability = model.predict("A talk about the processor and the kernel code.")
+    assert category == 'Technology' and 1 / len(_TOPICS) < probability <= 1
+
+    model.save(str(tmp_path / 'model.npz'))
+    loaded = classifier.CategoryClassifier.load(str(tmp_path / 'model.npz'))
+
+    assert loaded.categories == model.categories
+    assert [loaded.predict(text) for text in texts] == [model.predict(text) for text in texts]
+
+
+def test_train_cross_validates_on_the_category_folders(tmp_path):
+    texts, labels = _summaries()
+    _write_summaries(tmp_path, texts, labels)
+
+    model, accuracy = classifier.train(str(tmp_path), categorize.CATEGORIES)
+
+    assert model.categories == list(_TOPICS)
+    assert accuracy == pytest.approx(1.0)
+
+
+def test_held_out_predictions_come_from_models_that_did_not_see_the_summary():
+    texts, labels = _summaries()
+    # A summary whose folder disagrees with its words: a model that saw it would learn the folder
+    texts.append("This video covers stock market investor revenue inflation budget.")
+    labels.append('Technology')
+
+    predictions = classifier.held_out_predictions(texts, labels, list(_TOPICS), indices=[len(texts) - 1])
+
+    assert list(predictions) == [len(texts) - 1]
+    assert predictions[len(texts) - 1][0] == 'Finance & Business'
+
+
+def test_compare_uses_held_out_predictions(tmp_path, monkeypatch, capsys):
+    texts, labels = _summaries()
+    _write_summaries(tmp_path, texts, labels)
+    asked = []
+    monkeypatch.setattr(categorize, 'llm_category', lambda text: asked.append(text) or labels[texts.index(text)])
+    monkeypatch.setattr(classifier, 'get_classifier', lambda: pytest.fail("the saved model was used"))
+
+    classifier._compare_with_llm(str(tmp_path), limit=4)
+
+    output = capsys.readouterr().out
+    assert len(asked) == 4
+    assert "cross-validation folds" in output
+    assert "Agreement with the LLM on held-out summaries: 100.0% of 4 summaries." in output
+
+
+@pytest.fixture
+def summary_file(tmp_path, monkeypatch, cache_index):
+    monkeypatch.setattr(categorize, 'CATEGORY_OUTPUT_DIR', str(tmp_path / 'sorted'))
+    path = tmp_path / 'Some Talk-summarized.md'
+    path.write_text("A summary.", encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('confidence, asks_llm, expected', [
+    pytest.param(0.95, False, 'Technology', id='confident_classifier_decides'),
+    pytest.param(0.2, True, 'Science & Nature', id='unsure_classifier_falls_back_to_llm'),
+])
+def test_llm_is_asked_only_below_min_confidence(summary_file, monkeypatch, tmp_path, confidence, asks_llm, expected):
+    monkeypatch.setattr(classifier, 'MIN_CONFIDENCE', 0.7)
+    monkeypatch.setattr(classifier, 'classify', lambda text: ('Technology', confidence))
+    asked = []
+    monkeypatch.setattr(categorize, 'llm_category',
+                        lambda text, use_cache=True: asked.append(text) or 'Science & Nature')
+
+    new_path = categorize.categorize_summary(summary_file)
+
+    assert new_path == str(tmp_path / 'sorted' / expected / 'Some Talk-summarized.md')
+    assert os.path.exists(new_path)
+    assert asked == (["A summary."] if asks_llm else [])
+
+
+def test_llm_is_asked_when_no_model_is_trained(summary_file, monkeypatch, tmp_path):
+    monkeypatch.setattr(classifier, 'MODEL_PATH', str(tmp_path / 'missing.npz'))
+    monkeypatch.setattr(categorize, 'llm_category', lambda text, use_cache=True: 'Other')
+
+    assert categorize.categorize_summary(summary_file) == str(tmp_path / 'sorted' / 'Other' / 'Some Talk-summarized.md')
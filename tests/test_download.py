@@ -0,0 +1,135 @@
+import os
+import shutil
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import download
+import summyt
+import stub_extractor
+from audio import MODEL_SAMPLE_RATE
+from stub_extractor import StubIE, stub_url
+
+download.register_extractor(StubIE)
+
+
+@pytest.fixture
+def stub_video(tmp_path, media_server, monkeypatch, cache_index):
+    """Registers a stub video whose one format is a 44.1 kHz stereo WAV served by `media_server`."""
+    samples = np.sin(np.linspace(0, 440 * 2 * np.pi, 44100 * 2)).astype(np.float32)
+    sf.write(str(tmp_path / 'media' / 'stub.wav'), np.stack([samples, samples], axis=1), 44100)
+    monkeypatch.setattr(download, 'DOWNLOAD_DIR', str(tmp_path / 'input'))
+    monkeypatch.setattr(download, '_info_cache', {})
+    monkeypatch.setitem(stub_extractor.VIDEOS, 'abc123', {
+        'title': 'Stub Video',
+        'formats': [{'format_id': 'wav', 'url': f"{media_server}/stub.wav", 'ext': 'wav',
+                     'acodec': 'pcm_s16le', 'vcodec': 'none'}],
+    })
+    stub_extractor.extraction_counts.pop('abc123', None)
+    return stub_url('abc123')
+
+
+def test_video_key_uses_registered_extractor(stub_video):
+    assert download.video_key(stub_video) == 'Stub:abc123'
+    assert download.video_key(stub_video + '?t=10') == 'Stub:abc123'
+
+
+def test_get_video_info_extracts_once_and_returns_copies(stub_video):
+    first = download.get_video_info(stub_video)
+    first['title'] = 'changed by caller'
+    second = download.get_video_info(stub_video)
+
+    assert second['title'] == 'Stub Video'
+    assert stub_extractor.extraction_counts['abc123'] == 1
+
+
+def test_get_video_info_extracts_again_after_ttl(stub_video, monkeypatch):
+    monkeypatch.setattr(download, 'VIDEO_INFO_TTL_S', 0)
+    download.get_video_info(stub_video)
+    download.get_video_info(stub_video)
+
+    assert stub_extractor.extraction_counts['abc123'] == 2
+
+
+@pytest.mark.skipif(not (shutil.which('ffmpeg') and shutil.which('ffprobe')),
+                    reason="yt-dlp needs ffmpeg and ffprobe to extract the audio")
+def test_download_extracts_model_rate_mono_audio(stub_video, tmp_path):
+    info_dict = download.get_video_info(stub_video)
+    filepath, title, is_transcript_existing = download.download_youtube(stub_video, str(tmp_path / 'work'), info_dict)
+
+    assert (title, is_transcript_existing) == ('Stub Video', False)
+    assert filepath == str(tmp_path / 'work' / 'abc123_mono.wav')
+    assert sf.info(filepath).samplerate == MODEL_SAMPLE_RATE
+    assert sf.info(filepath).channels == 1
+    # The info fetched above was passed on, not extracted again
+    assert stub_extractor.extraction_counts['abc123'] == 1
+
+
+def test_download_reuses_audio_left_in_work_dir(stub_video, tmp_path):
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    sf.write(str(work_dir / 'abc123_mono.wav'), np.zeros(MODEL_SAMPLE_RATE, dtype=np.float32), MODEL_SAMPLE_RATE)
+
+    filepath, _, is_transcript_existing = download.download_youtube(stub_video, str(work_dir),
+                                                                     download.get_video_info(stub_video))
+
+    assert filepath == str(work_dir / 'abc123_mono.wav')
+    assert not is_transcript_existing
+
+
+def test_download_returns_cached_transcript(stub_video, tmp_path, cache_index):
+    transcript_path = tmp_path / 'Stub Video.md'
+    transcript_path.write_text("# Transcription of Stub Video\n\nHello.\n", encoding='utf-8')
+    cache_index.record('Stub:abc123', summyt.cache.STAGE_TRANSCRIPT,
+                       summyt.cache.fingerprint(summyt.cache.STAGE_TRANSCRIPT), str(transcript_path))
+
+    filepath, _, is_transcript_existing = download.download_youtube(stub_video, str(tmp_path / 'work'),
+                                                                     download.get_video_info(stub_video))
+
+    assert filepath == str(transcript_path)
+    assert is_transcript_existing
+    assert not os.path.exists(tmp_path / 'work' / 'abc123_mono.wav')
+
+
+def test_local_media_is_converted_to_model_rate_mono(tmp_path, cache_index):
+    source = tmp_path / 'lecture.wav'
+    samples = np.zeros((22050, 2), dtype=np.float32)
+    sf.write(str(source), samples, 22050)
+
+    info_dict = download.get_video_info(str(source), local=True)
+    filepath, title, _ = download.download_youtube(str(source), str(tmp_path / 'work'), info_dict, local=True)
+
+    assert title == 'lecture'
+    assert sf.info(filepath).samplerate == MODEL_SAMPLE_RATE
+    assert sf.info(filepath).channels == 1
+    assert sf.info(filepath).frames == MODEL_SAMPLE_RATE
+
+
+def test_paths_are_not_local_media_unless_asked(tmp_path):
+    source = tmp_path / 'lecture.wav'
+    sf.write(str(source), np.zeros(1600, dtype=np.float32), 16000)
+
+    assert download.video_key(str(source)) == str(source)
+    assert download.video_key(str(source), local=True) == f"file:{source}"
+    assert download.get_video_info(str(source)) is None
+
+
+def test_pipeline_download_stage_uses_work_dir(stub_video, tmp_path, monkeypatch):
+    monkeypatch.setattr(download, 'CAPTIONS_MODE', 'off')
+    work_dir = tmp_path / 'work'
+    work_dir.mkdir()
+    sf.write(str(work_dir / 'abc123_mono.wav'), np.zeros(MODEL_SAMPLE_RATE, dtype=np.float32), MODEL_SAMPLE_RATE)
+    info_dict = download.get_video_info(stub_video)
+
+    stage = summyt.download_stage(stub_video, str(work_dir), info_dict, download.video_key(stub_video))
+    updates = []
+    try:
+        while True:
+            updates.append(next(stage))
+    except StopIteration as finished:
+        filepath, title, is_transcript_existing = finished.value
+
+    assert filepath == str(work_dir / 'abc123_mono.wav')
+    assert (title, is_transcript_existing) == ('Stub Video', False)
+    assert updates[-1]['status'].startswith('Downloading audio')
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+import gpu_batcher
+
+
+class _FakeModel:
+    """Stands in for the ASR model behind SharedGpuBatcher._infer: records every batch and echoes its chunks."""
+
+    def __init__(self, delay_s=0.0):
+        self.batches = []
+        self.delay_s = delay_s
+
+    def __call__(self, batch, timestamps, load_stats):
+        self.batches.append(list(batch))
+        time.sleep(self.delay_s)
+        return [{'text': chunk} for chunk in batch]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    fake = _FakeModel()
+    monkeypatch.setattr(gpu_batcher.SharedGpuBatcher, '_infer', lambda self, *args: fake(*args))
+    return fake
+
+
+def _stream(name, count, timestamps=False):
+    stream = gpu_batcher._Stream(timestamps)
+    stream.pending.extend(f"{name}{index}" for index in range(count))
+    return stream
+
+
+def test_take_batch_interleaves_streams_round_robin():
+    batcher = gpu_batcher.SharedGpuBatcher('cuda:0')
+    batcher.batch_size = 3
+    a, b = _stream('a', 3), _stream('b', 3)
+    batcher._streams = [a, b]
+
+    first, first_owners = batcher._take_batch()
+    second, second_owners = batcher._take_batch()
+
+    assert first == ['a0', 'b0', 'a1'] and first_owners == [a, b, a]
+    # The next batch starts with the other stream
+    assert second == ['b1', 'a2', 'b2'] and second_owners == [b, a, b]
+
+
+def test_take_batch_fills_up_from_the_longer_stream():
+    batcher = gpu_batcher.SharedGpuBatcher('cuda:0')
+    batcher.batch_size = 4
+    batcher._streams = [_stream('a', 5), _stream('b', 1)]
+
+    assert batcher._take_batch()[0] == ['a0', 'b0', 'a1', 'a2']
+
+
+def test_take_batch_does_not_mix_timestamp_settings():
+    batcher = gpu_batcher.SharedGpuBatcher('cuda:0')
+    batcher.batch_size = 4
+    batcher._streams = [_stream('a', 2), _stream('b', 2, timestamps=True)]
+
+    assert batcher._take_batch()[0] == ['a0', 'a1']
+
+
+def test_concurrent_streams_share_batches_and_get_their_own_results(model):
+    model.delay_s = 0.02
+    batcher = gpu_batcher.SharedGpuBatcher('cuda:0', max_wait_s=0.05)
+    chunks = {name: [f"{name}{index}" for index in range(12)] for name in 'ab'}
+    results = {}
+    start = threading.Barrier(2)
+
+    def transcribe(name):
+        start.wait()
+        results[name] = batcher.transcribe(iter(chunks[name]), batch_size=4)
+
+    threads = [threading.Thread(target=transcribe, args=(name,)) for name in 'ab']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert {name: [result['text'] for result in results[name]] for name in 'ab'} == chunks
+    assert sorted(chunk for batch in model.batches for chunk in batch) == sorted(chunks['a'] + chunks['b'])
+    assert all(len(batch) <= 4 for batch in model.batches)
+    assert any({chunk[0] for chunk in batch} == {'a', 'b'} for batch in model.batches)
+    assert batcher._streams == []
+
+
+def test_partial_batch_is_flushed_after_max_wait(model):
+    batcher = gpu_batcher.SharedGpuBatcher('cuda:0', max_wait_s=0.2)
+
+    start = time.monotonic()
+    results = batcher.transcribe(iter(['a0', 'a1', 'a2']), batch_size=8)
+    elapsed_s = time.monotonic() - start
+
+    assert [result['text'] for result in results] == ['a0', 'a1', 'a2']
+    assert model.batches == [['a0', 'a1', 'a2']]
+    assert 0.2 <= elapsed_s < 2
+
+
+def test_failed_batch_is_raised_in_the_stream(monkeypatch):
+    def fail(self, batch, timestamps, load_stats):
+        raise RuntimeError("CUDA error")
+    monkeypatch.setattr(gpu_batcher.SharedGpuBatcher, '_infer', fail)
+    batcher = gpu_batcher.SharedGpuBatcher('cuda:0', max_wait_s=0.01)
+
+    with pytest.raises(RuntimeError, match='CUDA error'):
+        batcher.transcribe(iter(['a0']), batch_size=2)
+    assert batcher._streams == []
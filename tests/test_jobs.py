@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import CancelledError
+
+import pytest
+
+import jobs
+import summyt
+
+
+class _FakePipeline:
+    """Stands in for summyt.process_video; runs for `hold` URLs wait until `release` is set."""
+
+    def __init__(self):
+        self.calls = []
+        self.hold = set()
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    def __call__(self, url, cancel_event=None, **options):
+        self.calls.append((url, options))
+        yield {'status': 'Downloading...', 'progress': 20}
+        if url in self.hold:
+            self.started.set()
+            while not self.release.wait(0.01):
+                if cancel_event.is_set():
+                    raise CancelledError()
+        yield {'status': 'Completed', 'progress': 100, 'summary': f"summary of {url}"}
+
+
+@pytest.fixture
+def pipeline(monkeypatch):
+    fake = _FakePipeline()
+    monkeypatch.setattr(summyt, 'process_video', fake)
+    yield fake
+    fake.release.set()
+
+
+@pytest.fixture
+def make_manager(tmp_path, pipeline):
+    managers = []
+
+    def make(max_workers=1, max_queued=5):
+        manager = jobs.JobManager(jobs.JobStore(str(tmp_path / 'jobs.db')), max_workers, max_queued)
+        managers.append(manager)
+        return manager
+
+    yield make
+    pipeline.release.set()
+    for manager in managers:
+        manager._executor.shutdown(wait=True)
+
+
+def _wait(manager, job_id):
+    """Follows the job until it finishes and returns its stored state."""
+    list(manager.iter_events(job_id, timeout_s=5))
+    return manager.get(job_id)
+
+
+def _url(video_id):
+    return f"https://www.youtube.com/watch?v={video_id}"
+
+
+def test_job_runs_and_stores_result(make_manager, pipeline):
+    manager = make_manager()
+    job_id = manager.submit(_url('aaaaaaaaaaa'), {'enable_hashtag': False})
+
+    job = _wait(manager, job_id)
+
+    assert job['status'] == jobs.COMPLETED
+    assert job['result']['summary'] == f"summary of {_url('aaaaaaaaaaa')}"
+    assert pipeline.calls == [(_url('aaaaaaaaaaa'), {'enable_hashtag': False})]
+
+
+def test_cancelled_queued_job_is_never_started(make_manager, pipeline):
+    manager = make_manager(max_workers=1)
+    pipeline.hold.add(_url('aaaaaaaaaaa'))
+    running = manager.submit(_url('aaaaaaaaaaa'))
+    assert pipeline.started.wait(5)
+    queued = manager.submit(_url('bbbbbbbbbbb'))
+
+    assert manager.cancel(queued)
+    pipeline.release.set()
+
+    assert _wait(manager, running)['status'] == jobs.COMPLETED
+    assert _wait(manager, queued)['status'] == jobs.CANCELLED
+    assert [url for url, _ in pipeline.calls] == [_url('aaaaaaaaaaa')]
+    assert not manager.cancel(queued)
+
+
+def test_cancel_and_start_cannot_both_win(make_manager, pipeline):
+    manager = make_manager()
+    # The worker has to take the same lock to move the job to RUNNING, so it waits until cancel() is done
+    with manager._condition:
+        job_id = manager.submit(_url('aaaaaaaaaaa'))
+        assert manager.cancel(job_id)
+
+    assert _wait(manager, job_id)['status'] == jobs.CANCELLED
+    manager._executor.shutdown(wait=True)
+    assert manager.get(job_id)['status'] == jobs.CANCELLED
+    assert pipeline.calls == []
+
+
+def test_cancelling_a_running_job_stops_it_mid_stage(make_manager, pipeline):
+    manager = make_manager()
+    pipeline.hold.add(_url('aaaaaaaaaaa'))
+    job_id = manager.submit(_url('aaaaaaaaaaa'))
+    assert pipeline.started.wait(5)
+
+    assert manager.cancel(job_id)
+    events = list(manager.iter_events(job_id, timeout_s=5))
+
+    assert manager.get(job_id)['status'] == jobs.CANCELLED
+    assert events[-1]['cancelled']
+
+
+def test_submissions_beyond_workers_and_queue_are_refused(make_manager, pipeline):
+    manager = make_manager(max_workers=1, max_queued=1)
+    pipeline.hold.update({_url('aaaaaaaaaaa'), _url('bbbbbbbbbbb')})
+    first = manager.submit(_url('aaaaaaaaaaa'))
+    second = manager.submit(_url('bbbbbbbbbbb'))
+
+    with pytest.raises(jobs.QueueFullError):
+        manager.submit(_url('ccccccccccc'))
+    # Attaching to a job in flight does not need a slot
+    assert manager.submit(_url('bbbbbbbbbbb')) == second
+
+    pipeline.release.set()
+    _wait(manager, first)
+    _wait(manager, second)
+    assert _wait(manager, manager.submit(_url('ccccccccccc')))['status'] == jobs.COMPLETED
+
+
+def test_same_video_and_options_attach_to_the_job_in_flight(make_manager, pipeline):
+    manager = make_manager(max_workers=2)
+    pipeline.hold.add(_url('aaaaaaaaaaa'))
+    job_id = manager.submit(_url('aaaaaaaaaaa'), {})
+
+    # Another URL form of the same video, and options spelled out at their defaults
+    assert manager.submit('https://youtu.be/aaaaaaaaaaa', {'enable_hashtag': True, 'use_cache': True}) == job_id
+    other_options = manager.submit(_url('aaaaaaaaaaa'), {'enable_hashtag': False})
+    assert other_options != job_id
+
+    pipeline.release.set()
+    _wait(manager, job_id)
+    _wait(manager, other_options)
+    # Once finished, the same request starts a new job
+    assert manager.submit(_url('aaaaaaaaaaa')) not in (job_id, other_options)
+
+
+def test_start_requeues_jobs_interrupted_by_a_restart(tmp_path, make_manager, pipeline):
+    store = jobs.JobStore(str(tmp_path / 'jobs.db'))
+    store.insert('was-running', _url('aaaaaaaaaaa'), {'enable_hashtag': False})
+    store.update('was-running', status=jobs.RUNNING, progress=40)
+    store.insert('was-queued', _url('bbbbbbbbbbb'), {})
+    store.insert('was-done', _url('ccccccccccc'), {})
+    store.update('was-done', status=jobs.COMPLETED, progress=100)
+
+    manager = make_manager(max_workers=2)
+    manager.start()
+
+    assert _wait(manager, 'was-running')['status'] == jobs.COMPLETED
+    assert _wait(manager, 'was-queued')['status'] == jobs.COMPLETED
+    assert sorted(pipeline.calls) == [(_url('aaaaaaaaaaa'), {'enable_hashtag': False}), (_url('bbbbbbbbbbb'), {})]
+    assert manager.get('was-done')['status'] == jobs.COMPLETED
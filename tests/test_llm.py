@@ -0,0 +1,235 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import llm
+
+# Bound before the `sleeps` fixture replaces time.sleep for the client
+_server_sleep = time.sleep
+
+
+class _FakeLLMHandler(BaseHTTPRequestHandler):
+    # Streamed replies use chunked encoding, like the real providers
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        fake = self.server.fake
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        with fake.lock:
+            fake.requests.append(body)
+            reply = fake.replies.popleft() if fake.replies else {}
+            fake.active += 1
+            fake.max_active = max(fake.max_active, fake.active)
+        try:
+            _server_sleep(reply.get('delay', 0))
+            self.send_response(reply.get('status', 200))
+            for name, value in reply.get('headers', {}).items():
+                self.send_header(name, value)
+            if 'lines' in reply:
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for line in reply['lines']:
+                    data = line.encode('utf-8') + b'\n'
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(data), data))
+                    self.wfile.flush()
+                    _server_sleep(reply.get('line_delay', 0))
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                data = json.dumps(reply.get('json', _openai_reply('ok'))).encode('utf-8')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # The client gave up on the reply
+        finally:
+            with fake.lock:
+                fake.active -= 1
+
+
+class FakeLLM:
+    """
+    An LLM endpoint on localhost. Each request takes the next reply from
+    `replies` (a 200 OpenAI-style "ok" once they run out). A reply is a dict with
+    optional `status`, `headers`, `delay`, and either `json` or streamed `lines`.
+    """
+
+    def __init__(self):
+        self.replies = deque()
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+        self.lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _FakeLLMHandler)
+        self._server.daemon_threads = True
+        self._server.fake = self
+        self.url = f"http://127.0.0.1:{self._server.server_address[1]}/v1/chat/completions"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _openai_reply(content):
+    return {'choices': [{'message': {'role': 'assistant', 'content': content}}]}
+
+
+@pytest.fixture
+def fake_llm():
+    fake = FakeLLM()
+    yield fake
+    fake.close()
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records retry delays instead of waiting them out."""
+    delays = []
+    monkeypatch.setattr(llm.time, 'sleep', delays.append)
+    return delays
+
+
+def _client(fake_llm, provider='lmstudio', **kwargs):
+    kwargs = dict({'max_retries': 3, 'backoff_s': 0.5}, **kwargs)
+    return llm.LLMClient(provider, fake_llm.url, 'test-model', **kwargs)
+
+
+@pytest.mark.parametrize('status', [429, 500, 502, 503, 504])
+def test_retryable_status_is_retried(fake_llm, sleeps, status):
+    fake_llm.replies.extend([{'status': status, 'json': {'error': 'busy'}}, {'json': _openai_reply('done')}])
+
+    assert _client(fake_llm).complete('Summarize', 'text') == 'done'
+    assert len(fake_llm.requests) == 2
+    assert len(sleeps) == 1
+
+
+def test_retry_delays_use_exponential_backoff_with_full_jitter(fake_llm, sleeps, monkeypatch):
+    bounds = []
+    monkeypatch.setattr(llm.random, 'uniform', lambda low, high: bounds.append((low, high)) or high / 2)
+    fake_llm.replies.extend([{'status': 503}] * 3)
+
+    assert _client(fake_llm).complete('Summarize') == 'ok'
+    assert bounds == [(0, 0.5), (0, 1.0), (0, 2.0)]
+    assert sleeps == [0.25, 0.5, 1.0]
+
+
+def test_retry_after_header_is_honored(fake_llm, sleeps):
+    fake_llm.replies.append({'status': 429, 'headers': {'Retry-After': '7'}})
+
+    _client(fake_llm).complete('Summarize')
+    assert sleeps == [7.0]
+
+
+def test_gives_up_after_max_retries(fake_llm, sleeps):
+    fake_llm.replies.extend([{'status': 500}] * 3)
+
+    with pytest.raises(llm.LLMError, match='HTTP 500'):
+        _client(fake_llm, max_retries=2).complete('Summarize')
+    assert len(fake_llm.requests) == 3
+
+
+def test_client_errors_are_not_retried(fake_llm, sleeps):
+    fake_llm.replies.append({'status': 400, 'json': {'error': 'bad request'}})
+
+    with pytest.raises(llm.LLMError, match='bad request'):
+        _client(fake_llm).complete('Summarize')
+    assert len(fake_llm.requests) == 1
+    assert sleeps == []
+
+
+def test_concurrent_requests_are_capped(fake_llm):
+    fake_llm.replies.extend([{'delay': 0.2, 'json': _openai_reply(str(i))} for i in range(6)])
+    client = _client(fake_llm, max_concurrency=2)
+
+    replies = client.complete_many([('Summarize', str(i)) for i in range(6)])
+
+    assert sorted(replies) == [str(i) for i in range(6)]
+    assert fake_llm.max_active == 2
+
+
+def test_read_timeout_fails_without_retrying(fake_llm, sleeps):
+    fake_llm.replies.append({'delay': 1.0})
+
+    with pytest.raises(llm.LLMError, match='did not respond within 0.2s'):
+        _client(fake_llm, read_timeout_s=0.2).complete('Summarize')
+    assert len(fake_llm.requests) == 1
+
+
+def test_stream_parses_openai_server_sent_events(fake_llm):
+    fake_llm.replies.append({'headers': {'Content-Type': 'text/event-stream'}, 'lines': [
+        ': OPENROUTER PROCESSING', '',
+        'data: ' + json.dumps({'choices': [{'delta': {'role': 'assistant'}}]}), '',
+        'data: ' + json.dumps({'choices': [{'delta': {'content': 'Hello'}}]}), '',
+        'data: ' + json.dumps({'choices': [{'delta': {'content': ', world'}}]}), '',
+        'data: [DONE]', '',
+    ]})
+
+    assert list(_client(fake_llm, provider='openrouter').stream('Summarize')) == ['Hello', ', world']
+    assert fake_llm.requests[0]['stream'] is True
+
+
+def test_stream_parses_ollama_ndjson(fake_llm):
+    fake_llm.replies.append({'headers': {'Content-Type': 'application/x-ndjson'}, 'lines': [
+        json.dumps({'message': {'role': 'assistant', 'content': 'Hel'}, 'done': False}),
+        json.dumps({'message': {'role': 'assistant', 'content': 'lo'}, 'done': False}),
+        json.dumps({'message': {'role': 'assistant', 'content': ''}, 'done': True}),
+    ]})
+
+    assert list(_client(fake_llm, provider='ollama').stream('Summarize')) == ['Hel', 'lo']
+
+
+def test_stream_reports_provider_errors(fake_llm):
+    fake_llm.replies.append({'lines': [json.dumps({'error': 'model not found'})]})
+
+    with pytest.raises(llm.LLMError, match='model not found'):
+        list(_client(fake_llm, provider='ollama').stream('Summarize'))
+
+
+def test_stream_retries_before_first_piece(fake_llm, sleeps):
+    fake_llm.replies.extend([{'status': 503}, {'lines': ['data: ' + json.dumps({'choices': [{'delta': {'content': 'ok'}}]}),
+                                                         'data: [DONE]']}])
+
+    assert list(_client(fake_llm).stream('Summarize')) == ['ok']
+    assert len(fake_llm.requests) == 2
+
+
+def test_stream_closed_early_releases_its_slot(fake_llm):
+    fake_llm.replies.append({'line_delay': 0.05, 'lines': [
+        'data: ' + json.dumps({'choices': [{'delta': {'content': str(i)}}]}) for i in range(20)]})
+    client = _client(fake_llm, max_concurrency=1)
+
+    pieces = client.stream('Summarize')
+    assert next(pieces) == '0'
+    pieces.close()
+
+    # With the only slot still taken, this would wait forever
+    finished = threading.Event()
+    threading.Thread(target=lambda: (client.complete('Summarize'), finished.set()), daemon=True).start()
+    assert finished.wait(5)
+
+
+def test_stream_read_timeout_raises(fake_llm):
+    fake_llm.replies.append({'line_delay': 1.0, 'lines': [
+        'data: ' + json.dumps({'choices': [{'delta': {'content': 'slow'}}]}), 'data: [DONE]']})
+    pieces = _client(fake_llm, read_timeout_s=0.3).stream('Summarize')
+
+    assert next(pieces) == 'slow'
+    with pytest.raises(llm.LLMError, match='interrupted'):
+        next(pieces)
+
+
+def test_complete_many_forwards_use_cache(fake_llm, tmp_path):
+    client = _client(fake_llm, response_cache=llm.cache.ResponseCache(str(tmp_path / 'llm_cache.db')))
+    fake_llm.replies.extend([{'json': _openai_reply('first')}, {'json': _openai_reply('second')}])
+
+    assert client.complete_many([('Summarize', 'text')]) == ['first']
+    assert client.complete_many([('Summarize', 'text')]) == ['first']
+    assert client.complete_many([('Summarize', 'text')], use_cache=False) == ['second']
+    assert len(fake_llm.requests) == 2
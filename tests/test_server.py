@@ -0,0 +1,46 @@
+import pytest
+
+import jobs
+import server
+
+
+class _FakeManager:
+    def __init__(self):
+        self.submitted = []
+
+    def submit(self, url, options):
+        self.submitted.append(url)
+        return 'job-1'
+
+
+@pytest.fixture
+def client(monkeypatch):
+    manager = _FakeManager()
+    monkeypatch.setattr(jobs, 'get_manager', lambda: manager)
+    monkeypatch.setattr(server, 'get_video_info', lambda url: {'title': 'Stub Video', 'description': ''})
+    client = server.app.test_client()
+    client.manager = manager
+    return client
+
+
+@pytest.mark.parametrize('endpoint', ['/get_video_info', '/summarize', '/summarize_with_category', '/jobs'])
+@pytest.mark.parametrize('url', [__file__, 'file:///etc/passwd', 'ftp://example.com/video', '', None, 42])
+def test_endpoints_refuse_anything_but_web_urls(client, endpoint, url):
+    response = client.post(endpoint, json={'url': url})
+
+    assert response.status_code == 400
+    assert 'http(s)' in response.get_json()['error']
+    assert client.manager.submitted == []
+
+
+def test_jobs_accept_web_urls(client):
+    response = client.post('/jobs', json={'url': 'https://www.youtube.com/watch?v=abc123'})
+
+    assert response.status_code == 202
+    assert client.manager.submitted == ['https://www.youtube.com/watch?v=abc123']
+
+
+def test_video_info_accepts_web_urls(client):
+    response = client.post('/get_video_info', json={'url': 'http://stub.invalid/watch/abc123'})
+
+    assert response.get_json()['title'] == 'Stub Video'
@@ -0,0 +1,202 @@
+import re
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import pytest
+
+import llm
+import summarize
+
+
+class FakeLLMClient:
+    """Stands in for llm.LLMClient: every request is recorded and answered by `reply(prompt, text)`."""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.requests = []
+        self.lock = threading.Lock()
+
+    def complete(self, prompt, text='', use_cache=True):
+        with self.lock:
+            self.requests.append((prompt, text))
+        return self.reply(prompt, text)
+
+    def complete_many(self, requests_, max_concurrency=None, cancel_event=None, use_cache=True):
+        return [self.complete(prompt, text, use_cache) for prompt, text in requests_]
+
+    def stream(self, prompt, text='', use_cache=True):
+        for word in self.complete(prompt, text, use_cache).split(' '):
+            yield word + ' '
+
+
+@pytest.fixture
+def budget(monkeypatch):
+    """A small token budget, so a few thousand characters need several requests. Returns the characters per request."""
+    monkeypatch.setattr(summarize, 'SUMMARIZATION_MODE', 'map-reduce')
+    monkeypatch.setattr(summarize, 'SUMMARIZATION_PROMPT', "Summarize.")
+    monkeypatch.setattr(summarize, 'TOKEN_BUDGET', 150)
+    return summarize.TOKEN_BUDGET * summarize.CHARS_PER_TOKEN
+
+
+def _use(monkeypatch, client):
+    monkeypatch.setattr(summarize.llm, 'get_client', lambda: client)
+    return client
+
+
+def _transcript(paragraphs=12, sentences=6):
+    return "\n\n".join(" ".join(f"Paragraph {p} sentence {s} goes on a little." for s in range(sentences))
+                       for p in range(paragraphs))
+
+
+def _part_number(prompt):
+    return int(re.search(r'part (\d+)', prompt).group(1))
+
+
+@pytest.mark.parametrize('text, max_chars, expected', [
+    pytest.param("aaa\n\nbbb", 8, ["aaa\n\nbbb"], id='paragraphs_that_fit_share_a_piece'),
+    pytest.param("aaa\n\nbbb", 7, ["aaa", "bbb"], id='paragraph_boundary'),
+    pytest.param("aaa\n\n\n  \n\nbbb\n", 20, ["aaa\n\nbbb"], id='blank_paragraphs_dropped'),
+    pytest.param("One two. Three four. Five.", 12, ["One two.", "Three four.", "Five."], id='sentence_boundary'),
+    pytest.param("One two. Three four. Five.", 20, ["One two.", "Three four.\n\nFive."], id='sentences_packed'),
+    pytest.param("alpha beta gamma delta", 11, ["alpha beta", "gamma delta"], id='long_sentence_cut_between_words'),
+    pytest.param("abcdefghij", 4, ["abcd", "efgh", "ij"], id='long_word_cut'),
+    pytest.param("", 10, [], id='empty'),
+])
+def test_split_text_boundaries(text, max_chars, expected):
+    assert summarize._split_text(text, max_chars) == expected
+
+
+def test_split_text_keeps_every_word_within_the_limit():
+    text = _transcript()
+    pieces = summarize._split_text(text, 200)
+
+    assert all(len(piece) <= 200 for piece in pieces)
+    assert " ".join(pieces).split() == text.split()
+
+
+def test_short_text_is_summarized_in_one_request(budget, monkeypatch):
+    client = _use(monkeypatch, FakeLLMClient(lambda prompt, text: "short summary"))
+
+    assert "".join(summarize.summarize_text_stream("A short transcript.")).strip() == "short summary"
+    assert client.requests == [("Summarize.", "A short transcript.")]
+
+
+def test_long_text_is_mapped_then_summarized_within_the_budget(budget, monkeypatch):
+    client = _use(monkeypatch, FakeLLMClient(
+        lambda prompt, text: "final" if prompt == "Summarize." else f"[{_part_number(prompt)}]"))
+    text = _transcript()
+
+    assert "".join(summarize.summarize_text_stream(text)).strip() == "final"
+
+    *map_requests, (final_prompt, final_text) = client.requests
+    assert len(map_requests) == len(summarize._split_text(text, summarize._max_request_chars())) > 1
+    assert all(len(prompt) + len(piece) <= budget for prompt, piece in client.requests)
+    assert "\n\n".join(piece for _, piece in map_requests).split() == text.split()
+    assert final_text == "\n\n".join(f"[{index}]" for index in range(1, len(map_requests) + 1))
+
+
+def test_reduce_combines_again_while_partial_summaries_exceed_the_budget(budget, monkeypatch):
+    def reply(prompt, text):
+        if prompt == summarize.COMBINE_PROMPT:
+            return "combined " + text.split()[0]
+        if prompt == "Summarize.":
+            return "final"
+        # Map replies long enough that, joined, they need another round
+        return f"part{_part_number(prompt)} " + "detail " * 12
+    client = _use(monkeypatch, FakeLLMClient(reply))
+
+    assert "".join(summarize.summarize_text_stream(_transcript(paragraphs=20))).strip() == "final"
+
+    prompts = [prompt for prompt, _ in client.requests]
+    combine_requests = [text for prompt, text in client.requests if prompt == summarize.COMBINE_PROMPT]
+    assert len(combine_requests) > 1
+    last_map_request = max(i for i, prompt in enumerate(prompts) if prompt.startswith("The following is part"))
+    assert prompts.index(summarize.COMBINE_PROMPT) > last_map_request
+    assert all(len(prompt) + len(text) <= budget for prompt, text in client.requests)
+    # Each combine request takes a run of consecutive parts, in order
+    first_parts = [int(re.match(r'part(\d+)', text).group(1)) for text in combine_requests]
+    assert first_parts == sorted(first_parts)
+    assert client.requests[-1][1] == "\n\n".join(f"combined part{number}" for number in first_parts)
+
+
+def test_reduce_stops_when_summaries_do_not_shrink(budget, monkeypatch):
+    client = _use(monkeypatch, FakeLLMClient(lambda prompt, text: text))
+    partial_summaries = ["x " * 50] * 6
+
+    combined = summarize._reduce(partial_summaries, 350)
+
+    assert combined == "\n\n".join(summary.strip() for summary in partial_summaries)
+    assert len(client.requests) == 2  # One round of two combine requests, whose replies were no shorter
+
+
+def test_reduce_rejects_empty_partial_summaries(budget, monkeypatch):
+    _use(monkeypatch, FakeLLMClient(lambda prompt, text: ""))
+
+    with pytest.raises(llm.LLMError, match='empty text'):
+        summarize._reduce(["fine", "  "], 1000)
+
+
+def _feed(summarizer, sentences=72):
+    """Adds a transcript to `summarizer` a sentence at a time, as transcription would; returns the whole text."""
+    sentences = [f"Sentence {index} of the transcript goes on a little." for index in range(sentences)]
+    for sentence in sentences:
+        summarizer.add(sentence)
+    return " ".join(sentences)
+
+
+def test_incremental_partials_are_combined_in_transcript_order(budget, monkeypatch):
+    monkeypatch.setattr(summarize, 'MAP_CONCURRENCY', 16)
+    finished = []
+
+    def reply(prompt, text):
+        if prompt == "Summarize.":
+            return "final"
+        # The first section is answered last
+        part = _part_number(prompt)
+        if part == 1:
+            time.sleep(0.3)
+        finished.append(part)
+        return f"[{part}]"
+    client = _use(monkeypatch, FakeLLMClient(reply))
+    summarizer = summarize.IncrementalSummarizer()
+    text = _feed(summarizer)
+
+    assert "".join(summarize.summarize_text_stream(text, partials=summarizer)).strip() == "final"
+
+    *section_requests, (_, final_text) = client.requests
+    assert len(section_requests) > 2
+    assert finished[-1] == 1 and sorted(finished) == list(range(1, len(section_requests) + 1))
+    # Each section is sent once, and the sections put together are the transcript
+    sections = sorted(section_requests, key=lambda request: _part_number(request[0]))
+    assert " ".join(piece for _, piece in sections).split() == text.split()
+    assert final_text == "\n\n".join(f"[{part}]" for part in range(1, len(section_requests) + 1))
+
+
+@pytest.mark.parametrize('stop', ['failure', 'cancellation'])
+def test_incremental_summarizer_is_closed_when_condensing_stops(budget, monkeypatch, stop):
+    monkeypatch.setattr(summarize, 'MAP_CONCURRENCY', 1)
+    release = threading.Event()
+
+    def reply(prompt, text):
+        if _part_number(prompt) == 1 and stop == 'failure':
+            raise llm.LLMError("provider down")
+        release.wait(5)
+        return "summary"
+    client = _use(monkeypatch, FakeLLMClient(reply))
+    summarizer = summarize.IncrementalSummarizer()
+    _feed(summarizer)
+    cancel_event = threading.Event()
+    if stop == 'cancellation':
+        cancel_event.set()
+
+    try:
+        with pytest.raises(llm.LLMError if stop == 'failure' else CancelledError):
+            summarizer.condense(cancel_event)
+        # One request at a time: the one being answered finishes, every queued one is dropped
+        assert all(future.cancelled() for future in summarizer._futures[2:])
+        with pytest.raises(RuntimeError):
+            summarizer._executor.submit(lambda: None)
+    finally:
+        release.set()
+    assert len(client.requests) <= 2
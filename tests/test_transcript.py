@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+import soundfile as sf
+
+import transcript
+from audio import MODEL_SAMPLE_RATE, iter_audio_chunks
+
+
+def _chunk(start_s, end_s, words=None, text=None):
+    """A chunk result as transcribe produces it; `words` are (word, start_s, end_s) tuples."""
+    if text is None:
+        text = " ".join(word for word, _, _ in words or [])
+    return {'start_s': start_s, 'end_s': end_s, 'text': text,
+            'words': [list(word) for word in words] if words is not None else None}
+
+
+@pytest.mark.parametrize('results, expected', [
+    pytest.param([_chunk(0, 30, [('one', 1, 1.5), ('two', 2, 2.5)])], "one two", id='single_chunk'),
+    pytest.param([_chunk(0, 30, [('before', 27, 27.5), ('cut', 28.6, 29.2), ('hal', 29.6, 30)]),
+                  _chunk(28, 58, [('cut', 28.7, 29.2), ('half', 29.6, 30.2), ('after', 31, 31.5)])],
+                 "before cut half after", id='overlap_split_at_midpoint'),
+    pytest.param([_chunk(0, 30, [('one', 1, 1.5)]), _chunk(30, 60, [('two', 31, 31.5)])],
+                 "one two", id='adjacent_windows'),
+    pytest.param([_chunk(0, 30, [('one', 1, 1.5), ('end', 28.2, 28.6)]),
+                  _chunk(28, 58, []),
+                  _chunk(56, 86, [('two', 57.5, 58), ('three', 60, 60.5)])],
+                 "one end two three", id='empty_chunk'),
+    pytest.param([_chunk(0, 30, [('one', 1, 1.5)]),
+                  _chunk(28, 58, [('last', 57.1, 57.3), ('wor', 57.7, 58)]),
+                  _chunk(57, 58.5, [('world', 57.6, 58.2)])],
+                 "one last world", id='last_chunk_shorter_than_overlap'),
+])
+def test_merge_with_word_timestamps(results, expected):
+    assert transcript.merge_chunk_results(results) == expected
+
+
+@pytest.mark.parametrize('results, expected', [
+    pytest.param([_chunk(0, 30, text="the quick brown fox"), _chunk(28, 58, text="brown fox jumps over")],
+                 "the quick brown fox jumps over", id='repeated_prefix_dropped'),
+    pytest.param([_chunk(0, 30, text="the quick brown fox."), _chunk(28, 58, text="Fox jumps")],
+                 "the quick brown fox. jumps", id='case_and_punctuation_ignored'),
+    pytest.param([_chunk(0, 30, text="one two"), _chunk(30, 60, text="two three")],
+                 "one two two three", id='adjacent_windows_keep_repeats'),
+    pytest.param([_chunk(0, 30, text="one two"), _chunk(28, 58, text=""), _chunk(56, 86, text="two three")],
+                 "one two three", id='empty_chunk'),
+    pytest.param([_chunk(0, 30, text="say hello world"), _chunk(28, 58, text="world again"),
+                  _chunk(57, 58.5, text="again")],
+                 "say hello world again", id='last_chunk_shorter_than_overlap'),
+    pytest.param([_chunk(0, 30, [('one', 1, 1.5), ('two', 28.5, 29)]), _chunk(28, 58, text="two three")],
+                 "one two three", id='falls_back_when_a_chunk_has_no_timestamps'),
+])
+def test_merge_without_word_timestamps(results, expected):
+    assert transcript.merge_chunk_results(results) == expected
+
+
+def test_merge_of_no_chunks_is_empty():
+    assert transcript.merge_chunk_results([]) == ""
+
+
+def test_chunks_after_removed_silence_keep_source_time_offsets(tmp_path):
+    # 3 s of tone, 10 s of silence, 3 s of tone
+    tone = 0.3 * np.sin(2 * np.pi * 220 * np.arange(3 * MODEL_SAMPLE_RATE) / MODEL_SAMPLE_RATE)
+    samples = np.concatenate((tone, np.zeros(10 * MODEL_SAMPLE_RATE), tone)).astype(np.float32)
+    sf.write(str(tmp_path / 'gap.wav'), samples, MODEL_SAMPLE_RATE)
+    vad_info = {}
+    chunks = list(iter_audio_chunks(str(tmp_path / 'gap.wav'), chunk_duration_s=2, overlap_s=0.5,
+                                    vad_threshold_db=-45, vad_min_silence_s=1.0, vad_info=vad_info))
+    results = [_chunk(chunk.start_s, chunk.end_s, [('word', chunk.start_s + 0.1, chunk.start_s + 0.3)])
+               for chunk in chunks]
+
+    mapped = transcript.to_source_timeline(results, vad_info['offset_map'])
+
+    assert vad_info['skipped_s'] > 9
+    gap_end_s = vad_info['offset_map'][-1][0]
+    before, after = chunks[0], next(chunk for chunk in chunks if chunk.start_s > gap_end_s)
+    assert mapped[before.index]['start_s'] == before.start_s
+    assert mapped[after.index]['start_s'] == pytest.approx(after.start_s + vad_info['skipped_s'])
+    assert mapped[after.index]['words'][0][1:] == pytest.approx(
+        [after.start_s + 0.1 + vad_info['skipped_s'], after.start_s + 0.3 + vad_info['skipped_s']])
+    assert 13 <= mapped[after.index]['words'][0][1] < 16
+    assert mapped[-1]['end_s'] == pytest.approx(vad_info['total_s'])
+    # The results themselves stay as transcribed, as the checkpoint saved them
+    assert results[after.index]['start_s'] == after.start_s
@@ -0,0 +1,117 @@
+import os
+import threading
+import time
+from concurrent.futures import CancelledError
+
+import numpy as np
+import pytest
+import soundfile as sf
+
+import download
+import summyt
+
+
+class _FakeTranscribe:
+    """Stands in for the transcribe module: fails the first time, leaving a checkpoint next to the audio."""
+
+    def __init__(self):
+        self.calls = []
+
+    def transcribe_audio(self, audio_filepath, video_title, output_dir, stats, output_filepath=None,
+                         text_sink=None, cancel_event=None):
+        checkpoint_path = os.path.splitext(audio_filepath)[0] + '.chunks.jsonl'
+        self.calls.append((audio_filepath, os.path.exists(checkpoint_path)))
+        if len(self.calls) == 1:
+            with open(checkpoint_path, 'w', encoding='utf-8') as f:
+                f.write('{"header": true}\n')
+            return ""
+        return "the transcript"
+
+
+def _summarize_and_save(*args, **kwargs):
+    yield {'status': 'Summarizing text...', 'progress': 80}
+    return "the summary"
+
+
+@pytest.fixture
+def local_video(tmp_path, monkeypatch, cache_index):
+    """A local media file run through process_video with fake transcription and summarization."""
+    source = tmp_path / 'talk.wav'
+    sf.write(str(source), np.zeros(1600, dtype=np.float32), 16000)
+    monkeypatch.setattr(download, 'DOWNLOAD_DIR', str(tmp_path / 'input'))
+    monkeypatch.setattr(summyt, 'TRANSCRIBED_OUTPUT_DIR', str(tmp_path / 'output'))
+    monkeypatch.setattr(summyt, 'transcribe', _FakeTranscribe())
+    monkeypatch.setattr(summyt, 'summarize_and_save', _summarize_and_save)
+    monkeypatch.setattr(summyt, 'index_existing_outputs_once', lambda: None)
+    monkeypatch.setattr(summyt.summarize, 'incremental_summarizer', lambda use_cache=True: None)
+    return str(source)
+
+
+def test_failed_run_keeps_work_dir_and_next_run_resumes_from_it(local_video):
+    work_dir = download.work_dir(download.video_key(local_video, local=True))
+
+    with pytest.raises(Exception, match='empty text'):
+        list(summyt.process_video(local_video, save_md_summary=False, local=True))
+    assert os.path.isdir(work_dir)
+
+    updates = list(summyt.process_video(local_video, save_md_summary=False, local=True))
+
+    assert updates[-1]['summary'] == "the summary"
+    first_audio, _ = summyt.transcribe.calls[0]
+    second_audio, checkpoint_found = summyt.transcribe.calls[1]
+    assert first_audio == second_audio
+    assert os.path.dirname(first_audio) == work_dir
+    assert checkpoint_found
+    assert not os.path.exists(work_dir)
+    assert summyt._video_locks == {}
+
+
+def test_stale_work_dirs_are_removed_unless_in_use(tmp_path, monkeypatch):
+    monkeypatch.setattr(download, 'DOWNLOAD_DIR', str(tmp_path / 'input'))
+    stale, in_use, fresh = (download.work_dir(f"Youtube:{name}") for name in ('stale', 'in_use', 'fresh'))
+    unrelated = os.path.join(download.DOWNLOAD_DIR, 'my-media')
+    long_ago = time.time() - 10 * 86400
+    for path in (stale, in_use, fresh, unrelated):
+        os.makedirs(path)
+        open(os.path.join(path, 'audio_mono.wav'), 'w').close()
+        if path != fresh:
+            os.utime(os.path.join(path, 'audio_mono.wav'), (long_ago, long_ago))
+            os.utime(path, (long_ago, long_ago))
+
+    download.remove_stale_work_dirs(86400, keep=[in_use])
+
+    assert sorted(os.listdir(download.DOWNLOAD_DIR)) == sorted(
+        os.path.basename(path) for path in (in_use, fresh, unrelated))
+
+
+def test_video_lock_lets_one_run_at_a_time_through():
+    events = []
+    first = summyt.acquire_video_lock('Youtube:same')
+    assert list(first) == []  # Free: taken without waiting
+
+    def second_run():
+        for update in summyt.acquire_video_lock('Youtube:same'):
+            events.append(update['status'])
+        events.append('acquired')
+        summyt.release_video_lock('Youtube:same')
+
+    thread = threading.Thread(target=second_run)
+    thread.start()
+    time.sleep(0.2)
+    assert events == ['Waiting for another job that is transcribing this video...']
+    summyt.release_video_lock('Youtube:same')
+    thread.join(5)
+
+    assert events[-1] == 'acquired'
+    assert summyt._video_locks == {}
+
+
+def test_waiting_for_video_lock_can_be_cancelled():
+    list(summyt.acquire_video_lock('Youtube:busy'))
+    cancel_event = threading.Event()
+    cancel_event.set()
+
+    with pytest.raises(CancelledError):
+        list(summyt.acquire_video_lock('Youtube:busy', cancel_event))
+    summyt.release_video_lock('Youtube:busy')
+    assert summyt._video_locks == {}
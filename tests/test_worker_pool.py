@@ -0,0 +1,180 @@
+import contextlib
+import logging
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pytest
+
+import worker_pool
+from audio import AudioChunk
+
+
+class _FakeModelManager:
+    """Stands in for model_manager.manager: hands out a fake model per device and reports a load time."""
+
+    def __init__(self):
+        self.acquired = []
+        self.delay_s = 0.0
+
+    @contextlib.contextmanager
+    def acquire(self, device, stats=None):
+        self.acquired.append(device)
+        if stats is not None:
+            stats.update({'model_load_s': 1.5, 'warmup_s': 0.5})
+        yield f"model on {device}"
+
+
+@pytest.fixture
+def model(monkeypatch):
+    """Replaces the model manager and transcribe's batch inference, which need torch, with fakes."""
+    manager = _FakeModelManager()
+
+    def transcribe_in_batches(asr_model, chunks, device, batch_size, timestamps):
+        time.sleep(manager.delay_s)
+        return [{'text': f"chunk {chunk.index}", 'model': asr_model, 'words': [] if timestamps else None}
+                for chunk in chunks]
+
+    monkeypatch.setitem(sys.modules, 'model_manager', types.SimpleNamespace(manager=manager))
+    monkeypatch.setitem(sys.modules, 'transcribe', types.SimpleNamespace(_transcribe_in_batches=transcribe_in_batches))
+    return manager
+
+
+class _FakeWorker:
+    """A pool worker that can fail its batches, or stop answering health checks."""
+
+    def __init__(self, name):
+        self.name = name
+        self.device = name
+        self.healthy = True
+        self.busy = False
+        self.last_error = None
+        self.alive = True
+        self.fail_batches = False
+        self.batches = []
+
+    def transcribe_batch(self, chunks, timestamps):
+        if self.fail_batches:
+            raise RuntimeError(f"{self.name} failed")
+        self.batches.append([chunk.index for chunk in chunks])
+        time.sleep(0.01)
+        return [{'text': f"chunk {chunk.index}"} for chunk in chunks], {}
+
+    def ping(self):
+        if not self.alive:
+            raise ConnectionError(f"{self.name} is gone")
+        return {}
+
+    def is_alive(self):
+        return self.alive
+
+
+def _chunks(count):
+    return [AudioChunk(index, float(index), np.zeros(160, dtype=np.float32)) for index in range(count)]
+
+
+def _texts(results):
+    return [result['text'] for result in results]
+
+
+def _wait_until(condition, timeout_s=5):
+    deadline = time.monotonic() + timeout_s
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_local_device_worker_runs_batches_on_its_device(model):
+    worker = worker_pool.LocalDeviceWorker('cpu:1')
+
+    results, stats = worker.transcribe_batch(_chunks(3), True)
+
+    assert _texts(results) == ['chunk 0', 'chunk 1', 'chunk 2']
+    assert {result['model'] for result in results} == {'model on cpu:1'}
+    assert results[0]['words'] == []
+    assert stats == {'model_load_s': 1.5, 'warmup_s': 0.5}
+    assert worker.ping() == stats
+    assert model.acquired == ['cpu:1', 'cpu:1']
+
+
+def test_concurrent_jobs_share_the_queue_across_local_workers(model):
+    model.delay_s = 0.02
+    pool = worker_pool.WorkerPool([worker_pool.LocalDeviceWorker('cpu:0'), worker_pool.LocalDeviceWorker('cpu:1')],
+                                  health_check_interval_s=60)
+    results, stats = {}, {'a': {}, 'b': {}}
+
+    def transcribe(name):
+        results[name] = pool.transcribe(_chunks(12), batch_size=2, stats=stats[name])
+
+    threads = [threading.Thread(target=transcribe, args=(name,)) for name in 'ab']
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    for name in 'ab':
+        assert _texts(results[name]) == [f"chunk {index}" for index in range(12)]
+        assert stats[name]['model_load_s'] == 1.5
+    assert set(stats['a']['workers']) | set(stats['b']['workers']) == {'cpu:0', 'cpu:1'}
+    assert not pool._queue
+
+
+def test_failed_batch_moves_to_another_worker(model):
+    broken, working = _FakeWorker('broken'), _FakeWorker('working')
+    broken.fail_batches = True
+    pool = worker_pool.WorkerPool([broken, working], health_check_interval_s=60)
+    stats = {}
+
+    results = pool.transcribe(_chunks(6), batch_size=2, stats=stats)
+
+    assert _texts(results) == [f"chunk {index}" for index in range(6)]
+    assert stats['workers'] == ['working']
+    assert [status['healthy'] for status in pool.status()] == [False, True]
+    assert pool.status()[0]['last_error'] == "broken failed"
+
+
+def test_health_check_evicts_a_dead_worker_and_brings_it_back():
+    dead, live = _FakeWorker('dead'), _FakeWorker('live')
+    dead.alive = False
+    pool = worker_pool.WorkerPool([dead, live], health_check_interval_s=0.05)
+
+    assert _wait_until(lambda: not dead.healthy)
+    assert _texts(pool.transcribe(_chunks(4), batch_size=2)) == [f"chunk {index}" for index in range(4)]
+    assert dead.batches == [] and sorted(sum(live.batches, [])) == [0, 1, 2, 3]
+
+    dead.alive = True
+    assert _wait_until(lambda: dead.healthy)
+    assert dead.last_error is None
+
+
+def test_job_fails_once_no_worker_is_left():
+    only = _FakeWorker('only')
+    only.fail_batches = True
+    pool = worker_pool.WorkerPool([only], health_check_interval_s=60)
+
+    with pytest.raises(RuntimeError, match='only failed'):
+        pool.transcribe(_chunks(4), batch_size=2)
+    assert not pool._queue
+
+
+def test_remote_worker_is_refused_without_authkey():
+    with pytest.raises(ValueError, match='asr-worker-authkey'):
+        worker_pool.RemoteWorker('10.0.0.2:6001', authkey=b'')
+    assert worker_pool.RemoteWorker('10.0.0.2:6001', authkey=b'secret').address == ('10.0.0.2', 6001)
+
+
+def test_pool_ignores_remote_workers_without_authkey(monkeypatch, caplog):
+    monkeypatch.setattr(worker_pool, 'ASR_DEVICES', 'cpu:0')
+    monkeypatch.setattr(worker_pool, 'REMOTE_WORKERS', ['10.0.0.2:6001'])
+    monkeypatch.setattr(worker_pool, 'AUTHKEY', b'')
+    monkeypatch.setattr(worker_pool, '_pool', None)
+    monkeypatch.setattr(worker_pool, '_pool_checked', False)
+
+    with caplog.at_level(logging.ERROR):
+        # A single local device is left, which transcribe.py uses directly
+        assert worker_pool.get_pool() is None
+    assert "Ignoring asr-remote-workers" in caplog.text
+    with pytest.raises(ValueError, match='asr-worker-authkey'):
+        worker_pool.serve('cpu', '127.0.0.1', 0)